@@ -11,7 +11,10 @@ class Prototype(Model):
 
     def clone(self, **attrs):
         obj = deepcopy(self)
-        obj.__dict__.update(attrs)
+
+        for name, value in attrs.items():
+            setattr(obj, name, value)
+
         return obj
 
 
@@ -1,4 +1,13 @@
-from reobject.models.manager import Manager
-from reobject.models import Model, Field
-from reobject.query.queryset import QuerySet, EmptyQuerySet
-from reobject.transaction import transactional, Transaction
+import sys
+
+# The asyncio API of the QuerySets and change streams can't even be parsed
+# by older interpreters
+if sys.version_info < (3, 8):
+    raise ImportError('reobject requires Python 3.8 or later')
+
+from reobject.models.manager import Manager  # noqa: E402
+from reobject.models import Model, Field  # noqa: E402
+from reobject.query.queryset import QuerySet, EmptyQuerySet  # noqa: E402
+from reobject.transaction import (  # noqa: E402
+    atomic, transactional, Transaction
+)
@@ -0,0 +1,563 @@
+"""
+Columnar mirror of the numeric, boolean and datetime fields of a model.
+
+Each field declared with Field(column=True) is mirrored in a NumPy array,
+holding the value of every object of the store at its store position. Lookups
+on these fields are then evaluated for all objects at once, as boolean masks.
+
+Masks are three-valued: alongside the objects known to match, every leaf
+yields the objects it can't decide upon, e.g. those holding a value which
+doesn't fit in the column. These are left for the Python comparator.
+
+NumPy is an optional dependency. Without it, column fields are looked up like
+any other field.
+
+Masks, aggregates and sorts over large stores can be handed over to an
+executor evaluating them in parallel, see reobject.models.parallel.
+"""
+import operator
+from datetime import datetime
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # type: ignore
+
+# Vectorized comparison of each range verb
+_RANGE_VERBS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+_INT64_RANGE = (-2 ** 63, 2 ** 63)
+
+# Integers above this can't be stored in a float column without rounding
+_FLOAT_INT_MAX = 2 ** 53
+
+
+class _Unsupported(Exception):
+    pass
+
+
+class Column(object):
+    """
+    Array of the values of a field, along with masks telling apart the rows
+    holding a value stored in the array, and those holding None.
+
+    The kind of the column is inferred from the first value it's given.
+    """
+    def __init__(self, field: str, capacity: int = 0):
+        self.field = field
+        self.kind = None  # 'bool', 'int', 'float' or 'datetime'
+        self.data = None
+        self.valid = numpy.zeros(capacity, dtype=bool)
+        self.null = numpy.zeros(capacity, dtype=bool)
+
+    @staticmethod
+    def _infer(value):
+        if isinstance(value, bool):
+            return 'bool', bool
+        elif isinstance(value, int):
+            return 'int', numpy.int64
+        elif isinstance(value, float):
+            return 'float', numpy.float64
+        elif isinstance(value, datetime) and value.tzinfo is None:
+            return 'datetime', 'datetime64[us]'
+
+        return None, None
+
+    def convert(self, value):
+        """
+        Returns value as stored in the column, or raises _Unsupported.
+        """
+        kind = self.kind
+
+        if kind == 'bool' and isinstance(value, bool):
+            return value
+
+        elif kind == 'int' and isinstance(value, int) \
+                and _INT64_RANGE[0] <= value < _INT64_RANGE[1]:
+            return value
+
+        elif kind == 'float' and (
+            isinstance(value, float) or
+            isinstance(value, int) and abs(value) <= _FLOAT_INT_MAX
+        ):
+            return value
+
+        elif kind == 'datetime' and isinstance(value, datetime) \
+                and value.tzinfo is None:
+            return numpy.datetime64(value, 'us')
+
+        raise _Unsupported
+
+    def constant(self, value):
+        """
+        Returns value as compared against the column, or raises _Unsupported
+        if it can't be compared the way Python would.
+        """
+        if self.kind == 'int':
+            # Compared as int64 rather than float64, which would round the
+            # values of the column beyond _FLOAT_INT_MAX
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+
+            if isinstance(value, int) and \
+                    _INT64_RANGE[0] <= value < _INT64_RANGE[1]:
+                return value
+
+        elif self.kind in ('bool', 'float'):
+            if isinstance(value, float) or isinstance(value, int) and \
+                    abs(value) <= _FLOAT_INT_MAX:
+                return value
+
+        elif self.kind == 'datetime':
+            if isinstance(value, datetime) and value.tzinfo is None:
+                return numpy.datetime64(value, 'us')
+
+        raise _Unsupported
+
+    def resize(self, capacity: int) -> None:
+        self.valid = _resized(self.valid, capacity)
+        self.null = _resized(self.null, capacity)
+
+        if self.data is not None:
+            self.data = _resized(self.data, capacity)
+
+    def take(self, rows) -> None:
+        self.valid = self.valid[rows]
+        self.null = self.null[rows]
+
+        if self.data is not None:
+            self.data = self.data[rows]
+
+    def set(self, row: int, value) -> None:
+        self.valid[row] = self.null[row] = False
+
+        if value is None:
+            self.null[row] = True
+            return
+
+        if self.kind is None:
+            self.kind, dtype = self._infer(value)
+
+            if self.kind is None:
+                return
+
+            self.data = numpy.zeros(len(self.valid), dtype=dtype)
+
+        try:
+            self.data[row] = self.convert(value)
+        except _Unsupported:
+            return
+
+        self.valid[row] = True
+
+
+def _resized(array, capacity: int):
+    new = numpy.zeros(capacity, dtype=array.dtype)
+    new[:len(array)] = array[:capacity]
+    return new
+
+
+class ColumnMirror(object):
+    """
+    Columns of the fields of a model, kept row-aligned with the positions of
+    the objects in its Store, placeholders of removed objects included.
+
+    The version of the mirror is incremented on every change to its rows.
+    Once it holds executor.min_rows rows, lookups, aggregates and sorts are
+    handed over to executor, if set.
+    """
+    def __init__(self, fields):
+        self.columns = {field: Column(field) for field in fields}
+        self.live = numpy.zeros(0, dtype=bool)
+        self._size = 0
+        self.version = 0
+        self.executor = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.columns
+
+    def _grow(self, size: int = 0) -> None:
+        capacity = max(16, 2 * len(self.live), size)
+        self.live = _resized(self.live, capacity)
+
+        for column in self.columns.values():
+            column.resize(capacity)
+
+    def _delegated(self) -> bool:
+        return self.executor is not None and \
+            self._size >= self.executor.min_rows
+
+    def append(self, obj) -> None:
+        self.version += 1
+
+        if self._size == len(self.live):
+            self._grow()
+
+        row = self._size
+        self._size += 1
+        self.live[row] = True
+
+        for field, column in self.columns.items():
+            column.set(row, getattr(obj, field, None))
+
+    def extend(self, objs: list) -> None:
+        self.version += 1
+        size = self._size + len(objs)
+
+        if size > len(self.live):
+            self._grow(size)
+
+        rows = range(self._size, size)
+        self._size = size
+        self.live[rows.start:size] = True
+
+        for field, column in self.columns.items():
+            for row, obj in zip(rows, objs):
+                column.set(row, getattr(obj, field, None))
+
+    def restore(self, objs: list, arrays: dict) -> None:
+        """
+        Fills the empty mirror with the rows of objs, taking the columns
+        given in arrays, as (kind, data, valid, null) arrays, as they are
+        rather than building them out of the objects. Rows neither valid nor
+        null are set from the objects, as are columns not given.
+        """
+        self.version += 1
+        self._size = len(objs)
+        self.live = numpy.ones(self._size, dtype=bool)
+
+        for field, column in self.columns.items():
+            if field not in arrays:
+                column.resize(self._size)
+
+                for row, obj in enumerate(objs):
+                    column.set(row, getattr(obj, field, None))
+
+                continue
+
+            column.kind, column.data, column.valid, column.null = \
+                arrays[field]
+
+            for position in numpy.flatnonzero(~(column.valid | column.null)):
+                column.set(int(position), getattr(objs[position], field, None))
+
+    def remove(self, row: int) -> None:
+        self.version += 1
+        self.live[row] = False
+
+    def set(self, row: int, field: str, value) -> None:
+        self.version += 1
+        self.columns[field].set(row, value)
+
+    def compact(self) -> None:
+        """
+        Drops the rows of removed objects, in step with Store._compact().
+        """
+        self.version += 1
+        rows = numpy.flatnonzero(self.live[:self._size])
+        self._size = len(rows)
+        self.live = numpy.ones(self._size, dtype=bool)
+
+        for column in self.columns.values():
+            column.take(rows)
+
+    def narrows(self, q) -> bool:
+        """
+        Whether evaluating q as a mask may rule out objects ahead of the
+        Python comparator.
+        """
+        if q.is_leaf:
+            return self._leaf_supported(q)
+        elif q.negated:
+            return self.decides(q.children[0])
+        elif q.connector == q.AND:
+            return any(map(self.narrows, q.children))
+        elif q.connector == q.OR:
+            return bool(q.children) and all(map(self.narrows, q.children))
+
+        return False
+
+    def decides(self, q) -> bool:
+        """
+        Whether evaluating q as a mask may find objects known to match it.
+        """
+        if q.is_leaf:
+            return self._leaf_supported(q)
+        elif q.negated:
+            return self.narrows(q.children[0])
+        elif not q.children:
+            # Empty Q, matching every object
+            return True
+        elif q.connector == q.AND:
+            return all(map(self.decides, q.children))
+        elif q.connector == q.OR:
+            return any(map(self.decides, q.children))
+
+        return False
+
+    def _leaf_supported(self, q) -> bool:
+        column = self.columns.get(q.attr)
+
+        if column is None or column.kind is None:
+            return False
+
+        try:
+            self._constants(column, q.verb, q.value)
+        except _Unsupported:
+            return False
+
+        return True
+
+    @staticmethod
+    def _constants(column: Column, verb, value):
+        if verb == 'isnone':
+            if value is True or value is False:
+                return value
+
+        elif verb in (None, 'exact'):
+            return None if value is None else column.constant(value)
+
+        elif verb == 'in':
+            if isinstance(value, (str, bytes)):
+                raise _Unsupported
+
+            try:
+                values = list(value)
+            except TypeError:
+                raise _Unsupported
+
+            return [
+                column.constant(v) for v in values if v is not None
+            ], None in values
+
+        elif verb in _RANGE_VERBS and value is not None:
+            return column.constant(value)
+
+        raise _Unsupported
+
+    def evaluate(self, q):
+        """
+        Returns the masks of the rows known to match q, and of those which
+        may match it, i.e. including the rows which q can't decide upon.
+        """
+        size = self._size
+        live = self.live[:size]
+
+        if q.is_leaf:
+            masks = self._leaf(q, size)
+
+            if masks is None:
+                return numpy.zeros(size, dtype=bool), live.copy()
+
+            true, maybe = masks
+            return true & live, maybe & live
+
+        elif q.negated:
+            true, maybe = self.evaluate(q.children[0])
+            return live & ~maybe, live & ~true
+
+        elif not q.children:
+            return live.copy(), live.copy()
+
+        combine = operator.and_ if q.connector == q.AND else operator.or_
+        true, maybe = self.evaluate(q.children[0])
+
+        for child in q.children[1:]:
+            child_true, child_maybe = self.evaluate(child)
+            true = combine(true, child_true)
+            maybe = combine(maybe, child_maybe)
+
+        return true, maybe
+
+    def select(self, q):
+        """
+        Returns the positions of the rows which may match q, in ascending
+        order, along with whether each of them is known to match it.
+        """
+        if self._delegated():
+            positions, known = self.executor.select(self, q)
+        else:
+            positions, known = self.selected(q)
+
+        return positions.tolist(), known.tolist()
+
+    def selected(self, q):
+        """
+        Returns the NumPy arrays of the positions select() returns, and of
+        whether each is known to match q.
+        """
+        true, maybe = self.evaluate(q)
+        positions = numpy.flatnonzero(maybe)
+
+        return positions, true[positions]
+
+    def sortable(self, field: str, descending: bool = False) -> bool:
+        """
+        Whether rows may be sorted by the column of field as Python would,
+        sorting by -value if descending.
+        """
+        column = self.columns.get(field)
+
+        return column is not None and column.data is not None and (
+            column.kind in ('bool', 'int', 'float') or not descending
+        )
+
+    def order(self, positions: list, field: str, descending: bool = False):
+        """
+        Returns positions stably sorted by the values of field, or None if
+        some of the rows don't hold a value in the column, in which case
+        sorting them would take the Python comparisons.
+        """
+        if not self.sortable(field, descending):
+            return None
+
+        if self._delegated():
+            return self.executor.order(self, positions, field, descending)
+
+        return self.ordered(numpy.array(positions, dtype=numpy.int64),
+                            field, descending)
+
+    def ordered(self, positions, field: str, descending: bool = False):
+        """
+        Returns the NumPy array of positions order() returns, or None.
+        """
+        column = self.columns[field]
+
+        if not column.valid[positions].all():
+            return None
+
+        keys = column.data[positions]
+
+        if column.kind == 'float' and numpy.isnan(keys).any():
+            # NaN doesn't sort consistently
+            return None
+
+        if descending:
+            if column.kind == 'bool':
+                keys = keys.astype(numpy.int64)
+            elif column.kind == 'int' and len(keys) and \
+                    keys.min() == _INT64_RANGE[0]:
+                # Can't be negated without overflowing
+                return None
+
+            # Sorted by -value, as order_by('-field') does
+            keys = -keys
+
+        return positions[numpy.argsort(keys, kind='stable')]
+
+    def aggregate(self, q, aggregates):
+        """
+        Returns the result of each aggregate over the rows matching q, or of
+        every row if q is None. Returns None if it can't be told from the
+        columns alone.
+        """
+        if self._delegated():
+            return self.executor.aggregate(self, q, aggregates)
+
+        values = self.aggregated(q, aggregates)
+
+        if values is None:
+            return None
+
+        try:
+            return [
+                aggregate.from_array(array, kind)
+                for aggregate, (array, kind) in zip(aggregates, values)
+            ]
+        except TypeError:
+            return None
+
+    def aggregated(self, q, aggregates):
+        """
+        Returns the NumPy array of the values each aggregate is computed over,
+        along with the kind of its column, or None if some of them aren't in
+        the columns.
+        """
+        if q is None:
+            selected = self.live[:self._size]
+        else:
+            selected, maybe = self.evaluate(q)
+
+            if (maybe & ~selected).any():
+                return None
+
+        values = []
+
+        for aggregate in aggregates:
+            column = self.columns.get(aggregate.field)
+
+            if column is None:
+                if aggregate.field in ('*', 'id', 'pk') \
+                        and not getattr(aggregate, 'distinct', False):
+                    # Counting objects, as the pk is never None
+                    values.append((numpy.flatnonzero(selected), 'int'))
+                    continue
+
+                return None
+
+            size = len(selected)
+            valid, null = column.valid[:size], column.null[:size]
+
+            if (selected & ~(valid | null)).any() or column.data is None:
+                # Some values don't fit in the column
+                return None
+
+            values.append(
+                (column.data[:size][selected & valid], column.kind)
+            )
+
+        return values
+
+    def _leaf(self, q, size: int):
+        column = self.columns.get(q.attr)
+
+        if column is None or column.data is None:
+            return None
+
+        try:
+            const = self._constants(column, q.verb, q.value)
+        except _Unsupported:
+            return None
+
+        data = column.data[:size]
+        valid = column.valid[:size]
+        null = column.null[:size]
+        # Rows holding a value which doesn't fit in the column
+        other = ~(valid | null)
+
+        if q.verb == 'isnone':
+            true = null if const else ~null
+            return true, true
+
+        elif q.verb in (None, 'exact'):
+            if const is None:
+                return null, null | other
+
+            true = valid & (data == const)
+
+        elif q.verb == 'in':
+            values, has_none = const
+
+            if values:
+                true = valid & numpy.isin(data, numpy.array(values))
+            else:
+                true = numpy.zeros(size, dtype=bool)
+
+            if has_none:
+                true = true | null
+
+        else:
+            # Comparing None raises a TypeError, which is left for the
+            # comparator to raise.
+            true = valid & _RANGE_VERBS[q.verb](data, const)
+            return true, true | ~valid
+
+        return true, true | other
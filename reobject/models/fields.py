@@ -1,10 +1,22 @@
 import attr
 
+from reobject.models.index import index_kinds
 
-def Field(*args, default=attr.NOTHING, **kwargs):
+
+def Field(*args, default=attr.NOTHING, index=False, column=False, **kwargs):
     if callable(default):
         default = attr.Factory(default)
 
+    if index or column:
+        metadata = dict(kwargs.pop('metadata', None) or {})
+
+        if index:
+            metadata['index'] = index_kinds(index)
+        if column:
+            metadata['column'] = True
+
+        kwargs['metadata'] = metadata
+
     return attr.ib(*args, default=default, **kwargs)
 
 
@@ -0,0 +1,704 @@
+from bisect import bisect_left
+from collections.abc import Iterable
+from itertools import count
+from operator import itemgetter
+
+import attr
+
+# Key under which an object is filed while the indexed attribute is not set
+# yet, e.g. between Model.__new__ and the attrs generated __init__.
+_MISSING = object()
+
+# Tie-breaker sorting after every other one, used to bound a run of equal keys
+_LAST = float('inf')
+
+# Lookups comparing values by order, which raise on None
+_RANGE_VERBS = frozenset(('gt', 'gte', 'lt', 'lte'))
+
+# Placeholder left in the slot of a removed object by a TimeIndex
+_VACANT = object()
+
+# Stamps set by the manager on every object, kept in a TimeIndex
+TIMESTAMP_FIELDS = ('created', 'updated')
+
+
+class Index(object):
+    """
+    Base class of the indexes a Store maintains on a field of its objects.
+
+    Subclasses file each object under the key derived from its field value
+    in _keys, and implement add(), remove() and lookup().
+    """
+    def __init__(self, field):
+        self.field = field
+        self._keys = {}  # pk -> key the object is filed under
+
+    def __contains__(self, obj) -> bool:
+        return id(obj) in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, obj) -> None:
+        raise NotImplementedError
+
+    def add_many(self, objs) -> None:
+        for obj in objs:
+            self.add(obj)
+
+    def remove(self, obj) -> None:
+        raise NotImplementedError
+
+    def remove_many(self, objs) -> None:
+        for obj in objs:
+            self.remove(obj)
+
+    def update(self, obj) -> None:
+        if obj in self:
+            self.remove(obj)
+            self.add(obj)
+
+    def lookup(self, verb, value):
+        """
+        Returns a {pk: obj} mapping of the objects that may match the lookup,
+        or None if the lookup can't be answered by this index.
+        """
+        raise NotImplementedError
+
+    def estimate(self, verb, value):
+        """
+        Returns the number of objects lookup() would return, without looking
+        them up, or None if the lookup can't be answered by this index.
+        """
+        raise NotImplementedError
+
+    @property
+    def distinct(self) -> int:
+        """
+        Number of distinct keys the objects are filed under.
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.field)
+
+
+class HashIndex(Index):
+    """
+    Index mapping each value of a field to the objects holding it. Answers
+    plain equality, `exact` and `in` lookups without scanning the store.
+    """
+    def __init__(self, field):
+        super(HashIndex, self).__init__(field)
+        self._buckets = {}  # key -> {pk: obj}
+        self._unhashable = {}  # pk -> obj, for values that can't be hashed
+
+    def add(self, obj) -> None:
+        pk = id(obj)
+        key = getattr(obj, self.field, _MISSING)
+        self._keys[pk] = key
+
+        if key is _MISSING:
+            return
+
+        try:
+            self._buckets.setdefault(key, {})[pk] = obj
+        except TypeError:
+            self._unhashable[pk] = obj
+
+    def remove(self, obj) -> None:
+        pk = id(obj)
+        key = self._keys.pop(pk)
+
+        if self._unhashable.pop(pk, None) is not None or key is _MISSING:
+            return
+
+        bucket = self._buckets[key]
+        del bucket[pk]
+
+        if not bucket:
+            del self._buckets[key]
+
+    @staticmethod
+    def _lookup_keys(verb, value):
+        if verb in (None, 'exact'):
+            return (value,)
+        elif verb == 'in' and isinstance(value, Iterable) \
+                and not isinstance(value, str):
+            return tuple(value)
+
+        return None
+
+    def lookup(self, verb, value):
+        keys = self._lookup_keys(verb, value)
+
+        if keys is None:
+            return None
+
+        # Objects holding unhashable values can't be ruled out here, they
+        # are left for the comparator to decide upon.
+        result = dict(self._unhashable)
+
+        try:
+            for key in keys:
+                result.update(self._buckets.get(key, ()))
+        except TypeError:
+            return None
+
+        return result
+
+    def estimate(self, verb, value):
+        keys = self._lookup_keys(verb, value)
+
+        if keys is None:
+            return None
+
+        try:
+            return len(self._unhashable) + sum(
+                len(self._buckets.get(key, ())) for key in keys
+            )
+        except TypeError:
+            return None
+
+    @property
+    def distinct(self) -> int:
+        return len(self._buckets) + len(self._unhashable)
+
+
+class ForeignKeyIndex(HashIndex):
+    """
+    Index mapping the pk of each related object of a ForeignKey to the
+    objects referencing it. Answers `exact` and `in` lookups on the pk of
+    the related object, as in filter(author__pk=author.pk), which back the
+    related managers.
+
+    Related objects compare by value, so lookups on the related object
+    itself are left for the comparator.
+    """
+    def add(self, obj) -> None:
+        pk = id(obj)
+        related = getattr(obj, self.field, _MISSING)
+
+        if related is _MISSING:
+            self._keys[pk] = _MISSING
+            return
+
+        key = None if related is None else id(related)
+        self._keys[pk] = key
+        self._buckets.setdefault(key, {})[pk] = obj
+
+    def related(self, pk) -> dict:
+        """
+        Returns a {pk: obj} mapping of the objects referencing the related
+        object identified by pk.
+        """
+        return self._buckets.get(pk, {})
+
+    def groups(self):
+        """
+        Yields each related object, along with the {pk: obj} mapping of the
+        objects referencing it.
+        """
+        field = self.field
+
+        for bucket in self._buckets.values():
+            yield getattr(next(iter(bucket.values())), field), bucket
+
+
+class SortedIndex(Index):
+    """
+    Index keeping the objects sorted by the value of a field. Answers `gt`,
+    `gte`, `lt`, `lte` and `exact` lookups by bisection, and streams the
+    objects in field order for order_by(), earliest() and latest().
+
+    Objects holding equal values are kept in the order they were added in,
+    which matches the order a stable sort of the store would yield.
+    """
+    verbs = {
+        'gt': lambda v: ((v, _LAST), None),
+        'gte': lambda v: ((v,), None),
+        'lt': lambda v: (None, (v,)),
+        'lte': lambda v: (None, (v, _LAST)),
+        'exact': lambda v: ((v,), (v, _LAST)),
+        None: lambda v: ((v,), (v, _LAST)),
+    }
+
+    def __init__(self, field):
+        super(SortedIndex, self).__init__(field)
+        self._sorted = []  # (key, tie-breaker) pairs, in ascending order
+        self._objs = []  # objects, in the same order as _sorted
+        self._none = {}  # pk -> obj, for objects holding None
+        self._unordered = {}  # pk -> obj, for values that can't be compared
+        self._counter = count()
+
+    @property
+    def comparable(self) -> bool:
+        """
+        Whether every value besides None is comparable with the others.
+        """
+        return not self._unordered
+
+    @property
+    def orderable(self) -> bool:
+        """
+        Whether every indexed object holds a value comparable with the others.
+        """
+        return self.comparable and not self._none
+
+    def add(self, obj, tiebreaker=None) -> None:
+        pk = id(obj)
+        key = getattr(obj, self.field, _MISSING)
+
+        if tiebreaker is None:
+            tiebreaker = next(self._counter)
+
+        self._keys[pk] = (key, tiebreaker)
+
+        if key is _MISSING:
+            return
+        elif key is None:
+            self._none[pk] = obj
+            return
+
+        self._insert((key, tiebreaker), obj)
+
+    def _insert(self, entry: tuple, obj) -> None:
+        try:
+            position = bisect_left(self._sorted, entry)
+        except TypeError:
+            self._unordered[id(obj)] = obj
+        else:
+            self._sorted.insert(position, entry)
+            self._objs.insert(position, obj)
+
+    def add_many(self, objs) -> None:
+        # Inserting many objects one at a time would shift the sorted lists
+        # each time, sort them and merge them in a single pass instead.
+        entries = []
+
+        for obj in objs:
+            pk = id(obj)
+            entry = (getattr(obj, self.field, _MISSING), next(self._counter))
+            self._keys[pk] = entry
+
+            if entry[0] is None:
+                self._none[pk] = obj
+            elif entry[0] is not _MISSING:
+                entries.append((entry, obj))
+
+        try:
+            entries.sort(key=itemgetter(0))
+
+            if not self._sorted or not entries \
+                    or self._sorted[-1] < entries[0][0]:
+                merged = entries
+            else:
+                merged = sorted(
+                    list(zip(self._sorted, self._objs)) + entries,
+                    key=itemgetter(0)
+                )
+                self._sorted, self._objs = [], []
+        except TypeError:
+            # Some values can't be compared, insert them one at a time
+            for entry, obj in entries:
+                self._insert(entry, obj)
+        else:
+            self._sorted.extend(map(itemgetter(0), merged))
+            self._objs.extend(map(itemgetter(1), merged))
+
+    def remove(self, obj) -> None:
+        pk = id(obj)
+        entry = self._keys.pop(pk)
+
+        if entry[0] is _MISSING \
+                or self._none.pop(pk, None) is not None \
+                or self._unordered.pop(pk, None) is not None:
+            return
+
+        position = bisect_left(self._sorted, entry)
+        del self._sorted[position]
+        del self._objs[position]
+
+    def remove_many(self, objs) -> None:
+        objs = list(objs)
+
+        if len(objs) < len(self._sorted) // 64:
+            return super(SortedIndex, self).remove_many(objs)
+
+        # Removing many objects one at a time would shift the sorted lists
+        # each time, rebuild them in a single pass instead.
+        removed = set()
+
+        for obj in objs:
+            pk = id(obj)
+            self._keys.pop(pk)
+            removed.add(pk)
+            self._none.pop(pk, None)
+            self._unordered.pop(pk, None)
+
+        kept = [
+            i for i, obj in enumerate(self._objs) if id(obj) not in removed
+        ]
+        self._sorted = [self._sorted[i] for i in kept]
+        self._objs = [self._objs[i] for i in kept]
+
+    def update(self, obj) -> None:
+        entry = self._keys.get(id(obj))
+
+        if entry is not None:
+            # Keep the tie-breaker, so that the object doesn't move past
+            # others holding the same value.
+            self.remove(obj)
+            self.add(obj, tiebreaker=entry[1])
+
+    def _range(self, lower, upper) -> slice:
+        lo = 0 if lower is None else bisect_left(self._sorted, lower)
+        hi = len(self._sorted) if upper is None else \
+            bisect_left(self._sorted, upper)
+
+        return slice(lo, max(lo, hi))
+
+    def _lookup_range(self, verb, value):
+        if verb not in self.verbs or value is None:
+            return None
+
+        try:
+            return self._range(*self.verbs[verb](value))
+        except TypeError:
+            return None
+
+    def lookup(self, verb, value):
+        span = self._lookup_range(verb, value)
+
+        if span is None:
+            return None
+
+        objs = self._objs[span]
+
+        # Objects holding values which can't be compared are left for the
+        # comparator to decide upon, and so are those holding None for range
+        # lookups, which raise as they would when scanning every object.
+        result = dict(self._unordered)
+
+        if verb in _RANGE_VERBS:
+            result.update(self._none)
+
+        result.update((id(obj), obj) for obj in objs)
+
+        return result
+
+    def estimate(self, verb, value):
+        span = self._lookup_range(verb, value)
+
+        if span is None:
+            return None
+
+        none = len(self._none) if verb in _RANGE_VERBS else 0
+        return span.stop - span.start + len(self._unordered) + none
+
+    @property
+    def distinct(self) -> int:
+        keys = self._sorted
+        runs = sum(
+            1 for i in range(len(keys)) if not i or keys[i - 1][0] != keys[i][0]
+        )
+
+        return runs + len(self._none) + len(self._unordered)
+
+    def ascending(self) -> Iterable:
+        return iter(self._objs)
+
+    def descending(self) -> Iterable:
+        keys, objs = self._sorted, self._objs
+        end = len(keys)
+
+        for i in range(end - 1, -1, -1):
+            if i == 0 or keys[i - 1][0] != keys[i][0]:
+                # Runs of equal values stay in insertion order
+                yield from objs[i:end]
+                end = i
+
+    def first(self):
+        return self._objs[0] if self._objs else None
+
+    def last(self):
+        return self._objs[-1] if self._objs else None
+
+
+class TimeIndex(SortedIndex):
+    """
+    SortedIndex on a timestamp which grows along with the order objects are
+    added or updated in, such as the created and updated stamps set by the
+    manager.
+
+    Such keys sort last, so that they are appended in O(1) rather than
+    inserted. Removed objects leave a placeholder behind instead of shifting
+    the sorted lists, until placeholders make up half of them. Updating an
+    object moves it to the end of the run of objects holding its new value.
+    """
+    def __init__(self, field):
+        super(TimeIndex, self).__init__(field)
+        self._vacant = 0
+
+    def add(self, obj, tiebreaker=None) -> None:
+        key = getattr(obj, self.field, _MISSING)
+
+        if key is not _MISSING and key is not None and tiebreaker is None:
+            entry = (key, next(self._counter))
+
+            try:
+                sorts_last = not self._sorted or self._sorted[-1] < entry
+            except TypeError:
+                sorts_last = False
+
+            if sorts_last:
+                self._keys[id(obj)] = entry
+                self._sorted.append(entry)
+                self._objs.append(obj)
+                return
+
+            tiebreaker = entry[1]
+
+        super(TimeIndex, self).add(obj, tiebreaker)
+
+    def _vacate(self, obj) -> None:
+        pk = id(obj)
+        entry = self._keys.pop(pk)
+
+        if entry[0] is _MISSING \
+                or self._none.pop(pk, None) is not None \
+                or self._unordered.pop(pk, None) is not None:
+            return
+
+        self._objs[bisect_left(self._sorted, entry)] = _VACANT
+        self._vacant += 1
+
+    def _compact(self) -> None:
+        if 2 * self._vacant < len(self._objs):
+            return
+
+        kept = [i for i, obj in enumerate(self._objs) if obj is not _VACANT]
+        self._sorted = [self._sorted[i] for i in kept]
+        self._objs = [self._objs[i] for i in kept]
+        self._vacant = 0
+
+    def remove(self, obj) -> None:
+        self._vacate(obj)
+        self._compact()
+
+    def remove_many(self, objs) -> None:
+        for obj in objs:
+            self._vacate(obj)
+
+        self._compact()
+
+    def update(self, obj) -> None:
+        if id(obj) in self._keys:
+            self._vacate(obj)
+            self.add(obj)
+            self._compact()
+
+    def lookup(self, verb, value):
+        result = super(TimeIndex, self).lookup(verb, value)
+
+        if result is not None:
+            result.pop(id(_VACANT), None)
+
+        return result
+
+    @property
+    def distinct(self) -> int:
+        keys = self._sorted
+        objs = self._objs
+        runs, previous = 0, _MISSING
+
+        for i in range(len(keys)):
+            if objs[i] is not _VACANT and keys[i][0] != previous:
+                runs += 1
+                previous = keys[i][0]
+
+        return runs + len(self._none) + len(self._unordered)
+
+    def ascending(self) -> Iterable:
+        return (obj for obj in self._objs if obj is not _VACANT)
+
+    def descending(self) -> Iterable:
+        descending = super(TimeIndex, self).descending()
+        return (obj for obj in descending if obj is not _VACANT)
+
+    def first(self):
+        return next(self.ascending(), None)
+
+    def last(self):
+        return next(
+            (obj for obj in reversed(self._objs) if obj is not _VACANT), None
+        )
+
+
+class InvertedIndex(Index):
+    """
+    Index mapping each element of a tuple or frozenset valued field to the
+    objects whose collection holds it. Answers `contains` lookups, as well as
+    `icontains` lookups on collections of strings.
+
+    Lists, sets and other values, which may be changed in place without the
+    field being assigned, aren't filed, and are left to the comparator, as
+    are collections holding unhashable elements.
+    """
+    collections = (tuple, frozenset)
+
+    def __init__(self, field):
+        super(InvertedIndex, self).__init__(field)
+        self._postings = {}  # element -> {pk: obj}
+        self._ipostings = {}  # casefolded element -> {pk: obj}
+        self._opaque = {}  # pk -> obj, for values that aren't filed
+        self._iopaque = {}  # pk -> obj, for collections of non-strings
+
+    @staticmethod
+    def _file(postings: dict, keys, pk, obj) -> None:
+        for key in keys:
+            postings.setdefault(key, {})[pk] = obj
+
+    @staticmethod
+    def _unfile(postings: dict, keys, pk) -> None:
+        for key in keys:
+            bucket = postings[key]
+            del bucket[pk]
+
+            if not bucket:
+                del postings[key]
+
+    def add(self, obj) -> None:
+        pk = id(obj)
+        value = getattr(obj, self.field, _MISSING)
+        elements = ()  # type: tuple
+
+        if value is not _MISSING:
+            try:
+                if not isinstance(value, self.collections):
+                    raise TypeError
+
+                elements = tuple(dict.fromkeys(value))
+            except TypeError:
+                # Not an immutable collection, or holding unhashable elements
+                self._opaque[pk] = obj
+            else:
+                self._file(self._postings, elements, pk, obj)
+
+                if all(isinstance(e, str) for e in elements):
+                    self._file(
+                        self._ipostings,
+                        set(e.casefold() for e in elements), pk, obj
+                    )
+                else:
+                    self._iopaque[pk] = obj
+
+        self._keys[pk] = elements
+
+    def remove(self, obj) -> None:
+        pk = id(obj)
+        elements = self._keys.pop(pk)
+
+        if self._opaque.pop(pk, None) is not None:
+            return
+
+        self._unfile(self._postings, elements, pk)
+
+        if self._iopaque.pop(pk, None) is None:
+            self._unfile(
+                self._ipostings, set(e.casefold() for e in elements), pk
+            )
+
+    def _lookup_postings(self, verb, value):
+        """
+        Returns the postings answering the lookup, the key to look up in them
+        and the objects the index couldn't file, which are left for the
+        comparator to decide upon.
+        """
+        if verb == 'contains':
+            return self._postings, value, (self._opaque,)
+        elif verb == 'icontains' and isinstance(value, str):
+            return self._ipostings, value.casefold(), \
+                (self._opaque, self._iopaque)
+
+        return None
+
+    def lookup(self, verb, value):
+        found = self._lookup_postings(verb, value)
+
+        if found is None:
+            return None
+
+        postings, key, unfiled = found
+        result = {}
+
+        for objects in unfiled:
+            result.update(objects)
+
+        try:
+            result.update(postings.get(key, ()))
+        except TypeError:
+            return None
+
+        return result
+
+    def estimate(self, verb, value):
+        found = self._lookup_postings(verb, value)
+
+        if found is None:
+            return None
+
+        postings, key, unfiled = found
+
+        try:
+            return len(postings.get(key, ())) + sum(map(len, unfiled))
+        except TypeError:
+            return None
+
+    @property
+    def distinct(self) -> int:
+        return len(self._postings) + len(self._opaque)
+
+
+INDEX_TYPES = {
+    'hash': HashIndex,
+    'sorted': SortedIndex,
+    'inverted': InvertedIndex,
+}
+
+
+def index_kinds(index) -> tuple:
+    """
+    Normalizes the index option of a Field into a tuple of index kinds.
+    """
+    if index is True:
+        kinds = ('hash',)
+    elif isinstance(index, str):
+        kinds = (index,)
+    else:
+        kinds = tuple(index)
+
+    for kind in kinds:
+        if kind not in INDEX_TYPES:
+            raise ValueError(
+                'Unknown index type: {}. Expected one of {}'.format(
+                    kind, ', '.join(sorted(INDEX_TYPES))
+                )
+            )
+
+    return kinds
+
+
+def build_indexes(model) -> list:
+    """
+    Returns fresh index instances for every indexed field of a model class,
+    for its foreign keys, and for the created and updated stamps.
+    """
+    return [
+        INDEX_TYPES[kind](field.name)
+        for field in attr.fields(model)
+        for kind in field.metadata.get('index', ())
+    ] + [
+        ForeignKeyIndex(field.name)
+        for field in attr.fields(model) if field.metadata.get('related')
+    ] + [TimeIndex(field) for field in TIMESTAMP_FIELDS]
@@ -0,0 +1,136 @@
+"""
+Reader/writer lock guarding the store of models declared with threadsafe=True.
+"""
+import threading
+
+
+class _Guard(object):
+    """
+    Context manager calling acquire on entering, and release on exiting.
+    """
+    __slots__ = ('acquire', 'release')
+
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class _Unlocked(object):
+    """
+    Context manager standing for the lock of stores which aren't guarded.
+    """
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+UNLOCKED = _Unlocked()
+
+
+class ReadWriteLock(object):
+    """
+    Lock shared by any number of readers, or held by a single writer.
+
+    Readers wait while a writer is waiting for the lock, so that a steady
+    stream of them can't starve writers. The lock is reentrant on both sides,
+    and the thread holding it for writing may read as well. Acquiring it for
+    writing while reading would deadlock, and raises RuntimeError instead.
+
+    Use the read and write context managers:
+
+        with lock.read:
+            ...
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0  # threads holding the lock for reading
+        self._writer = None  # ident of the thread holding it for writing
+        self._writes = 0  # times the writer acquired it
+        self._waiting = 0  # writers waiting for the lock
+        self._blocked = 0  # readers waiting for the lock
+        self._local = threading.local()  # .reads, times acquired for reading
+
+        self.read = _Guard(self.acquire_read, self.release_read)
+        self.write = _Guard(self.acquire_write, self.release_write)
+
+    def acquire_read(self) -> None:
+        local = self._local
+        reads = getattr(local, 'reads', 0)
+
+        if reads or self._writer == threading.get_ident():
+            local.reads = reads + 1
+            return
+
+        with self._condition:
+            while self._writer is not None or self._waiting:
+                self._blocked += 1
+
+                try:
+                    self._condition.wait()
+                finally:
+                    self._blocked -= 1
+
+            self._readers += 1
+
+        local.reads = 1
+        local.shared = True
+
+    def release_read(self) -> None:
+        local = self._local
+        local.reads -= 1
+
+        if local.reads or not getattr(local, 'shared', False):
+            return
+
+        local.shared = False
+
+        with self._condition:
+            self._readers -= 1
+
+            if not self._readers and self._waiting:
+                self._condition.notify_all()
+
+    def acquire_write(self) -> None:
+        ident = threading.get_ident()
+
+        if self._writer == ident:
+            self._writes += 1
+            return
+
+        if getattr(self._local, 'reads', 0):
+            raise RuntimeError('Cannot acquire the lock for writing while reading')
+
+        with self._condition:
+            self._waiting += 1
+
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting -= 1
+
+            self._writer = ident
+            self._writes = 1
+
+    def release_write(self) -> None:
+        if self._writer != threading.get_ident():
+            raise RuntimeError('Cannot release a lock not held for writing')
+
+        self._writes -= 1
+
+        if self._writes:
+            return
+
+        with self._condition:
+            self._writer = None
+
+            if self._waiting or self._blocked:
+                self._condition.notify_all()
@@ -1,6 +1,10 @@
+import weakref
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Dict
 
 from reobject.models.store import ModelStoreMapping
+from reobject.models.stream import ChangeStream
 from reobject.query import QuerySet, EmptyQuerySet
 
 
@@ -26,34 +30,65 @@ class ManagerDescriptor(object):
 class RelatedManagerDescriptor(object):
     """
     Descriptor class to deny access to RelatedManager methods via model class.
+
+    The RelatedManager of each model instance is created on first access,
+    and cached until the instance is garbage collected.
     """
-    def __init__(self, model):
+    def __init__(self, model, field):
         self.model = model
+        self.field = field
+        self.managers = {}  # pk of the instance -> RelatedManager
 
-    def __get__(self, instance, owner)-> 'Manager':
+    def __get__(self, instance, owner) -> 'RelatedManager':
         if instance is None:
             raise AttributeError(
                 "RelatedManager isn't accessible via %s class" % owner.__name__
             )
-        else:
-            # RelatedManagerDescriptor is acting like a factory to dynamically
-            # create a new RelatedManager class on every owner access via
-            # the model instance.
 
-            # [TODO] - Try to cache this manager object per unique model
-            # instance.
+        manager = self.managers.get(instance.pk)
+
+        if manager is None or manager.instance is not instance:
+            manager = RelatedManager(
+                model=self.model, instance=instance, field=self.field
+            )
+            self.managers[instance.pk] = manager
+            weakref.finalize(instance, self.managers.pop, instance.pk, None)
+
+        return manager
+
+    def prefetch(self, instances) -> None:
+        """
+        Looks up the related objects of all instances at once, and caches
+        them in the RelatedManager of each instance until the store of the
+        related model changes.
+        """
+        store = self.model.objects.store
+        (index,) = store.indexes_on(self.field + '__pk')
+        # pk of each instance -> its related objects
+        related = {
+            instance.pk: [] for instance in instances
+        }  # type: Dict[int, list]
+
+        with store.reading():
+            if 4 * sum(map(len, map(index.related, related))) < len(store):
+                # Few related objects, put back into store order
+                for pk, objects in related.items():
+                    objects.extend(store.ordered(index.related(pk)))
+            else:
+                # Hash join of the store objects with the instances
+                field = self.field
 
-            class RelatedManager(Manager):
-                def get_queryset(related_manager_self):
-                    cls_name = type(instance).__name__.lower()
+                for obj in store:
+                    bucket = related.get(id(getattr(obj, field, None)))
 
-                    return super(
-                        RelatedManager, related_manager_self
-                    ).get_queryset().filter(
-                        **{'{}__pk'.format(cls_name): instance.pk}
-                    )
+                    if bucket is not None:
+                        bucket.append(obj)
 
-            return RelatedManager(model=self.model)
+            version = store.version
+
+        for instance in instances:
+            manager = self.__get__(instance, type(instance))
+            manager._prefetched = (version, related[instance.pk])
 
 
 class Manager(object):
@@ -71,8 +106,8 @@ class Manager(object):
 
     def get_queryset(self) -> QuerySet:
         return QuerySet(
-            self.store,
-            model=self.model
+            model=self.model,
+            store=self.store
         )
 
     def add(self, instance: 'Model') -> 'Model':
@@ -88,15 +123,136 @@ class Manager(object):
         self.store.append(instance)
         return instance
 
+    def bulk_create(self, records) -> list:
+        """
+        Creates a model instance out of each record, a dict of keyword
+        arguments or a tuple of positional ones, and returns them.
+
+        Instances share the same created/updated stamp, and are added to the
+        store at once, updating each index in a single batch.
+        """
+        model = self.model
+        new = object.__new__
+        stamp = object.__setattr__
+        now = datetime.utcnow()
+        instances = []
+
+        for record in records:
+            instance = new(model)
+
+            if isinstance(record, dict):
+                instance.__init__(**record)
+            else:
+                instance.__init__(*record)
+
+            stamp(instance, 'created', now)
+            stamp(instance, 'updated', now)
+            instances.append(instance)
+
+        self.store.extend(instances)
+        return instances
+
+    def from_records(self, rows, fields) -> list:
+        """
+        Creates a model instance out of each row of values of fields, e.g.
+        as read from a CSV file, and returns them.
+
+        Same as bulk_create().
+        """
+        fields = tuple(fields)
+        return self.bulk_create(dict(zip(fields, row)) for row in rows)
+
+    def set_executor(self, executor) -> None:
+        """
+        Hands over the lookups, aggregates and sorts on the column fields of
+        the model to executor, e.g. a ParallelExecutor, or evaluates them in
+        this process again if None.
+        """
+        columns = self.store.columns
+
+        if columns is None:
+            raise ValueError(
+                '{} has no column fields, or NumPy is not installed'.format(
+                    self.model.__name__
+                )
+            )
+
+        columns.executor = executor
+
+    def set_cache(self, cache) -> None:
+        """
+        Serves the results of the QuerySets of the model from cache, a
+        QueryCache which may be shared with other models, as long as the
+        objects they were drawn from haven't changed since. None turns
+        caching off again.
+        """
+        self.store.cache = cache
+
+    @contextmanager
+    def untracked(self):
+        """
+        Context manager turning off change tracking of the model instances,
+        e.g. for bulk loads. Assignments still keep the indexes up to date,
+        but don't stamp updated, mark fields dirty or notify listeners.
+        """
+        store = self.store
+        tracking, store.tracking = store.tracking, False
+
+        try:
+            yield
+        finally:
+            store.tracking = tracking
+
     def _delete(self, obj):
         self.store.remove(obj)
 
+    def _delete_many(self, objs) -> int:
+        return self.store.remove_many(objs)
+
+    def aggregate(self, *args, **kwargs) -> dict:
+        """
+        Returns a dictionary of the aggregates computed over all model
+        instances.
+
+        Proxy to the QuerySet.aggregate() method.
+        """
+        return self.all().aggregate(*args, **kwargs)
+
+    async def aaggregate(self, *args, **kwargs) -> dict:
+        """
+        Proxy to the QuerySet.aaggregate() method.
+        """
+        return await self.all().aaggregate(*args, **kwargs)
+
+    async def acount(self) -> int:
+        """
+        Proxy to the QuerySet.acount() method.
+        """
+        return await self.all().acount()
+
+    async def aget(self, **kwargs):
+        """
+        Proxy to the QuerySet.aget() method.
+        """
+        return await self.all().aget(**kwargs)
+
     def all(self) -> QuerySet:
         """
         Returns a QuerySet of all model instances.
         """
         return self.get_queryset()
 
+    def changes(self, *events: str, maxsize: int = 0) -> ChangeStream:
+        """
+        Returns an asynchronous stream of the model instances added, removed
+        or changed from now on, or only of the given events out of 'add',
+        'remove' and 'change'. Up to maxsize changes are queued until
+        consumed, or any number of them by default.
+
+        Changes are only streamed while the store tracks them.
+        """
+        return ChangeStream(self.store, events, maxsize)
+
     def count(self) -> int:
         """
         Returns an integer representing the total number of model instances.
@@ -162,12 +318,38 @@ class Manager(object):
         """
         return EmptyQuerySet(model=self.model)
 
+    def prefetch_related(self, *lookups) -> QuerySet:
+        """
+        Returns a QuerySet of all model instances, looking up the related
+        objects of the given related managers for all of them at once.
+
+        Proxy to the QuerySet.prefetch_related() method.
+        """
+        return self.all().prefetch_related(*lookups)
+
+    def order_by(self, *fields) -> QuerySet:
+        """
+        Returns a QuerySet of all model instances, ordered by fields.
+
+        Proxy to the QuerySet.order_by() method.
+        """
+        return self.all().order_by(*fields)
+
     def random(self) -> 'Model':
         """
         Returns a random model instance.
         """
         return self.all().random()
 
+    def select_related(self, *fields) -> QuerySet:
+        """
+        Returns a QuerySet of all model instances, resolving lookups through
+        the given ForeignKey fields once per related object.
+
+        Proxy to the QuerySet.select_related() method.
+        """
+        return self.all().select_related(*fields)
+
     def map(self, func) -> object:
         """
         Returns a random model instance.
@@ -178,3 +360,39 @@ class Manager(object):
         return '<{manager}: {model}>'.format(
             manager=type(self).__name__, model=self.model.__name__
         )
+
+
+class RelatedManager(Manager):
+    """
+    Manager of the objects of a model referencing an instance through one
+    of their ForeignKey fields.
+
+    Objects are looked up in the ForeignKeyIndex of the field, which costs
+    O(number of related objects) rather than a scan of the model store, or
+    served from the results of QuerySet.prefetch_related().
+    """
+    def __init__(self, model, instance, field):
+        super(RelatedManager, self).__init__(model=model)
+        self._instance = weakref.ref(instance)
+        self.field = field
+        # (store version, related objects) set by prefetch_related()
+        self._prefetched = None
+
+    @property
+    def instance(self):
+        return self._instance()
+
+    def get_queryset(self) -> QuerySet:
+        queryset = super(RelatedManager, self).get_queryset().filter(
+            **{'{}__pk'.format(self.field): self.instance.pk}
+        )
+
+        if self._prefetched is not None:
+            version, objects = self._prefetched
+
+            if version == self.store.version:
+                queryset._fill(objects)
+            else:
+                self._prefetched = None
+
+        return queryset
@@ -1,46 +1,214 @@
+from copy import deepcopy
+from datetime import datetime
+
 import attr
 
+from reobject.models.index import TIMESTAMP_FIELDS, build_indexes
 from reobject.models.manager import ManagerDescriptor, RelatedManagerDescriptor
-from reobject.models.store import Store, ModelStoreMapping
+from reobject.models.store import ModelStoreMapping, Store, SynchronizedStore
+
+_MISSING = object()
+
+
+def _tracked_setattr(store, fields: frozenset):
+    """
+    Returns the __setattr__ of a model, reindexing every attribute assigned,
+    reporting it to the undo logs of the store, and stamping updated on the
+    objects whose fields are assigned while the store tracks changes.
+    """
+    setattr_ = object.__setattr__
+    utcnow = datetime.utcnow
+
+    def __setattr__(self, name, value):
+        if store.journal is not None:
+            store.journal.check()
+
+        old = getattr(self, name, _MISSING)
+        setattr_(self, name, value)
+
+        for log in store.undo_logs:
+            log(self, name, old)
+
+        if name not in fields:
+            store.reindex(self, name)
+            return
+
+        if store.changed(self, name, old):
+            setattr_(self, 'updated', utcnow())
+            store.reindex(self, 'updated')
+
+    if isinstance(store, SynchronizedStore):
+        tracked_setattr, lock = __setattr__, store.lock.write
+
+        def __setattr__(self, name, value):
+            if id(self) not in store._positions:
+                # Not shared yet, e.g. while being initialized
+                return tracked_setattr(self, name, value)
+
+            # Readers never see the field out of step with the indexes
+            with lock:
+                tracked_setattr(self, name, value)
+
+    return __setattr__
+
+
+def _state(obj) -> dict:
+    """
+    Returns the attributes of a model object other than its stamps, fields
+    included.
+    """
+    state = dict(getattr(obj, '__dict__', ()))
+
+    for field in attr.fields(type(obj)):
+        value = getattr(obj, field.name, _MISSING)
+
+        if value is not _MISSING:
+            state[field.name] = value
+
+    for name in TIMESTAMP_FIELDS:
+        state.pop(name, None)
+
+    return state
+
+
+def _new(model):
+    """
+    Returns an instance of model with no state, not added to its store yet.
+    """
+    return object.__new__(model)
+
+
+def _add(obj, state: dict) -> None:
+    """
+    Fills in the state of an instance returned by _new(), and adds it to its
+    store, indexed as of that state.
+    """
+    for name, value in state.items():
+        object.__setattr__(obj, name, value)
+
+    type(obj).objects.add(obj)
 
 
 class ModelBase(type):
     """
     Metaclass for all models, used to attach the objects class attribute
-    to the model instance at runtime.
+    to the model instance at runtime, and the related manager of each of its
+    ForeignKey fields to the related model.
+
+    Models declared with slots=True, as in class Point(Model, slots=True),
+    store their fields in __slots__ rather than in a per-instance __dict__.
+    Models declared with threadsafe=True have a SynchronizedStore, shared by
+    several threads.
+
+    Instances are added to the model store once initialized. Assignments to
+    their fields go through a __setattr__ generated for the model, which
+    reports them to the store.
     """
 
-    def __new__(cls, name, bases, attrs):
+    def __new__(cls, name, bases, attrs, slots=False, threadsafe=False):
+        if '__attrs_attrs__' in attrs:
+            # Slotted class rebuilt by attrs out of the model class, along
+            # with slots for the stamps set by the manager.
+            attrs['__slots__'] = tuple(attrs['__slots__']) + tuple(
+                name for name in TIMESTAMP_FIELDS
+                if not any(hasattr(base, name) for base in bases)
+            )
+            # Unpickled objects are added to the store by Model.__setstate__
+            attrs.pop('__getstate__', None)
+            attrs.pop('__setstate__', None)
+
+            return super(ModelBase, cls).__new__(cls, name, bases, attrs)
+
         attrs['objects'] = ManagerDescriptor()
 
         mod = attr.s(
-            super(ModelBase, cls).__new__(cls, name, bases, attrs)
+            super(ModelBase, cls).__new__(cls, name, bases, attrs),
+            slots=slots
         )
 
         if 'Model' in [base.__name__ for base in bases]:
-            ModelStoreMapping[mod.__name__] = Store()
+            store_class = SynchronizedStore if threadsafe else Store
+            store = ModelStoreMapping[mod.__name__] = store_class(
+                indexes=build_indexes(mod),
+                columns=[
+                    field.name for field in attr.fields(mod)
+                    if field.metadata.get('column')
+                ]
+            )
+            store.model = mod
+
+            for field in attr.fields(mod):
+                if field.metadata.get('related'):
+                    target = field.metadata['related']['target']
+                    setattr(
+                        target,
+                        mod.__name__.lower() + '_set',
+                        RelatedManagerDescriptor(model=mod, field=field.name)
+                    )
+
+            if '__setattr__' not in attrs:
+                mod.__setattr__ = _tracked_setattr(
+                    store, frozenset(field.name for field in attr.fields(mod))
+                )
 
         return mod
 
+    def __init__(cls, name, bases, attrs, slots=False, threadsafe=False):
+        super(ModelBase, cls).__init__(name, bases, attrs)
+
+    def __call__(cls, *args, **kwargs):
+        if cls.__new__ is not Model.__new__:
+            # Left to the __new__ of the model, e.g. to reuse instances
+            return super(ModelBase, cls).__call__(*args, **kwargs)
+
+        instance = object.__new__(cls)
+        instance.__init__(*args, **kwargs)
+        return cls.objects.add(instance)
+
 
 class Model(object, metaclass=ModelBase):
+    # Left to the models, so that slotted ones have no __dict__
+    __slots__ = ()
+
+    # Set for each model by ModelBase, declared here for type checkers
+    objects = ManagerDescriptor()
+
     def __attrs_post_init__(self):
         pass
 
     def __new__(cls, *args, **kwargs):
+        # Instances created without calling the model, e.g. by a model
+        # overriding __new__, are added to the store right away.
         instance = super(Model, cls).__new__(cls)
+        return cls.objects.add(instance)
 
-        for field in attr.fields(cls):
-            if field.metadata.get('related'):
-                target = field.metadata['related']['target']
+    # Copies and unpickled objects are only added to the store once their
+    # state is filled in, so that they're indexed as of that state.
 
-                setattr(
-                    target,
-                    cls.__name__.lower() + '_set',
-                    RelatedManagerDescriptor(model=cls)
-                )
+    def __copy__(self):
+        clone = _new(type(self))
+        _add(clone, _state(self))
+        return clone
 
-        return cls.objects.add(instance)
+    def __deepcopy__(self, memo):
+        clone = memo[id(self)] = _new(type(self))
+        _add(clone, deepcopy(_state(self), memo))
+        return clone
+
+    def __reduce_ex__(self, protocol):
+        return _new, (type(self),), _state(self)
+
+    def __setstate__(self, state: dict) -> None:
+        _add(self, state)
+
+    def __setattr__(self, name, value):
+        store = type(self).objects.store
+
+        if store.journal is not None:
+            store.journal.check()
+
+        super(Model, self).__setattr__(name, value)
+        store.reindex(self, name)
 
     @property
     def id(self) -> int:
@@ -61,6 +229,19 @@ class Model(object, metaclass=ModelBase):
     def delete(self) -> None:
         type(self).objects._delete(self)
 
+    @property
+    def dirty_fields(self) -> frozenset:
+        """
+        Returns the names of the fields assigned since the object was created
+        or last marked clean.
+        """
+        return frozenset(type(self).objects.store.dirty.get(id(self), ()))
+
+    def mark_clean(self) -> None:
+        type(self).objects.store.clean(self)
+
     @property
     def _attrs(self):
-        return set(self.__dict__.keys()) | {'id'}
+        return {field.name for field in attr.fields(type(self))} \
+            | set(getattr(self, '__dict__', ())) \
+            | {'id', 'created', 'updated'}
@@ -0,0 +1,314 @@
+"""
+Parallel evaluation of lookups, aggregates and sorts over the columns of
+large stores.
+
+The columns of a store are exported to blocks of shared memory, once per
+version of its ColumnMirror, so that the processes of a pool read them
+without the objects or the arrays being pickled. The rows are partitioned
+among the processes, each of which evaluates the masks, partial aggregates
+or sorted runs of its partition. These are then combined in store order,
+the sorted runs by a stable sort of their concatenation in the calling
+process, which merges the runs rather than sorting them from scratch.
+
+Only what the columns can answer is evaluated in parallel: lookups on other
+fields are still evaluated by the comparator, on the candidates the masks
+couldn't rule out, in the calling process.
+
+Requires NumPy, along with multiprocessing.shared_memory (Python 3.8).
+"""
+import multiprocessing
+import os
+import weakref
+from typing import Any, Dict, Optional as Maybe
+
+from reobject.models.columns import Column, ColumnMirror, numpy
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:  # pragma: no cover
+    SharedMemory = None  # type: ignore
+
+# Number of rows from which a store is evaluated in parallel by default
+MIN_ROWS = 1000000
+
+# Blocks of shared memory attached to by a worker process, by name
+_attached = {}  # type: Dict[str, SharedMemory]
+
+
+def _export(array):
+    """
+    Copies array to a new block of shared memory, and returns the block
+    along with the spec of the array, as passed to _view().
+    """
+    block = SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = numpy.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared[:] = array
+    return block, (block.name, array.dtype.str, len(array))
+
+
+def _view(spec, start: int, stop: int):
+    """
+    Returns rows start to stop of an array exported to shared memory.
+    """
+    if spec is None:
+        return None
+
+    name, dtype, size = spec
+    block = _attached.get(name)
+
+    if block is None:
+        block = _attached[name] = SharedMemory(name=name)
+
+    array = numpy.ndarray((size,), dtype=dtype, buffer=block.buf)
+    return array[start:stop]
+
+
+def _partition(spec: dict, start: int, stop: int) -> ColumnMirror:
+    """
+    Returns a ColumnMirror of rows start to stop of exported columns.
+    """
+    names = {spec['live'][0]}
+    names.update(
+        array[0] for _, arrays in spec['columns'].items()
+        for array in arrays[1:] if array is not None
+    )
+
+    # Blocks of earlier versions of the columns are no longer needed
+    for name in set(_attached) - names:
+        _attached.pop(name).close()
+
+    mirror = ColumnMirror(())
+    mirror.live = _view(spec['live'], start, stop)
+    mirror._size = stop - start
+
+    for field, (kind, data, valid, null) in spec['columns'].items():
+        column = mirror.columns[field] = Column(field)
+        column.kind = kind
+        column.data = _view(data, start, stop)
+        column.valid = _view(valid, start, stop)
+        column.null = _view(null, start, stop)
+
+    return mirror
+
+
+def _select(spec: dict, start: int, stop: int, q):
+    positions, known = _partition(spec, start, stop).selected(q)
+    return positions + start, known
+
+
+def _aggregate(spec: dict, start: int, stop: int, q, aggregates):
+    values = _partition(spec, start, stop).aggregated(q, aggregates)
+
+    if values is None:
+        return None
+
+    try:
+        return [
+            aggregate.partial(array, kind)
+            for aggregate, (array, kind) in zip(aggregates, values)
+        ]
+    except TypeError:
+        return None
+
+
+def _order(spec: dict, positions, field: str, descending: bool):
+    mirror = _partition(spec, 0, spec['size'])
+    ordered = mirror.ordered(positions, field, descending)
+
+    if ordered is None:
+        return None
+
+    return ordered, mirror.columns[field].data[ordered]
+
+
+def _free(blocks: list) -> None:
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def _forget(state: dict, key: int) -> None:
+    """
+    Frees the columns exported of a ColumnMirror garbage collected.
+    """
+    export = state['exports'].pop(key, None)
+
+    if export is not None:
+        _free(export[1])
+
+
+def _release(state: dict) -> None:
+    if state['pool'] is not None:
+        state['pool'].terminate()
+        state['pool'] = None
+
+    for export in state['exports'].values():
+        _free(export[1])
+
+    state['exports'].clear()
+
+
+class ParallelExecutor(object):
+    """
+    Evaluates the lookups, aggregates and sorts on the columns of stores
+    holding at least min_rows rows over a pool of processes, all of them
+    unless given.
+
+    Set the executor of a model with Manager.set_executor(). The pool is
+    started on first use, and stopped by close(), or once the executor is
+    garbage collected.
+    """
+    def __init__(self, processes: Maybe[int] = None,
+                 min_rows: int = MIN_ROWS):
+        if numpy is None or SharedMemory is None:
+            raise RuntimeError(
+                'ParallelExecutor requires NumPy and '
+                'multiprocessing.shared_memory'
+            )
+
+        self.processes = processes or os.cpu_count() or 1
+        self.min_rows = min_rows
+        # Pool, and (version, blocks, spec) of the columns exported, by id
+        # of their mirror
+        self._state = {'pool': None, 'exports': {}}  # type: Dict[str, Any]
+        weakref.finalize(self, _release, self._state)
+
+    def close(self) -> None:
+        """
+        Stops the pool, and frees the columns exported to shared memory.
+        """
+        _release(self._state)
+
+    def __enter__(self) -> 'ParallelExecutor':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def _pool(self):
+        if self._state['pool'] is None:
+            self._state['pool'] = multiprocessing.Pool(self.processes)
+
+        return self._state['pool']
+
+    def _spec(self, mirror: ColumnMirror) -> dict:
+        """
+        Returns the spec of the columns of mirror exported to shared memory,
+        exporting them again if they changed since.
+        """
+        exports = self._state['exports']
+        export = exports.get(id(mirror))
+
+        if export is not None and export[0] == mirror.version:
+            return export[2]
+
+        if export is not None:
+            _free(export[1])
+        else:
+            weakref.finalize(mirror, _forget, self._state, id(mirror))
+
+        size = len(mirror)
+        blocks = []
+
+        def shared(array):
+            if array is None:
+                return None
+
+            block, spec = _export(array[:size])
+            blocks.append(block)
+            return spec
+
+        spec = {
+            'size': size,
+            'live': shared(mirror.live),
+            'columns': {
+                field: (
+                    column.kind, shared(column.data),
+                    shared(column.valid), shared(column.null),
+                )
+                for field, column in mirror.columns.items()
+            },
+        }
+
+        exports[id(mirror)] = (mirror.version, blocks, spec)
+        return spec
+
+    def _partitions(self, size: int) -> list:
+        """
+        Returns the (start, stop) bounds of a partition of size rows per
+        process.
+        """
+        step = -(-size // self.processes) or 1
+        return [
+            (start, min(start + step, size)) for start in range(0, size, step)
+        ]
+
+    def select(self, mirror: ColumnMirror, q):
+        """
+        Returns the NumPy arrays of the positions of the rows which may match
+        q, in ascending order, and of whether each is known to match it.
+        """
+        spec = self._spec(mirror)
+        results = self._pool.starmap(_select, [
+            (spec, start, stop, q)
+            for start, stop in self._partitions(spec['size'])
+        ])
+
+        if not results:
+            return numpy.zeros(0, dtype=numpy.int64), \
+                numpy.zeros(0, dtype=bool)
+
+        positions, known = zip(*results)
+        return numpy.concatenate(positions), numpy.concatenate(known)
+
+    def aggregate(self, mirror: ColumnMirror, q, aggregates):
+        """
+        Returns the result of each aggregate over the rows matching q, or of
+        every row if q is None, or None if it can't be told from the columns
+        alone.
+        """
+        spec = self._spec(mirror)
+        partials = self._pool.starmap(_aggregate, [
+            (spec, start, stop, q, aggregates)
+            for start, stop in self._partitions(spec['size'])
+        ])
+
+        if not partials or None in partials:
+            return None
+
+        return [
+            aggregate.merge([partial[i] for partial in partials])
+            for i, aggregate in enumerate(aggregates)
+        ]
+
+    def order(self, mirror: ColumnMirror, positions, field: str,
+              descending: bool = False):
+        """
+        Returns positions stably sorted by the values of field, or None if
+        some of the rows don't hold a value in the column.
+        """
+        spec = self._spec(mirror)
+        positions = numpy.array(positions, dtype=numpy.int64)
+        runs = self._pool.starmap(_order, [
+            (spec, positions[start:stop], field, descending)
+            for start, stop in self._partitions(len(positions))
+        ])
+
+        if not runs:
+            return positions
+
+        if None in runs:
+            return None
+
+        # The runs are concatenated and sorted again. NumPy's stable sort of
+        # 64-bit keys is a timsort, which finds the runs already sorted and
+        # merges them, in about a sixth of the time of a sort from scratch,
+        # and faster than merging them pairwise with searchsorted(). Being
+        # stable, it keeps the rows sorting equal in store order.
+        positions, keys = map(numpy.concatenate, zip(*runs))
+
+        if descending:
+            keys = -keys.astype(numpy.int64) if keys.dtype == bool else -keys
+
+        return positions[numpy.argsort(keys, kind='stable')]
@@ -1,5 +1,612 @@
+from functools import partial
+from operator import is_not
+from typing import Any, Optional as Maybe
+
+from reobject.models.columns import ColumnMirror, numpy
+from reobject.models.index import ForeignKeyIndex, Index, SortedIndex
+from reobject.models.lock import UNLOCKED, ReadWriteLock
+
 ModelStoreMapping = dict()
 
+# Placeholder left in the slot of a removed object, until the store is
+# compacted.
+_REMOVED = object()
+
+
+class PrimaryKeyIndex(Index):
+    """
+    Index answering plain equality, `exact` and `in` lookups on the pk of the
+    objects, straight from the store positions.
+    """
+    def __init__(self, store: 'Store'):
+        super(PrimaryKeyIndex, self).__init__('pk')
+        self._store = store
+
+    def __contains__(self, obj) -> bool:
+        return obj in self._store
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    @staticmethod
+    def _lookup_pks(verb, value):
+        if verb in (None, 'exact'):
+            return (value,)
+        elif verb == 'in' and not isinstance(value, str):
+            try:
+                return tuple(value)
+            except TypeError:
+                pass
+
+        return None
+
+    def lookup(self, verb, value):
+        pks = self._lookup_pks(verb, value)
+
+        if pks is None:
+            return None
+
+        result = {}
+
+        try:
+            for pk in pks:
+                obj = self._store.get(pk)
+
+                if obj is not None:
+                    result[pk] = obj
+        except TypeError:
+            return None
+
+        return result
+
+    def estimate(self, verb, value):
+        result = self.lookup(verb, value)
+        return None if result is None else len(result)
+
+    @property
+    def distinct(self) -> int:
+        return len(self._store)
+
+
+class Store(object):
+    """
+    Insertion-ordered collection of all tracked instances of a model, keyed
+    by pk, along with the indexes built on its fields.
+
+    Objects are kept in a list so that the insertion order is preserved, and
+    a pk -> position mapping makes adding, removing and membership tests
+    O(1). Removed objects leave a placeholder behind, which are dropped once
+    they make up half of the list.
+
+    Fields listed in columns are mirrored in NumPy arrays, if NumPy is
+    installed.
+
+    Within begin() and commit(), objects added or removed are set aside in a
+    batch, which commit() applies at once, or discard() drops. Batches nest,
+    committing an inner one merges it into the outer one.
+
+    The version of the store is incremented on every change to its objects,
+    so that results derived from them can tell whether they're stale.
+
+    While tracking is on, the store records the fields assigned to each of its
+    objects in dirty, and notifies its listeners of every object added,
+    removed or changed, as listener(event, obj, field, old) calls with event
+    one of 'add', 'remove' or 'change'. field and old, the value the field
+    held before, are only given for changes.
+
+    While a journal is set, such as the WriteAheadLog of reobject.wal, it's
+    told of every object added to or removed from any store, and of every
+    attribute assigned to their objects, tracked or not. Its check() is
+    called before each change is made, and raises to refuse it.
+    """
+    # Told of every change to the objects of the stores, see reobject.wal
+    journal = None  # type: Any
+
+    def __init__(self, indexes=(), columns=()):
+        self.indexes = {}  # field name -> [index, ...]
+        for index in indexes:
+            self.indexes.setdefault(index.field, []).append(index)
+
+        self.columns = None  # type: Maybe[ColumnMirror]
+        if columns and numpy is not None:
+            self.columns = ColumnMirror(columns)
+
+        self.model = None  # set by ModelBase
+        self.cache = None  # QueryCache set by Manager.set_cache()
+        self._objects = []
+        self._positions = {}  # pk -> position in _objects
+        self._pk_index = PrimaryKeyIndex(self)
+        self.version = 0
+
+        self.tracking = True
+        self.dirty = {}  # pk -> names of the fields assigned since cleaned
+        self._listeners = []
+        # Called as log(obj, field, old) for every field assigned to the
+        # objects of the model, in the store or not, tracked or not, see
+        # reobject.transaction
+        self.undo_logs = []
+
+        # Batches of ({pk: obj} added, {pk: obj} removed) between begin() and
+        # commit(), innermost last.
+        self._batches = []
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __iter__(self):
+        if len(self._positions) == len(self._objects):
+            return iter(self._objects)
+
+        return filter(partial(is_not, _REMOVED), self._objects)
+
+    def __contains__(self, obj) -> bool:
+        return id(obj) in self._positions
+
+    def __repr__(self):
+        return '<{}: {} objects>'.format(type(self).__name__, len(self))
+
+    def _compact(self) -> None:
+        if len(self._objects) < 2 * len(self._positions) + 32:
+            return
+
+        self._objects = list(self)
+        self._positions = {id(obj): i for i, obj in enumerate(self._objects)}
+
+        if self.columns is not None:
+            self.columns.compact()
+
+    def reading(self):
+        """
+        Returns the context manager guarding reads of the store, which does
+        nothing unless the store is synchronized.
+        """
+        return UNLOCKED
+
+    def writing(self):
+        """
+        Returns the context manager guarding changes to the store, which does
+        nothing unless the store is synchronized.
+        """
+        return UNLOCKED
+
+    def subscribe(self, listener) -> None:
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener) -> None:
+        self._listeners.remove(listener)
+
+    def _notify(self, event: str, objs, field=None, old=None) -> None:
+        if self.tracking:
+            for obj in objs:
+                for listener in list(self._listeners):
+                    listener(event, obj, field, old)
+
+    def get(self, pk: int):
+        """
+        Returns the object identified by pk, or None if not in the store.
+        """
+        position = self._positions.get(pk)
+        return None if position is None else self._objects[position]
+
+    def first(self):
+        """
+        Returns the first object of the store, or None if it's empty.
+        """
+        return next(iter(self), None)
+
+    def last(self):
+        """
+        Returns the last object of the store, or None if it's empty.
+        """
+        for obj in reversed(self._objects):
+            if obj is not _REMOVED:
+                return obj
+
+        return None
+
+    def take(self, positions) -> list:
+        """
+        Returns the objects at the given positions.
+        """
+        objects = self._objects
+        return [objects[position] for position in positions]
+
+    def begin(self) -> None:
+        self._batches.append(({}, {}))
+
+    def commit(self) -> None:
+        added, removed = self._batches.pop()
+
+        if self._batches:
+            for obj in removed.values():
+                self.remove(obj)
+
+            for obj in added.values():
+                self.append(obj)
+
+            return
+
+        self.remove_many(removed.values())
+        self.extend(added.values())
+
+    def discard(self) -> None:
+        self._batches.pop()
+
+    def _present(self, pk: int) -> bool:
+        """
+        Whether the object identified by pk is in the store, as of the
+        pending batches.
+        """
+        present = pk in self._positions
+
+        for added, removed in self._batches:
+            if pk in added:
+                present = True
+            elif pk in removed:
+                present = False
+
+        return present
+
+    def append(self, obj) -> None:
+        if self.journal is not None:
+            self.journal.check()
+
+        pk = id(obj)
+
+        if self._batches:
+            added, removed = self._batches[-1]
+
+            if removed.pop(pk, None) is None and not self._present(pk):
+                added[pk] = obj
+
+            return
+
+        if pk in self._positions:
+            return
+
+        self._positions[pk] = len(self._objects)
+        self._objects.append(obj)
+        self.version += 1
+
+        if self.columns is not None:
+            self.columns.append(obj)
+
+        for indexes in self.indexes.values():
+            for index in indexes:
+                index.add(obj)
+
+        if self.journal is not None:
+            self.journal.added(self, (obj,))
+
+        if self._listeners:
+            self._notify('add', (obj,))
+
+    def extend(self, objs) -> None:
+        """
+        Adds the given objects at once, skipping those already in the store,
+        and updates each index and the columns in a single batch.
+        """
+        if self.journal is not None:
+            self.journal.check()
+
+        if self._batches:
+            for obj in objs:
+                self.append(obj)
+
+            return
+
+        positions = self._positions
+        added = []  # type: list
+
+        for obj in objs:
+            pk = id(obj)
+
+            if pk not in positions:
+                positions[pk] = len(self._objects) + len(added)
+                added.append(obj)
+
+        if not added:
+            return
+
+        self._objects.extend(added)
+        self.version += 1
+
+        if self.columns is not None:
+            self.columns.extend(added)
+
+        for indexes in self.indexes.values():
+            for index in indexes:
+                index.add_many(added)
+
+        if self.journal is not None:
+            self.journal.added(self, added)
+
+        if self._listeners:
+            self._notify('add', added)
+
+    def restore(self, objs: list, orders=None, columns=None) -> None:
+        """
+        Fills the empty store with objs at once, as loaded from a snapshot by
+        reobject.persist.
+
+        orders maps the fields of the sorted indexes to the positions of the
+        objects in index order, which the indexes are fed in so that sorting
+        them again is linear. columns maps column fields to their arrays, as
+        taken by ColumnMirror.restore().
+        """
+        if self.journal is not None:
+            self.journal.check()
+
+        if self._positions or self._batches:
+            raise ValueError('Store.restore(): store not empty')
+
+        orders = orders or {}
+        self._objects = list(objs)
+        self._positions = {id(obj): i for i, obj in enumerate(self._objects)}
+        self.version += 1
+
+        if self.columns is not None:
+            self.columns.restore(self._objects, columns or {})
+
+        for field, indexes in self.indexes.items():
+            for index in indexes:
+                if isinstance(index, SortedIndex) and field in orders:
+                    index.add_many(self.take(orders[field]))
+                else:
+                    index.add_many(self._objects)
+
+        if self.journal is not None:
+            self.journal.added(self, self._objects)
+
+        if self._listeners:
+            self._notify('add', self._objects)
+
+    def remove(self, obj) -> None:
+        if self.journal is not None:
+            self.journal.check()
+
+        if self._batches:
+            return self._set_aside(obj)
+
+        try:
+            position = self._positions.pop(id(obj))
+        except KeyError:
+            raise ValueError('Store.remove(x): x not in store')
+
+        self._objects[position] = _REMOVED
+        self.version += 1
+
+        if self.columns is not None:
+            self.columns.remove(position)
+
+        for indexes in self.indexes.values():
+            for index in indexes:
+                index.remove(obj)
+
+        self.dirty.pop(id(obj), None)
+        self._compact()
+
+        if self.journal is not None:
+            self.journal.removed(self, (obj,))
+
+        if self._listeners:
+            self._notify('remove', (obj,))
+
+    def _set_aside(self, obj) -> None:
+        pk = id(obj)
+        added, removed = self._batches[-1]
+
+        if added.pop(pk, None) is not None:
+            return
+
+        if not self._present(pk):
+            raise ValueError('Store.remove(x): x not in store')
+
+        removed[pk] = obj
+
+    def remove_many(self, objs) -> int:
+        """
+        Removes the given objects in a single pass, skipping those which are
+        not in the store, and returns the number of objects removed.
+        """
+        if self.journal is not None:
+            self.journal.check()
+
+        if self._batches:
+            count = 0
+
+            for obj in objs:
+                if self._present(id(obj)):
+                    self._set_aside(obj)
+                    count += 1
+
+            return count
+
+        removed = []
+
+        for obj in objs:
+            position = self._positions.pop(id(obj), None)
+
+            if position is not None:
+                self._objects[position] = _REMOVED
+                self.dirty.pop(id(obj), None)
+                removed.append(obj)
+
+                if self.columns is not None:
+                    self.columns.remove(position)
+
+        if removed:
+            self.version += 1
+
+        for indexes in self.indexes.values():
+            for index in indexes:
+                index.remove_many(removed)
+
+        self._compact()
+
+        if self.journal is not None and removed:
+            self.journal.removed(self, removed)
+
+        if self._listeners:
+            self._notify('remove', removed)
+
+        return len(removed)
+
+    def reindex(self, obj, field: str) -> None:
+        position = self._positions.get(id(obj))
+
+        if position is None:
+            # Not in the store, e.g. while being created by bulk_create()
+            return
+
+        self.version += 1
+
+        for index in self.indexes.get(field, ()):
+            index.update(obj)
+
+        if self.columns is not None and field in self.columns:
+            self.columns.set(position, field, getattr(obj, field))
+
+        if self.journal is not None:
+            self.journal.assigned(self, obj, field)
+
+    def changed(self, obj, field: str, old) -> bool:
+        """
+        Reindexes a field assigned to obj, which held old beforehand, and
+        records the change if tracking is on. Returns whether it did.
+        """
+        if id(obj) not in self._positions:
+            return False
+
+        self.reindex(obj, field)
+
+        if not self.tracking:
+            return False
+
+        if self._listeners:
+            self._notify('change', (obj,), field, old)
+
+        self.dirty.setdefault(id(obj), set()).add(field)
+        return True
+
+    def clean(self, obj=None) -> None:
+        """
+        Forgets the fields assigned to obj, or to every object if obj is None.
+        """
+        if obj is None:
+            self.dirty.clear()
+        else:
+            self.dirty.pop(id(obj), None)
+
+    def indexes_on(self, field: str) -> list:
+        """
+        Returns the indexes able to answer lookups on field. Lookups on the pk
+        are answered by the store itself, and lookups on the pk of a related
+        object by the ForeignKeyIndex of the field.
+        """
+        if field in ('id', 'pk'):
+            return [self._pk_index]
+
+        name, _, attribute = field.partition('__')
+
+        if attribute in ('id', 'pk'):
+            # Lookups on the pk of the objects referenced by a ForeignKey
+            return [
+                index for index in self.indexes.get(name, ())
+                if isinstance(index, ForeignKeyIndex)
+            ]
+
+        return [
+            index for index in self.indexes.get(field, ())
+            if not isinstance(index, ForeignKeyIndex)
+        ]
+
+    def sorted_index(self, field: str):
+        """
+        Returns the SortedIndex built on field, if any.
+        """
+        for index in self.indexes.get(field, ()):
+            if isinstance(index, SortedIndex):
+                return index
+
+        return None
+
+    def ordered(self, objects: dict) -> list:
+        """
+        Returns the objects of a {pk: obj} mapping in store order.
+        """
+        return [
+            objects[pk]
+            for pk in sorted(objects, key=self._positions.__getitem__)
+        ]
+
+
+def _writes(method):
+    """
+    Wraps a method of SynchronizedStore so that it holds the lock for writing.
+    """
+    def locked(self, *args, **kwargs):
+        with self.lock.write:
+            return method(self, *args, **kwargs)
+
+    locked.__name__ = method.__name__
+    locked.__doc__ = method.__doc__
+    return locked
+
+
+class SynchronizedStore(Store):
+    """
+    Store shared by several threads, guarded by a ReadWriteLock.
+
+    Changes to the objects of the store hold the lock for writing, while
+    QuerySets hold it for reading as they look up objects, so that any number
+    of them run at once but never see a change half applied.
+
+    A batch holds the lock for writing from begin() until it's committed or
+    discarded, as the objects set aside in it aren't told apart by thread.
+    """
+    def __init__(self, indexes=(), columns=()):
+        super(SynchronizedStore, self).__init__(indexes, columns)
+        self.lock = ReadWriteLock()
+
+    def reading(self):
+        return self.lock.read
+
+    def writing(self):
+        return self.lock.write
+
+    append = _writes(Store.append)
+    extend = _writes(Store.extend)
+    remove = _writes(Store.remove)
+    remove_many = _writes(Store.remove_many)
+    restore = _writes(Store.restore)
+
+    def reindex(self, obj, field: str) -> None:
+        if id(obj) in self._positions:
+            with self.lock.write:
+                super(SynchronizedStore, self).reindex(obj, field)
+
+    def changed(self, obj, field: str, old) -> bool:
+        if id(obj) not in self._positions:
+            return False
+
+        with self.lock.write:
+            return super(SynchronizedStore, self).changed(obj, field, old)
+
+    clean = _writes(Store.clean)
+
+    def begin(self) -> None:
+        self.lock.acquire_write()
+        super(SynchronizedStore, self).begin()
+
+    def commit(self) -> None:
+        try:
+            super(SynchronizedStore, self).commit()
+        finally:
+            self.lock.release_write()
 
-class Store(list):
-    pass
+    def discard(self) -> None:
+        try:
+            super(SynchronizedStore, self).discard()
+        finally:
+            self.lock.release_write()
@@ -0,0 +1,183 @@
+"""
+Asynchronous stream of the changes to the objects of a model, as returned by
+Manager.changes().
+"""
+import asyncio
+import threading
+from collections import deque, namedtuple
+from typing import Any, Deque, Optional as Maybe
+
+# field and old, the value the field held before, are only set for changes
+Change = namedtuple('Change', ['event', 'obj', 'field', 'old'])
+
+EVENTS = frozenset(['add', 'remove', 'change'])
+
+# Queued once the stream is closed, to wake up its consumer
+_CLOSED = object()
+
+
+class ChangeStream(object):
+    """
+    Asynchronous iterator over the objects added to, removed from or changed
+    in a store, as Change tuples, from the time the stream is opened until
+    it's closed. Only the given events are streamed, or all of them if none
+    are given.
+
+    The stream listens to the store, and queues the changes for the event
+    loop it's first iterated over in, even if they're made by another thread.
+    Changes made until then are held, so a stream may be opened before the
+    event loop runs. Changes are queued until consumed, so a stream should be
+    closed once done with, as async with does.
+
+    Up to maxsize changes are queued, or any number of them if maxsize is 0.
+    A stream falling further behind is closed, and raises OverflowError once
+    the changes queued are consumed, rather than hold up changes to the
+    store. It's closed as well once its event loop is.
+    """
+    def __init__(self, store, events=(), maxsize: int = 0):
+        self.store = store
+        self.events = frozenset(events)
+        self.maxsize = maxsize
+
+        if self.events - EVENTS:
+            raise ValueError('Unknown events: {}'.format(
+                ', '.join(sorted(self.events - EVENTS))
+            ))
+
+        # Set once iterated over, changes are held in _pending until then
+        self._loop = None  # type: Maybe[asyncio.AbstractEventLoop]
+        self._thread = None  # type: Maybe[int]
+        self._queue = None  # type: Any
+        self._pending = deque()  # type: Deque[Any]
+        self._binding = threading.Lock()
+        self._closed = False
+        self._overflowed = False
+
+        store.subscribe(self._listener)
+
+    def _listener(self, event, obj, field, old) -> None:
+        if self.events and event not in self.events:
+            return
+
+        self._put(Change(event, obj, field, old))
+
+    def _put(self, item) -> None:
+        if self._loop is None:
+            with self._binding:
+                if self._loop is None:
+                    item = self._admit(len(self._pending), item)
+
+                    if item is not None:
+                        self._pending.append(item)
+
+                    return
+
+        if self._loop.is_closed():
+            # There's no one left to stream to
+            self._stop()
+        elif threading.get_ident() == self._thread:
+            self._enqueue(item)
+        else:
+            try:
+                self._loop.call_soon_threadsafe(self._enqueue, item)
+            except RuntimeError:
+                # The event loop was closed meanwhile
+                self._stop()
+
+    def _enqueue(self, item) -> None:
+        item = self._admit(self._queue.qsize(), item)
+
+        if item is not None:
+            self._queue.put_nowait(item)
+
+    def _admit(self, queued: int, item):
+        """
+        Returns the item to queue after queued changes, _CLOSED if item
+        overflows the queue, closing the stream, or None if the stream
+        already overflowed.
+        """
+        if item is _CLOSED:
+            return item
+        elif self._overflowed:
+            return None
+        elif self.maxsize and queued >= self.maxsize:
+            self._overflowed = True
+            self._stop()
+            return _CLOSED
+
+        return item
+
+    def _stop(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self.store.unsubscribe(self._listener)
+
+    def _bind(self) -> None:
+        """
+        Queues the changes for the running event loop from now on, along
+        with those held so far.
+        """
+        loop = asyncio.get_running_loop()
+
+        with self._binding:
+            if self._loop is not None:
+                if self._loop is not loop:
+                    raise RuntimeError(
+                        'The stream is iterated over in another event loop'
+                    )
+
+                return
+
+            self._queue = asyncio.Queue()
+
+            while self._pending:
+                self._queue.put_nowait(self._pending.popleft())
+
+            self._thread = threading.get_ident()
+            self._loop = loop
+
+    def close(self) -> None:
+        """
+        Stops listening to the store. Changes queued beforehand are still
+        streamed.
+        """
+        if not self._closed:
+            self._stop()
+            self._put(_CLOSED)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __aiter__(self) -> 'ChangeStream':
+        return self
+
+    async def __anext__(self) -> Change:
+        if self._loop is not asyncio.get_running_loop():
+            self._bind()
+
+        change = await self._queue.get()
+
+        if change is _CLOSED:
+            # Let other consumers know as well
+            self._queue.put_nowait(_CLOSED)
+
+            if self._overflowed:
+                raise OverflowError(
+                    'More than {} changes were queued'.format(self.maxsize)
+                )
+
+            raise StopAsyncIteration
+
+        return change
+
+    async def __aenter__(self) -> 'ChangeStream':
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        queued = len(self._pending) if self._queue is None \
+            else self._queue.qsize()
+        return '<{}: {} queued>'.format(type(self).__name__, queued)
@@ -0,0 +1,516 @@
+"""
+Snapshots of the stores of every model, written by save() and read back by
+load(), so that a process restarts without creating its objects again.
+
+A snapshot is laid out as:
+
+    MAGIC
+    arrays, each aligned on ALIGNMENT bytes
+    objects, as a stream of pickles
+    header, a pickle of the layout of the snapshot
+    offset of the header, as a little-endian unsigned 64 bits integer
+    MAGIC
+
+Fields mostly holding bools, ints, floats or naive datetimes are written as
+NumPy arrays, along with masks of the rows holding a value stored in the
+array, and of those holding None. Loading maps these arrays from the file
+rather than parsing them, and the columns of the models take them as they
+are. Other fields, and values which don't fit in the array of their field,
+are pickled.
+
+References to model objects, such as ForeignKey fields, are pickled as the
+position of the object in its store, so that they are loaded as references to
+the same objects. Objects referenced but not in their store are pickled along,
+and loaded without being added to it.
+
+Indexes are rebuilt rather than written, sorted ones out of the order of
+their objects, which is written so that it doesn't have to be sorted again.
+"""
+import gc
+import mmap
+import os
+import pickle
+import struct
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from typing import Any, Dict
+
+import attr
+
+from reobject.models.columns import numpy
+from reobject.models.index import TIMESTAMP_FIELDS, SortedIndex
+from reobject.models.model import Model
+from reobject.models.store import ModelStoreMapping
+
+__all__ = ['save', 'load']
+
+MAGIC = b'REOBJECT'
+VERSION = 1
+ALIGNMENT = 64
+
+_FOOTER = struct.Struct('<Q')
+
+# Whether a value of a field of each kind is stored in its array as is, and
+# loaded back as an equal value of the same type.
+_FITS = {
+    'bool': lambda value: type(value) is bool,
+    'int': lambda value: type(value) is int and -2 ** 63 <= value < 2 ** 63,
+    'float': lambda value: type(value) is float,
+    'datetime': lambda value: type(value) is datetime and value.tzinfo is None,
+}
+
+_DTYPES = {
+    'bool': bool,
+    'int': 'int64',
+    'float': 'float64',
+    'datetime': 'datetime64[us]',
+}  # type: Dict[str, Any]
+
+# Filling the rows of an array which don't hold a value stored in it
+_BLANKS = {
+    'bool': False,
+    'int': 0,
+    'float': 0.0,
+    'datetime': datetime(1970, 1, 1),
+}
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Pauses the garbage collector, which would otherwise walk the objects
+    created or pickled over and over again, while none of them is garbage.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _fields(model) -> list:
+    return [field.name for field in attr.fields(model)] + \
+        list(TIMESTAMP_FIELDS)
+
+
+def _kind(values):
+    """
+    Returns the kind of the array values are written as, inferred from the
+    first value besides None, or None if they're better pickled.
+    """
+    for value in values:
+        if value is not None:
+            if isinstance(value, bool):
+                return 'bool'
+            elif isinstance(value, int):
+                return 'int'
+            elif isinstance(value, float):
+                return 'float'
+            elif isinstance(value, datetime) and value.tzinfo is None:
+                return 'datetime'
+
+            return None
+
+    return None
+
+
+def _layout(values: list):
+    """
+    Returns the (kind, data, valid, null) arrays of values, along with the
+    {row: value} mapping of the values not stored in the array, or None if
+    most values don't fit in an array.
+    """
+    kind = _kind(values)
+
+    if kind is None:
+        return None
+
+    valid = list(map(_FITS[kind], values))
+
+    if 2 * sum(valid) < len(values):
+        return None
+
+    blank = _BLANKS[kind]
+    data = numpy.array(
+        [value if fits else blank for value, fits in zip(values, valid)],
+        dtype=_DTYPES[kind]
+    )
+    null = numpy.array([value is None for value in values], dtype=bool)
+    others = {
+        row: value for row, (value, fits) in enumerate(zip(values, valid))
+        if not fits and value is not None
+    }
+
+    return (kind, data, numpy.array(valid, dtype=bool), null), others
+
+
+def _reference(name: str, position: int):
+    """
+    Stands for a model object in pickles, resolved by _Unpickler.
+    """
+    raise pickle.UnpicklingError('Model objects are loaded by reobject.persist')
+
+
+class _Pickler(pickle.Pickler):
+    """
+    Pickles model objects as a (model name, position) reference. Objects not
+    in their store are given a negative position, -1 for the first one, and
+    listed in detached to be pickled later on.
+
+    References are pickled by reducer_override(), which unlike persistent_id()
+    isn't called for builtin values, such as strings and numbers. It's new in
+    Python 3.8, the oldest version reobject runs on, as checked on import.
+    """
+    def __init__(self, file, positions: dict):
+        super(_Pickler, self).__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.positions = positions  # pk -> (model name, position)
+        self.detached = []  # type: list
+        # pk -> reference, for the objects in detached
+        self._detached = {}  # type: Dict[int, tuple]
+
+    def reducer_override(self, obj):
+        if not isinstance(obj, Model):
+            return NotImplemented
+
+        return _reference, self.reference(obj)
+
+    def reference(self, obj) -> tuple:
+        return self.positions.get(id(obj)) or self._detach(obj)
+
+    def _detach(self, obj) -> tuple:
+        reference = self._detached.get(id(obj))
+
+        if reference is None:
+            self.detached.append(obj)
+            reference = self._detached[id(obj)] = \
+                (type(obj).__name__, -len(self.detached))
+
+        return reference
+
+    def dump_detached(self) -> None:
+        """
+        Dumps the state of the objects in detached, in batches as pickling
+        them may reference more of them, followed by None.
+        """
+        done = 0
+
+        while done < len(self.detached):
+            batch = self.detached[done:]
+            done = len(self.detached)
+            self.dump([_state(obj) for obj in batch])
+
+        self.dump(None)
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, objects: dict):
+        super(_Unpickler, self).__init__(file)
+        self.objects = objects  # model name -> objects, in store order
+        self.detached = []  # type: list
+
+    def find_class(self, module, name):
+        if module == __name__ and name == '_reference':
+            return self.resolve
+
+        return super(_Unpickler, self).find_class(module, name)
+
+    def resolve(self, name: str, position: int):
+        if position >= 0:
+            return self.objects[name][position]
+
+        while len(self.detached) < -position:
+            # Filled in once their state is loaded
+            self.detached.append(None)
+
+        if self.detached[-position - 1] is None:
+            model = ModelStoreMapping[name].model
+            self.detached[-position - 1] = object.__new__(model)
+
+        return self.detached[-position - 1]
+
+    def load_detached(self) -> None:
+        """
+        Loads the state of the objects detached, as dumped by
+        _Pickler.dump_detached().
+        """
+        detached = 0
+
+        for batch in iter(self.load, None):
+            for state in batch:
+                _set_state(self.detached[detached], state)
+                detached += 1
+
+
+def _state(obj) -> dict:
+    """
+    Returns the attributes of an object, fields and stamps included.
+    """
+    state = dict(getattr(obj, '__dict__', ()))
+
+    for field in _fields(type(obj)):
+        try:
+            state[field] = getattr(obj, field)
+        except AttributeError:
+            pass
+
+    return state
+
+
+def _set_state(obj, state: dict) -> None:
+    for name, value in state.items():
+        object.__setattr__(obj, name, value)
+
+
+def _write_array(file, array) -> tuple:
+    file.write(b'\0' * (-file.tell() % ALIGNMENT))
+    offset = file.tell()
+    file.write(array.view(numpy.uint8).tobytes())
+    return offset, array.dtype.str, len(array)
+
+
+def _read_array(buffer, spec):
+    offset, dtype, size = spec
+    return numpy.frombuffer(buffer, dtype=dtype, count=size, offset=offset)
+
+
+def _section(file, name: str, objs: list, store) -> tuple:
+    """
+    Writes the arrays of the objects of a store, and returns the header of
+    their section along with the values left to pickle.
+    """
+    fields = _fields(store.model)
+    arrays = {}
+    values = {}
+    others = {}
+
+    for field in fields:
+        column = [getattr(obj, field, None) for obj in objs]
+        layout = _layout(column) if numpy is not None and objs else None
+
+        if layout is None:
+            values[field] = column
+            continue
+
+        (kind, *masks), others[field] = layout
+        arrays[field] = (kind,) + tuple(
+            _write_array(file, array) for array in masks
+        )
+
+    positions = {id(obj): i for i, obj in enumerate(objs)}
+    orders = {}
+
+    for field, indexes in store.indexes.items():
+        for index in indexes:
+            if isinstance(index, SortedIndex):
+                order = [
+                    positions[id(obj)] for obj in index.ascending()
+                    if id(obj) in positions
+                ]
+                ordered = set(order)
+                order.extend(i for i in range(len(objs)) if i not in ordered)
+                orders[field] = order if numpy is None else _write_array(
+                    file, numpy.array(order, dtype=numpy.int64)
+                )
+
+    declared = set(fields)
+    extras = {}
+
+    for row, obj in enumerate(objs):
+        names = set(getattr(obj, '__dict__', ())) - declared
+
+        if names:
+            extras[row] = {name: obj.__dict__[name] for name in names}
+
+    header = {
+        'name': name,
+        'fields': sorted(declared),
+        'size': len(objs),
+        'arrays': arrays,
+        'orders': orders,
+    }
+
+    return header, {'values': values, 'others': others, 'extras': extras}
+
+
+def save(path: str, tag=None) -> None:
+    """
+    Writes the objects of every model to a snapshot at path, replacing it
+    once complete. load() returns tag, which identifies the snapshot.
+    """
+    stores = [
+        (name, store) for name, store in ModelStoreMapping.items()
+        if store.model is not None
+    ]
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+
+    with ExitStack() as stack:
+        stack.enter_context(_gc_paused())
+
+        for _, store in stores:
+            stack.enter_context(store.reading())
+
+        objects = {name: list(store) for name, store in stores}
+
+        with open(temporary, 'wb') as file:
+            file.write(MAGIC)
+            sections = [
+                _section(file, name, objects[name], store)
+                for name, store in stores
+            ]
+
+            offset = file.tell()
+            pickler = _Pickler(file, {
+                id(obj): (name, i)
+                for name, objs in objects.items()
+                for i, obj in enumerate(objs)
+            })
+
+            for _, values in sections:
+                pickler.dump(values)
+
+            pickler.dump_detached()
+
+            header = {
+                'version': VERSION,
+                'tag': tag,
+                'objects': offset,
+                'models': [header for header, _ in sections],
+            }
+
+            offset = file.tell()
+            pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.write(_FOOTER.pack(offset))
+            file.write(MAGIC)
+            file.flush()
+            os.fsync(file.fileno())
+
+    os.replace(temporary, path)
+
+
+def _header(buffer) -> dict:
+    end = len(buffer) - len(MAGIC)
+
+    if buffer[:len(MAGIC)] != MAGIC or buffer[end:] != MAGIC:
+        raise ValueError('Not a snapshot, or truncated')
+
+    (offset,) = _FOOTER.unpack_from(buffer, end - _FOOTER.size)
+    header = pickle.loads(buffer[offset:end - _FOOTER.size])
+
+    if header['version'] != VERSION:
+        raise ValueError(
+            'Unsupported snapshot version {}'.format(header['version'])
+        )
+
+    for section in header['models']:
+        store = ModelStoreMapping.get(section['name'])
+
+        if store is None or store.model is None:
+            raise ValueError('Unknown model {}'.format(section['name']))
+
+        if section['fields'] != sorted(_fields(store.model)):
+            raise ValueError(
+                'The fields of {} differ from the snapshot'.format(
+                    section['name']
+                )
+            )
+
+        if len(store) and section['size']:
+            raise ValueError('The store of {} is not empty'.format(
+                section['name']
+            ))
+
+        if section['arrays'] and numpy is None:
+            raise ValueError('Loading the snapshot requires NumPy')
+
+    return header
+
+
+def load(path: str):
+    """
+    Adds the objects of a snapshot written by save() to the stores of their
+    models, which must be empty, and returns the tag it was saved with.
+
+    Arrays are mapped copy-on-write from the file, which the columns of the
+    models keep using until they change.
+    """
+    with _gc_paused():
+        return _load(path)
+
+
+def _load(path: str):
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header = _header(buffer)
+    sections = header['models']
+    new = object.__new__
+    objects = {
+        section['name']: [
+            new(ModelStoreMapping[section['name']].model)
+            for _ in range(section['size'])
+        ]
+        for section in sections
+    }
+
+    buffer.seek(header['objects'])
+    unpickler = _Unpickler(buffer, objects)
+    setattr_ = object.__setattr__
+
+    for section in sections:
+        objs = objects[section['name']]
+        pickled = unpickler.load()
+        store = ModelStoreMapping[section['name']]
+        fields = dict(pickled['values'])
+        columns = {}
+
+        for field, (kind, *specs) in section['arrays'].items():
+            data, valid, null = [_read_array(buffer, spec) for spec in specs]
+            values = data.tolist()
+
+            for row in numpy.flatnonzero(null).tolist():
+                values[row] = None
+
+            for row, value in pickled['others'][field].items():
+                values[row] = value
+
+            fields[field] = values
+
+            if store.columns is not None and field in store.columns:
+                columns[field] = (kind, data, valid, null)
+
+        if objs and hasattr(objs[0], '__dict__'):
+            # Setting the __dict__ of each object at once
+            names = list(fields)
+
+            for obj, state in zip(objs, zip(*fields.values())):
+                setattr_(obj, '__dict__', dict(zip(names, state)))
+        else:
+            for field, values in fields.items():
+                for obj, value in zip(objs, values):
+                    setattr_(obj, field, value)
+
+        for row, state in pickled['extras'].items():
+            _set_state(objs[row], state)
+
+        section['columns'] = columns
+
+    unpickler.load_detached()
+
+    for section in sections:
+        if not section['size']:
+            continue
+
+        orders = {
+            field: order if isinstance(order, list)
+            else _read_array(buffer, order).tolist()
+            for field, order in section['orders'].items()
+        }
+
+        ModelStoreMapping[section['name']].restore(
+            objects[section['name']], orders, section['columns']
+        )
+
+    return header['tag']
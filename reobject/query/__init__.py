@@ -1,3 +1,5 @@
+from reobject.query.aggregates import Avg, Count, Max, Min, Sum
+from reobject.query.cache import QueryCache
 from reobject.query.parser import Q
 from reobject.query.queryset import EmptyQuerySet
 from reobject.query.queryset import QuerySet
@@ -0,0 +1,242 @@
+"""
+Aggregates computed over the objects of a QuerySet by QuerySet.aggregate().
+
+Each aggregate folds the values of a field into a state, one object at a
+time, so that any number of them are computed in a single pass. None values
+are skipped, and aggregating no values yields None, except for Count.
+
+Aggregates computed from the NumPy columns of the fields give the same
+results, of the same types, as folding the objects one at a time.
+"""
+from reobject.models.columns import numpy
+from reobject.utils import cmp
+
+# Field name standing for the objects themselves, as in Count('*')
+ALL = '*'
+
+# Kinds of columns which can be summed
+_NUMERIC = ('bool', 'int', 'float')
+
+
+class Aggregate(object):
+    name = ''  # set by each aggregate, e.g. 'Sum'
+
+    def __init__(self, field: str):
+        # Validate the field name right away
+        cmp(field)
+        self.field = field
+
+    @property
+    def default_alias(self) -> str:
+        return '{}__{}'.format(self.field, self.name.lower())
+
+    def start(self):
+        return None
+
+    def step(self, state, value):
+        raise NotImplementedError
+
+    def finish(self, state):
+        return state
+
+    def from_array(self, values, kind: str):
+        """
+        Returns the aggregate of a NumPy array of the values, or raises
+        TypeError if it can't be computed from an array of that kind.
+        """
+        raise NotImplementedError
+
+    def partial(self, values, kind: str):
+        """
+        Returns the partial result of the aggregate over a NumPy array of
+        part of the values, which merge() combines with the others.
+        """
+        return self.from_array(values, kind)
+
+    def merge(self, partials: list):
+        """
+        Returns the aggregate of the values, given the partial results over
+        each part of them.
+        """
+        state = self.start()
+
+        for partial in partials:
+            if partial is not None:
+                state = self.step(state, partial)
+
+        return self.finish(state)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.field)
+
+
+def _total(values, kind: str):
+    """
+    Returns the sum of a NumPy array of values as step() adds them up: bools
+    and ints as an int, and floats one after the other, rather than by the
+    pairwise summation of NumPy. Raises TypeError if it can't be computed
+    from an array of that kind.
+    """
+    if kind not in _NUMERIC:
+        raise TypeError
+
+    if kind == 'float':
+        return numpy.add.accumulate(values)[-1].item() if len(values) else 0.0
+
+    if kind == 'int' and len(values):
+        bound = max(-int(values.min()), int(values.max()))
+
+        if bound * len(values) >= 2 ** 63:
+            # The sum could overflow a 64-bit integer
+            raise TypeError
+
+    return int(values.sum(dtype=numpy.int64))
+
+
+def _merged(partials: list):
+    """
+    Returns the values of floats passed along by partial(), in order, or
+    None if the partial results are sums already.
+    """
+    arrays = [partial for partial in partials if hasattr(partial, 'dtype')]
+    return numpy.concatenate(arrays) if arrays else None
+
+
+class Sum(Aggregate):
+    name = 'Sum'
+
+    def step(self, state, value):
+        return value if state is None else state + value
+
+    def from_array(self, values, kind):
+        total = _total(values, kind)
+
+        if not len(values):
+            return None
+
+        # A single value is its own sum, as in step(), e.g. a bool
+        return values[0].item() if len(values) == 1 else total
+
+    def partial(self, values, kind):
+        if kind not in _NUMERIC:
+            raise TypeError
+
+        if kind == 'float':
+            # Passed along to be summed in order by merge()
+            return values
+
+        return self.from_array(values, kind)
+
+    def merge(self, partials):
+        values = _merged(partials)
+
+        if values is not None:
+            return self.from_array(values, 'float')
+
+        return super(Sum, self).merge(partials)
+
+
+class Avg(Aggregate):
+    name = 'Avg'
+
+    def start(self):
+        return None, 0
+
+    def step(self, state, value):
+        total, count = state
+        return (value if total is None else total + value), count + 1
+
+    def finish(self, state):
+        total, count = state
+        return None if not count else total / count
+
+    def from_array(self, values, kind):
+        # Summed as step() does, rather than by mean(), which sums ints as
+        # floats and loses precision above 2 ** 53
+        total = _total(values, kind)
+        return total / len(values) if len(values) else None
+
+    def partial(self, values, kind):
+        if kind not in _NUMERIC:
+            raise TypeError
+
+        if kind == 'float':
+            # Passed along to be summed in order by merge()
+            return values
+
+        return _total(values, kind), len(values)
+
+    def merge(self, partials):
+        values = _merged(partials)
+
+        if values is not None:
+            return self.from_array(values, 'float')
+
+        total = sum(partial[0] for partial in partials)
+        count = sum(partial[1] for partial in partials)
+        return None if not count else total / count
+
+
+class Min(Aggregate):
+    name = 'Min'
+
+    def step(self, state, value):
+        return value if state is None or value < state else state
+
+    def from_array(self, values, kind):
+        return values.min().item() if len(values) else None
+
+
+class Max(Aggregate):
+    name = 'Max'
+
+    def step(self, state, value):
+        return value if state is None or value > state else state
+
+    def from_array(self, values, kind):
+        return values.max().item() if len(values) else None
+
+
+class Count(Aggregate):
+    """
+    Number of objects holding a value other than None in field, or of all
+    objects for Count('*'). With distinct=True, only distinct values are
+    counted.
+    """
+    name = 'Count'
+
+    def __init__(self, field: str = ALL, distinct: bool = False):
+        if field != ALL:
+            super(Count, self).__init__(field)
+
+        self.field = field
+        # Objects are distinct from one another
+        self.distinct = distinct and field != ALL
+
+    def start(self):
+        return set() if self.distinct else 0
+
+    def step(self, state, value):
+        if self.distinct:
+            state.add(value)
+            return state
+
+        return state + 1
+
+    def finish(self, state):
+        return len(state) if self.distinct else state
+
+    def from_array(self, values, kind):
+        if self.distinct:
+            return len(set(values.tolist()))
+
+        return len(values)
+
+    def partial(self, values, kind):
+        return set(values.tolist()) if self.distinct else len(values)
+
+    def merge(self, partials):
+        if self.distinct:
+            return len(set().union(*partials))
+
+        return sum(partials)
@@ -0,0 +1,226 @@
+"""
+Cache of the results of QuerySets, shared by the models it's set on with
+Manager.set_cache().
+
+Results are keyed by the normalized query, i.e. the model, the Q tree, the
+ordering, the projection and the slice, so that QuerySets built alike hit
+the same entry, and are tagged with the version of the stores they were
+drawn from. Any object added to, removed from or assigned to in one of these
+stores makes the entry stale, and it's looked up again on next use.
+
+Values mutated in place, such as a list appended to, aren't noticed. Queries
+on unhashable lookup values, such as model instances, or through attributes
+other than ForeignKey fields, aren't cached.
+"""
+import threading
+from collections import OrderedDict
+from operator import attrgetter
+from typing import Optional as Maybe
+
+import attr
+
+from reobject.query.compiler import _flatten
+
+__all__ = ['QueryCache']
+
+
+def _value_key(value):
+    """
+    Returns a hashable stand-in for a lookup value, telling apart equal
+    values of different types such as 1 and True, or [1] and (1,), which
+    lookups may not match alike. Raises TypeError if value is unhashable.
+    """
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(map(_value_key, value))
+    elif isinstance(value, (set, frozenset)):
+        return type(value), frozenset(map(_value_key, value))
+
+    hash(value)
+    return type(value), value
+
+
+def _q_key(q, paths: list) -> Maybe[tuple]:
+    """
+    Returns the hashable key of the Q tree q, the same for trees differing
+    only by the nesting of their AND and OR children, or None if it matches
+    every object. Appends the attribute paths it looks up to paths.
+
+    Children are keyed in order, as they are evaluated in order and may
+    short-circuit a lookup which raises, e.g. when comparing None.
+    """
+    if q.is_leaf:
+        paths.append(q.attr)
+        return q.attr, q.verb, _value_key(q.value)
+
+    elif q.negated:
+        return 'NOT', _q_key(q.children[0], paths)
+
+    elif q.connector is None:
+        return None
+
+    children = tuple(
+        _q_key(child, paths) for child in _flatten(q, q.connector)
+    )
+
+    if None in children:
+        if q.connector == q.OR:
+            return None
+
+        children = tuple(child for child in children if child is not None)
+
+    if len(children) < 2:
+        return next(iter(children), None)
+
+    return q.connector, children
+
+
+def _related_models(model, path: str) -> Maybe[set]:
+    """
+    Returns the models whose fields the attribute path from model goes
+    through, other than model, or None if it goes through attributes other
+    than ForeignKey fields.
+    """
+    models = set()
+    names = path.lstrip('-').split('__')
+
+    for depth, name in enumerate(names[:-1], 1):
+        field = getattr(attr.fields(model), name, None) \
+            if attr.has(model) else None
+
+        if field is None or not field.metadata.get('related'):
+            return None
+
+        model = field.metadata['related']['target']
+
+        # The pk of the last related object doesn't depend on its fields
+        if depth < len(names) - 1 or names[-1] != 'pk':
+            models.add(model)
+
+    return models
+
+
+def _query_key(queryset) -> Maybe[tuple]:
+    """
+    Returns the key of the results of queryset, along with the models whose
+    stores they depend on, sorted by name, or None if they can't be cached.
+    """
+    if queryset._annotations is not None:
+        return None
+
+    paths = []  # type: list
+
+    try:
+        where = None if queryset._where is None \
+            else _q_key(queryset._where, paths)
+    except TypeError:
+        return None
+
+    ordering = tuple(op[:2] for op in queryset._ordering)
+    projection = queryset._projection
+
+    for op in ordering:
+        if op[0] == 'order_by':
+            paths.extend(op[1])
+
+    if projection is not None:
+        paths.extend(projection[1])
+
+    models = {queryset.model}
+
+    for path in paths:
+        if '__' in path:
+            related = _related_models(queryset.model, path)
+
+            if related is None:
+                return None
+
+            models |= related
+
+    key = (queryset.model, where, ordering, projection, queryset._limits)
+    return key, tuple(sorted(models, key=attrgetter('__name__')))
+
+
+class QueryCache(object):
+    """
+    Least recently used cache of the results of up to maxsize queries, and
+    up to maxrows results in total if given, evicting the least recently
+    used entries beyond that. Results of queries matching more than maxrows
+    objects aren't cached.
+
+    hits and misses count the lookups that were served from the cache, and
+    those that weren't, either missing or stale.
+
+    Cached results are shared by the QuerySets hitting them, and shouldn't
+    be mutated, e.g. the dicts returned by values().
+    """
+    def __init__(self, maxsize: int = 128, maxrows: Maybe[int] = None):
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+
+        self.maxsize = maxsize
+        self.maxrows = maxrows
+        self.hits = self.misses = 0
+        self.rows = 0  # number of results cached
+
+        # key -> (tag, results)
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<{}: {} entries, {} hits, {} misses>'.format(
+            type(self).__name__, len(self), self.hits, self.misses
+        )
+
+    def get(self, key, tag) -> Maybe[list]:
+        """
+        Returns the results cached under key if they're tagged with tag, or
+        None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry[0] != tag:
+                self._pop(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, tag, results: list) -> None:
+        """
+        Caches results under key, tagged with tag.
+        """
+        if self.maxrows is not None and len(results) > self.maxrows:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+            self._entries[key] = (tag, results)
+            self.rows += len(results)
+
+            while len(self._entries) > self.maxsize or \
+                    self.maxrows is not None and self.rows > self.maxrows:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key) -> None:
+        _, results = self._entries.pop(key)
+        self.rows -= len(results)
+
+    def clear(self) -> None:
+        """
+        Drops every entry, and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.rows = 0
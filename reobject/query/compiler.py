@@ -0,0 +1,214 @@
+"""
+Compiler turning a Q tree into a single predicate function.
+
+The source of the predicate is generated from the shape of the tree, i.e.
+its connectors, attribute paths and verbs, with the lookup values passed in
+as constants. Attribute paths are resolved inline, the verb of each lookup
+is dispatched at compile time, and case-insensitive constants are casefolded
+once. Generated code is cached per shape, so that queries differing only by
+their values share it.
+"""
+import keyword
+from collections.abc import Iterable
+from functools import lru_cache
+from itertools import count
+from typing import List
+
+
+def _icontains(value, const):
+    if isinstance(value, str):
+        return const in value.casefold()
+    elif isinstance(value, Iterable):
+        return const in map(str.casefold, value)
+    else:
+        raise TypeError(
+            'Unrecognized type: {}'.format(type(value))
+        )
+
+
+# Expression templates per verb, V being the attribute value and C the
+# constant it's compared against.
+_TEMPLATES = {
+    None: '{V} == {C}',
+    'contains': '{C} in {V}',
+    'endswith': '{V}.endswith({C})',
+    'exact': '{V} == {C}',
+    'gt': '{V} > {C}',
+    'gte': '{V} >= {C}',
+    'icontains': '_icontains({V}, {C})',
+    'iendswith': '{V}.casefold().endswith({C})',
+    'iexact': '{V}.casefold() == {C}',
+    'iin': '{V}.casefold() in {C}',
+    'in': '{V} in {C}',
+    'isnone': '({V} is None) == {C}',
+    'istartswith': '{V}.casefold().startswith({C})',
+    'lt': '{V} < {C}',
+    'lte': '{V} <= {C}',
+    'startswith': '{V}.startswith({C})',
+}
+
+_TEMPLATES_BY_TAG = {
+    ('isnone', True): '{V} is None',
+    ('isnone', False): '{V} is not None',
+}
+
+_NAMESPACE = {
+    '_icontains': _icontains,
+}
+
+
+def _constant(verb, value):
+    """
+    Returns the constant a lookup value is compiled to, along with a tag
+    selecting a specialised template, if any.
+    """
+    if verb in ('icontains', 'iendswith', 'iexact', 'istartswith'):
+        return value.casefold(), None
+
+    elif verb == 'iin':
+        if isinstance(value, str):
+            return value.casefold(), None
+        elif isinstance(value, Iterable):
+            return frozenset(map(str.casefold, value)), None
+        else:
+            raise TypeError(
+                'Unrecognized type: {}'.format(type(value))
+            )
+
+    elif verb == 'isnone' and (value is True or value is False):
+        return value, value
+
+    return value, None
+
+
+def _flatten(q, connector):
+    for child in q.children:
+        if child.connector == connector:
+            yield from _flatten(child, connector)
+        else:
+            yield child
+
+
+def _shape(q, consts: list) -> tuple:
+    """
+    Returns the hashable shape of q, appending the constants it refers to.
+    """
+    if q.is_leaf:
+        if q.attr.startswith('-') or q.verb not in _TEMPLATES:
+            consts.append(q._comparator_func)
+            return ('call',)
+
+        try:
+            const, tag = _constant(q.verb, q.value)
+        except (AttributeError, TypeError):
+            # Leave it to the comparator to raise when evaluated
+            consts.append(q._comparator_func)
+            return ('call',)
+
+        consts.append(const)
+        return ('leaf', q.attr, q.verb, tag)
+
+    elif q.negated:
+        return ('not', _shape(q.children[0], consts))
+
+    elif q.connector == q.AND:
+        children = tuple(
+            _shape(child, consts) for child in _flatten(q, q.AND)
+            if child.is_leaf or child.children
+        )
+
+        return ('and', children) if children else ('true',)
+
+    elif q.connector == q.OR:
+        alternatives = list(_flatten(q, q.OR))
+
+        if any(
+            not (child.is_leaf or child.children) for child in alternatives
+        ):
+            return ('true',)
+
+        return ('or', tuple(_shape(child, consts) for child in alternatives))
+
+    return ('true',)
+
+
+def _access(expr: str, name: str) -> str:
+    if name.isidentifier() and not keyword.iskeyword(name):
+        attribute = '{}.{}'.format(expr, name)
+    else:
+        attribute = 'getattr({}, {!r})'.format(expr, name)
+
+    return '({expr}.get({name!r}) if isinstance({expr}, dict) else {attr})'\
+        .format(expr=expr, name=name, attr=attribute)
+
+
+def _expression(shape: tuple, consts, getters: list) -> str:
+    kind = shape[0]
+
+    if kind == 'true':
+        return 'True'
+
+    elif kind == 'call':
+        return 'c{}(obj)'.format(next(consts))
+
+    elif kind == 'leaf':
+        _, attr, verb, tag = shape
+        names = attr.split('__')
+
+        if len(names) == 1:
+            value = _access('obj', names[0])
+        else:
+            getter = 'g{}'.format(len(getters))
+            getters.append(
+                '    def {}(v):\n'.format(getter) +
+                ''.join(
+                    '        v = {}\n'.format(_access('v', name))
+                    for name in names
+                ) +
+                '        return v\n'
+            )
+            value = '{}(obj)'.format(getter)
+
+        template = _TEMPLATES_BY_TAG.get((verb, tag), _TEMPLATES[verb])
+        return '(' + template.format(V=value, C='c{}'.format(next(consts))) + ')'
+
+    elif kind == 'not':
+        return '(not {})'.format(_expression(shape[1], consts, getters))
+
+    else:
+        return '(' + ' {} '.format(kind).join(
+            _expression(child, consts, getters) for child in shape[1]
+        ) + ')'
+
+
+@lru_cache(maxsize=512)
+def _factory(shape: tuple):
+    """
+    Returns a function building the predicate of the given shape out of its
+    constants.
+    """
+    consts = count()
+    getters = []  # type: List[str]
+    expression = _expression(shape, consts, getters)
+    params = ', '.join('c{}'.format(i) for i in range(next(consts)))
+
+    source = (
+        'def factory({}):\n'.format(params) +
+        ''.join(getters) +
+        '    def predicate(obj):\n'
+        '        return {}\n'.format(expression) +
+        '    return predicate\n'
+    )
+
+    namespace = dict(_NAMESPACE)
+    exec(compile(source, '<reobject.query.compiler>', 'exec'), namespace)
+    return namespace['factory']
+
+
+def compile_q(q):
+    """
+    Returns a predicate function evaluating the Q tree q against an object.
+    """
+    consts = []
+    shape = _shape(q, consts)
+    return _factory(shape)(*consts)
@@ -1,12 +1,18 @@
 import operator
 from functools import reduce
-from collections import Iterable
+from collections.abc import Iterable
+from typing import Optional as Maybe
 
+from reobject.query.compiler import compile_q
 from reobject.utils import cmp
 
 from ..types import LookupParams
 
+
 class _Q(object):
+    AND = 'AND'
+    OR = 'OR'
+
     verbs = (
         'contains',
         'endswith',
@@ -27,6 +33,11 @@ class _Q(object):
     )
 
     def __init__(self, **kwargs: LookupParams) -> None:
+        self.attr = self.verb = self.value = None
+        self.children = ()  # type: tuple
+        self.connector = None  # type: Maybe[str]
+        self.negated = False
+
         if kwargs:
             attr, self.value = list(kwargs.items())[0]
 
@@ -36,9 +47,14 @@ class _Q(object):
                 self.attr = attr
                 self.verb = None
 
-            self.comparator = self._comparator_func
-        else:
-            self.comparator = lambda x: True
+        self._compiled = None
+
+    def __getstate__(self) -> dict:
+        # The compiled comparator can't be pickled, e.g. to be evaluated by
+        # another process, and is compiled again on first use.
+        state = self.__dict__.copy()
+        state['_compiled'] = None
+        return state
 
     def _comparator_func(self, obj):
         (value,) = cmp(self.attr)(obj)
@@ -48,23 +64,61 @@ class _Q(object):
         else:
             return value == self.value
 
-    def __and__(self, other: '_Q') -> '_Q':
+    @property
+    def comparator(self):
+        """
+        Predicate function evaluating the Q tree against an object, compiled
+        on first use.
+        """
+        if self._compiled is None:
+            self._compiled = compile_q(self)
+
+        return self._compiled
+
+    @property
+    def is_leaf(self) -> bool:
+        return self.attr is not None
+
+    def _combine(self, other: '_Q', connector: str) -> '_Q':
         new = type(self)()
-        new.comparator = lambda obj: self.comparator(obj) and \
-                                     other.comparator(obj)
+        new.children = (self, other)
+        new.connector = connector
         return new
 
+    def __and__(self, other: '_Q') -> '_Q':
+        return self._combine(other, self.AND)
+
     def __or__(self, other: '_Q') -> '_Q':
-        new = type(self)()
-        new.comparator = lambda obj: self.comparator(obj) or \
-                                     other.comparator(obj)
-        return new
+        return self._combine(other, self.OR)
 
     def __invert__(self):
         new = type(self)()
-        new.comparator = lambda obj: not self.comparator(obj)
+        new.children = (self,)
+        new.negated = True
         return new
 
+    def _describe(self) -> str:
+        if self.is_leaf:
+            lookup = self.attr if self.verb is None else \
+                '{}__{}'.format(self.attr, self.verb)
+            return '{}={!r}'.format(lookup, self.value)
+
+        elif self.negated:
+            return 'NOT {}'.format(self.children[0]._describe())
+
+        children = [
+            child._describe() for child in self.children
+            if child.is_leaf or child.children
+        ]
+
+        if len(children) == 1:
+            return children[0]
+
+        return '(' + ' {} '.format(self.connector).join(children) + ')'
+
+    def __repr__(self):
+        return '<Q: {}>'.format(self._describe())
+
     def apply_verb(self, value):
         if self.verb == 'contains':
             return self.value in value
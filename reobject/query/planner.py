@@ -0,0 +1,810 @@
+"""
+Query planner deciding how the objects matched by a QuerySet are looked up.
+
+For QuerySets drawing their objects from the model store, the planner picks
+the cheapest of a full scan of the store and the candidates found in its
+indexes, based on the number of objects each index holds for a lookup. ANDed
+lookups are answered by intersecting the candidates of several indexes as
+long as that's expected to save more lookup evaluations than it costs, ORed
+lookups by the union of the candidates of each. The lookups are then
+evaluated on the candidates only, as a residual filter.
+
+Lookups on fields mirrored in columns are evaluated as masks over the whole
+store instead, if that's expected to be cheaper.
+
+Lookups through the ForeignKey fields passed to select_related() are answered
+by evaluating them once per distinct related object, and collecting the
+objects referencing those matching from the ForeignKeyIndex of the field.
+"""
+import asyncio
+import heapq
+import math
+from itertools import islice
+from typing import Any, Dict, List, Optional as Maybe, Iterable, Iterator, Tuple
+
+
+class Node(object):
+    """
+    Base class of the plan nodes. estimate is the expected number of rows
+    the node yields.
+    """
+    estimate = 0  # type: float
+
+    @property
+    def fetched(self) -> float:
+        """
+        Expected number of rows fetched from the indexes to yield those of the
+        node.
+        """
+        return sum(child.fetched for child in self.children)
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    def candidates(self) -> dict:
+        """
+        Returns the objects found by a lookup node, keyed by their pk.
+        """
+        raise NotImplementedError
+
+    def rows(self) -> Iterator:
+        """
+        Returns the objects yielded by a scan node.
+        """
+        raise NotImplementedError
+
+    @property
+    def children(self) -> tuple:
+        return ()
+
+    def explain(self, depth: int = 0) -> list:
+        lines = ['{}{} [estimated {} rows]'.format(
+            '  ' * depth, self.describe(), int(self.estimate)
+        )]
+
+        for child in self.children:
+            lines.extend(child.explain(depth + 1))
+
+        return lines
+
+
+class IndexLookup(Node):
+    """
+    Candidates of a single lookup, as found in an index.
+    """
+    def __init__(self, index, q, estimate: int):
+        self.index = index
+        self.q = q
+        self.estimate = estimate
+
+    @property
+    def fetched(self) -> float:
+        return self.estimate
+
+    def candidates(self) -> dict:
+        return self.index.lookup(self.q.verb, self.q.value)
+
+    def describe(self) -> str:
+        return 'IndexLookup {!r} using {!r} ({} rows, {} distinct values)'\
+            .format(self.q, self.index, len(self.index), self.index.distinct)
+
+
+class RelatedLookup(Node):
+    """
+    Candidates of a lookup through the ForeignKey fields of path, found by
+    evaluating the rest of the lookup on each distinct related object.
+    """
+    def __init__(self, index, path: str, q, estimate: float):
+        self.index = index
+        self.path = path
+        self.q = q
+        self.estimate = estimate
+
+        rest = q.attr[len(path) + 2:]
+        self.lookup = type(q)(**{
+            rest if q.verb is None else '{}__{}'.format(rest, q.verb): q.value
+        })
+
+    @property
+    def fetched(self) -> float:
+        return self.estimate + self.index.distinct
+
+    def candidates(self) -> dict:
+        groups = list(self.index.groups())
+        holding = _holding(
+            [related for related, _ in groups],
+            self.path.split('__')[1:],
+            self.lookup.comparator
+        )
+
+        candidates = {}
+
+        for related, objects in groups:
+            if id(related) in holding:
+                candidates.update(objects)
+
+        return candidates
+
+    def describe(self) -> str:
+        return 'RelatedLookup {!r} through {} using {!r} ({} rows, {} distinct ' \
+            'values)'.format(
+                self.q, self.path, self.index, len(self.index),
+                self.index.distinct
+            )
+
+
+def _holding(objects: list, hops: list, predicate) -> set:
+    """
+    Returns the ids of the objects which the predicate may hold for, following
+    the ForeignKey fields in hops once per distinct related object.
+    """
+    holding = set()
+
+    if not hops:
+        for obj in objects:
+            try:
+                if predicate(obj):
+                    holding.add(id(obj))
+            except Exception:
+                # Left for the residual filter to raise
+                holding.add(id(obj))
+
+        return holding
+
+    # id(related) -> (related, [obj, ...])
+    groups = {}  # type: Dict[int, Tuple[Any, list]]
+
+    for obj in objects:
+        try:
+            related = getattr(obj, hops[0])
+        except AttributeError:
+            holding.add(id(obj))
+        else:
+            groups.setdefault(id(related), (related, []))[1].append(obj)
+
+    matching = _holding(
+        [related for related, _ in groups.values()], hops[1:], predicate
+    )
+
+    for key in matching:
+        holding.update(map(id, groups[key][1]))
+
+    return holding
+
+
+class Intersection(Node):
+    def __init__(self, nodes: list, estimate: float):
+        self.nodes = nodes
+        self.estimate = estimate
+
+    @property
+    def children(self) -> tuple:
+        return tuple(self.nodes)
+
+    def candidates(self) -> dict:
+        results = sorted((node.candidates() for node in self.nodes), key=len)
+        smallest, others = results[0], results[1:]
+
+        return {
+            pk: obj for pk, obj in smallest.items()
+            if all(pk in other for other in others)
+        }
+
+    def describe(self) -> str:
+        return 'Intersection'
+
+
+class Union(Node):
+    def __init__(self, nodes: list, estimate: float):
+        self.nodes = nodes
+        self.estimate = estimate
+
+    @property
+    def children(self) -> tuple:
+        return tuple(self.nodes)
+
+    def candidates(self) -> dict:
+        union = {}
+
+        for node in self.nodes:
+            union.update(node.candidates())
+
+        return union
+
+    def describe(self) -> str:
+        return 'Union'
+
+
+class FullScan(Node):
+    """
+    Every object of the source, in order.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.estimate = len(source)
+
+    def rows(self) -> Iterator:
+        return iter(self.source)
+
+    def describe(self) -> str:
+        return 'FullScan'
+
+
+class IndexScan(Node):
+    """
+    Candidates found in the indexes, in store order.
+    """
+    def __init__(self, node: Node, store):
+        self.node = node
+        self.store = store
+        self.estimate = node.estimate
+
+    @property
+    def children(self) -> tuple:
+        return (self.node,)
+
+    def rows(self) -> Iterator:
+        return iter(self.store.ordered(self.node.candidates()))
+
+    def describe(self) -> str:
+        return 'IndexScan'
+
+
+class ComplementScan(Node):
+    """
+    Objects of the source not matching q, skipping those which do by their
+    pk, as found by evaluating q on the candidates of its index lookups only.
+    """
+    def __init__(self, node: Node, q, source):
+        self.node = node
+        self.q = q
+        self.source = source
+        self.estimate = max(len(source) - node.estimate, 0)
+
+    @property
+    def children(self) -> tuple:
+        return (self.node,)
+
+    def rows(self) -> Iterator:
+        matches = set(
+            map(id, filter(self.q.comparator, self.node.candidates().values()))
+        )
+
+        return (obj for obj in self.source if id(obj) not in matches)
+
+    def describe(self) -> str:
+        return 'ComplementScan excluding {!r}'.format(self.q)
+
+
+class IndexOrderScan(Node):
+    """
+    Every object of the store, in the order of a SortedIndex.
+    """
+    def __init__(self, index, descending: bool):
+        self.index = index
+        self.descending = descending
+        self.estimate = len(index)
+
+    def rows(self) -> Iterator:
+        if self.descending:
+            return self.index.descending()
+        else:
+            return self.index.ascending()
+
+    def describe(self) -> str:
+        return 'IndexOrderScan using {!r}{}'.format(
+            self.index, ' descending' if self.descending else ''
+        )
+
+
+class ColumnScan(Node):
+    """
+    Objects of the store selected by evaluating q as masks over the columnar
+    mirror of its fields, in store order, or sorted by the column of the
+    order_by operation ordering if set. Objects which the masks can't decide
+    upon are handed over to the comparator.
+    """
+    def __init__(self, store, q, estimate: float):
+        self.store = store
+        self.q = q
+        self.estimate = estimate
+        self.ordering = None
+
+    def rows(self) -> Iterator:
+        positions, known = self.store.columns.select(self.q)
+        objects = self.store.take(positions)
+        predicate = self.q.comparator
+
+        if self.ordering is None:
+            if all(known):
+                return iter(objects)
+
+            return (
+                obj for obj, is_known in zip(objects, known)
+                if is_known or predicate(obj)
+            )
+
+        if not all(known):
+            matched = [
+                (position, obj)
+                for position, obj, is_known in zip(positions, objects, known)
+                if is_known or predicate(obj)
+            ]
+            positions = [position for position, _ in matched]
+            objects = [obj for _, obj in matched]
+
+        (field,) = self.ordering[1]
+        order = self.store.columns.order(
+            positions, field.lstrip('-'), field.startswith('-')
+        )
+
+        if order is None:
+            return iter(sorted(objects, key=self.ordering[2]))
+
+        return iter(self.store.take(order.tolist()))
+
+    def describe(self) -> str:
+        if self.ordering is None:
+            return 'ColumnScan {!r}'.format(self.q)
+
+        return 'ColumnScan {!r} ordered by {}'.format(
+            self.q, self.ordering[1][0]
+        )
+
+
+def _top_sort(ordering: list):
+    """
+    Returns the last sort of the ordering operations, along with whether it's
+    reversed, if no other operation follows it.
+    """
+    if ordering and ordering[-1][0] == 'order_by':
+        return ordering[-1], False
+    elif len(ordering) > 1 and ordering[-2][0] == 'order_by':
+        return ordering[-2], True
+
+    return None
+
+
+def _top(rows: Iterable, n: int, key, descending: bool = False) -> list:
+    """
+    Returns the first n rows sorted by key, or the last n in reverse order,
+    the same as slicing sorted(rows, key=key) or its reversal would.
+    """
+    if not descending:
+        return heapq.nsmallest(n, rows, key=key)
+
+    # Rows sorting equal are reversed too, the latest coming first
+    return [
+        row for _, row in heapq.nlargest(
+            n, enumerate(rows), key=lambda item: (key(item[1]), item[0])
+        )
+    ]
+
+
+def _chunks(rows: list, size: int) -> Iterator:
+    """
+    Yields the consecutive slices of rows of up to size rows.
+    """
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _leaves(q) -> int:
+    if q.is_leaf:
+        return 1
+
+    return sum(map(_leaves, q.children))
+
+
+class Plan(object):
+    """
+    Rows of a scan node, filtered by the residual lookups, ordered by the
+    ordering operations which the scan didn't take care of, and sliced by
+    limits.
+
+    When the rows are sorted and then sliced, the top rows are picked out
+    with a bounded heap instead of sorting all of them, if top is set.
+    """
+    def __init__(self, scan: Node, residual, ordering: list,
+                 limits: tuple = (0, None), top: bool = False):
+        self.scan = scan
+        self.residual = residual
+        self.ordering = ordering
+        self.limits = limits
+        self.top = top and limits[1] is not None and _top_sort(ordering)
+        self.rows_scanned = 0
+
+    def _count(self, rows: Iterable) -> Iterator:
+        for row in rows:
+            self.rows_scanned += 1
+            yield row
+
+    def execute(self, count: bool = False) -> Iterator:
+        rows = self.scan.rows()  # type: Iterable
+
+        if count:
+            rows = self._count(rows)
+
+        if self.residual is not None:
+            rows = filter(self.residual.comparator, rows)
+
+        ordering = self.ordering
+
+        if self.top:
+            ordering = ordering[:ordering.index(self.top[0])]
+
+        for op in ordering:
+            if op[0] == 'order_by':
+                rows = sorted(rows, key=op[2])
+            else:
+                rows = reversed(list(rows))
+
+        start, stop = self.limits
+
+        if self.top:
+            rows = _top(rows, stop, self.top[0][2], descending=self.top[1])
+
+        if start or stop is not None:
+            rows = islice(rows, start, stop)
+
+        return iter(rows)
+
+    async def aexecute(self, chunk_size: int, reading):
+        """
+        Asynchronous execute(), yielding the rows in lists of up to chunk_size
+        rows, and control to the event loop after evaluating the lookups or
+        the ordering on each chunk of rows.
+
+        The rows of the scan are gathered up front, holding reading, the
+        context manager guarding reads of the store, so that changes to the
+        store from then on don't affect them.
+        """
+        with reading:
+            rows = list(self.scan.rows())
+
+        residual = None if self.residual is None else self.residual.comparator
+        start, stop = self.limits
+
+        if not self.ordering:
+            # Matching rows are streamed, until the end of the slice
+            remaining = None if stop is None else stop - start
+
+            for chunk in _chunks(rows, chunk_size):
+                if residual is not None:
+                    chunk = list(filter(residual, chunk))
+
+                if start:
+                    skipped = min(start, len(chunk))
+                    chunk = chunk[skipped:]
+                    start -= skipped
+
+                if remaining is not None:
+                    chunk = chunk[:remaining]
+                    remaining -= len(chunk)
+
+                if chunk:
+                    yield chunk
+
+                if remaining == 0:
+                    return
+
+                await asyncio.sleep(0)
+
+            return
+
+        if residual is not None:
+            matched = []  # type: list
+
+            for chunk in _chunks(rows, chunk_size):
+                matched.extend(filter(residual, chunk))
+                await asyncio.sleep(0)
+
+            rows = matched
+
+        for op in self.ordering:
+            if op[0] == 'order_by':
+                keys = []  # type: list
+
+                for chunk in _chunks(rows, chunk_size):
+                    keys.extend(map(op[2], chunk))
+                    await asyncio.sleep(0)
+
+                # Positions sorted by the keys computed beforehand
+                order = sorted(range(len(rows)), key=keys.__getitem__)
+                rows = [rows[i] for i in order]
+            else:
+                rows.reverse()
+
+        for chunk in _chunks(rows[start:stop], chunk_size):
+            yield chunk
+
+    def explain(self) -> str:
+        """
+        Executes the plan and returns its description, along with the
+        estimated and actual number of rows scanned.
+        """
+        self.rows_scanned = 0
+        returned = sum(1 for _ in self.execute(count=True))
+
+        lines = self.scan.explain()
+
+        if self.residual is not None:
+            lines.append('Filter: {!r}'.format(self.residual))
+
+        for op in self.ordering:
+            if self.top and op is self.top[0]:
+                lines.append('Top {}: {}{}'.format(
+                    self.limits[1], ', '.join(op[1]),
+                    ' reversed' if self.top[1] else ''
+                ))
+                break
+            elif op[0] == 'order_by':
+                lines.append('Sort: {}'.format(', '.join(op[1])))
+            else:
+                lines.append('Reverse')
+
+        if self.limits != (0, None):
+            start, stop = self.limits
+            lines.append('Limit: [{}:{}]'.format(
+                start or '', '' if stop is None else stop
+            ))
+
+        lines.extend([
+            'Estimated rows scanned: {}'.format(int(self.scan.estimate)),
+            'Actual rows scanned: {}'.format(self.rows_scanned),
+            'Rows returned: {}'.format(returned),
+        ])
+
+        return '\n'.join(lines)
+
+
+class Planner(object):
+    """
+    Builds the Plan of a QuerySet, given the objects it draws from and the
+    model store, if these are the objects of the store, along with the paths
+    of ForeignKey fields passed to select_related().
+    """
+    # Costs per row of evaluating the lookups, of fetching a row from an index,
+    # of putting a candidate back into store order, and per comparison when
+    # sorting the rows.
+    FILTER_COST = 1.0
+    LOOKUP_COST = 0.5
+    FETCH_COST = 3.0
+    SORT_COST = 0.25
+    # Cost per row of skipping an object by its pk
+    MEMBERSHIP_COST = 0.5
+    # Costs of evaluating a lookup as a mask, per row and up front, and per
+    # row of gathering the objects selected by a mask.
+    COLUMN_COST = 0.01
+    COLUMN_SETUP_COST = 50
+    GATHER_COST = 0.5
+    # Fraction of the rows a lookup is assumed to match, when no index can
+    # tell.
+    SELECTIVITY = 1 / 3
+    # Fraction of the rows below which the top rows are picked out with a
+    # heap rather than by sorting all rows.
+    TOP_FRACTION = 1 / 16
+
+    def __init__(self, source, store=None, related=()):
+        self.source = source
+        self.store = store
+        self.rows = len(source)
+
+        # Paths of ForeignKey fields, along with every path they go through
+        self.related = set()
+        for path in related:
+            names = path.split('__')
+            self.related.update(
+                '__'.join(names[:i]) for i in range(1, len(names) + 1)
+            )
+
+    def plan(self, where, ordering, limits: tuple = (0, None)) -> Plan:
+        ordering = list(ordering)
+        streamed = None
+
+        if ordering and ordering[0][0] == 'order_by':
+            streamed = self._ordered_by_index(ordering[0][1])
+
+        # (scan, residual lookups) pairs
+        options = [
+            (FullScan(self.source), where)
+        ]  # type: List[Tuple[Node, Any]]
+
+        if self.store is not None and where is not None:
+            if where.negated:
+                node = self._access_path(where.children[0])
+
+                if node is not None:
+                    options.append((
+                        ComplementScan(node, where.children[0], self.source),
+                        None
+                    ))
+            else:
+                node = self._access_path(where)
+
+                if node is not None:
+                    options.append((IndexScan(node, self.store), where))
+
+            columns = self.store.columns
+
+            if columns is not None and columns.narrows(where):
+                options.append((
+                    ColumnScan(
+                        self.store, where, self.rows * self.SELECTIVITY
+                    ),
+                    None
+                ))
+
+        scan, residual = min(
+            options, key=lambda option: self._cost(option[0], streamed)
+        )
+
+        if streamed is not None and isinstance(scan, FullScan):
+            scan = streamed
+            ordering.pop(0)
+        elif isinstance(scan, ColumnScan) and ordering and \
+                self._ordered_by_column(ordering[0]):
+            scan.ordering = ordering.pop(0)
+
+        # A bounded heap beats sorting all rows only if few are kept
+        stop = limits[1]
+        top = stop is not None and stop <= scan.estimate * self.TOP_FRACTION
+
+        return Plan(scan, residual, ordering, limits, top)
+
+    def _cost(self, node: Node, streamed: Maybe[Node] = None) -> float:
+        """
+        Returns the estimated cost of filtering the rows of a scan node, and
+        of sorting them if they could have been streamed in order instead.
+        """
+        rows = node.estimate
+
+        if isinstance(node, FullScan):
+            return rows * self.FILTER_COST
+
+        elif isinstance(node, ComplementScan):
+            cost = node.fetched * self.LOOKUP_COST + \
+                node.node.estimate * self.FILTER_COST + \
+                self.rows * self.MEMBERSHIP_COST
+
+        elif isinstance(node, ColumnScan):
+            cost = self.COLUMN_SETUP_COST + \
+                self.rows * self.COLUMN_COST * _leaves(node.q) + \
+                rows * self.GATHER_COST
+
+        else:
+            cost = node.fetched * self.LOOKUP_COST + \
+                rows * (self.FETCH_COST + self.FILTER_COST)
+
+        if streamed is not None:
+            cost += rows * math.log2(rows + 1) * self.SORT_COST
+
+        return cost
+
+    def _access_path(self, q) -> Maybe[Node]:
+        """
+        Returns the cheapest node yielding candidates for q out of the store
+        indexes, or None if q can't be answered by them.
+        """
+        if q.is_leaf:
+            best = None  # type: Maybe[Node]
+
+            for index in self.store.indexes_on(q.attr):
+                estimate = index.estimate(q.verb, q.value)
+
+                if estimate is not None and \
+                        (best is None or estimate < best.estimate):
+                    best = IndexLookup(index, q, estimate)
+
+            if best is None and self.related:
+                best = self._related_lookup(q)
+
+            return best
+
+        elif q.connector == q.AND:
+            nodes = sorted(
+                filter(None, map(self._access_path, q.children)),
+                key=lambda node: node.estimate
+            )
+
+            if not nodes:
+                return None
+
+            chosen, estimate = [nodes[0]], nodes[0].estimate
+
+            for other in nodes[1:]:
+                # Assuming independent lookups, intersecting the candidates
+                # of another index saves fetching and evaluating the lookups
+                # on the rows it rules out, at the cost of looking it up.
+                narrowed = estimate * other.estimate / max(self.rows, 1)
+                saved = (estimate - narrowed) * \
+                    (self.FETCH_COST + self.FILTER_COST)
+
+                if other.fetched * self.LOOKUP_COST < saved:
+                    chosen.append(other)
+                    estimate = narrowed
+
+            if len(chosen) == 1:
+                return chosen[0]
+
+            return Intersection(chosen, estimate)
+
+        elif q.connector == q.OR:
+            nodes = []
+
+            for child in q.children:
+                node = self._access_path(child)
+
+                if node is None:
+                    return None
+
+                nodes.append(node)
+
+            return Union(
+                nodes, min(sum(node.estimate for node in nodes), self.rows)
+            )
+
+        # Negated, or empty Q
+        return None
+
+    def _related_lookup(self, q) -> Maybe[Node]:
+        """
+        Returns a node yielding candidates for a lookup through the longest
+        path of selected ForeignKey fields it follows, if any.
+        """
+        names = q.attr.split('__')
+        paths = [
+            '__'.join(names[:i]) for i in range(len(names) - 1, 0, -1)
+        ]
+        path = next((path for path in paths if path in self.related), None)
+
+        if path is None:
+            return None
+
+        indexes = self.store.indexes_on(names[0] + '__pk')
+
+        if not indexes:
+            return None
+
+        index = indexes[0]
+        # Assuming each related object holds a distinct value
+        per_value = len(index) / max(index.distinct, 1)
+
+        if q.verb in (None, 'exact'):
+            estimate = per_value
+        elif q.verb == 'in' and hasattr(q.value, '__len__'):
+            estimate = min(per_value * len(q.value), len(index))
+        else:
+            estimate = len(index) * self.SELECTIVITY
+
+        return RelatedLookup(index, path, q, estimate)
+
+    def _ordered_by_column(self, op) -> bool:
+        """
+        Whether the rows of a ColumnScan may be sorted as op, an order_by
+        operation, from the columns.
+        """
+        fields = op[1] if op[0] == 'order_by' else ()  # type: tuple
+
+        if len(fields) != 1:
+            return False
+
+        field = fields[0]
+        return self.store.columns.sortable(
+            field.lstrip('-'), field.startswith('-')
+        )
+
+    def _ordered_by_index(self, fields) -> Maybe[Node]:
+        """
+        Returns a node streaming the store objects in the order of fields
+        from a SortedIndex, or None if no index can provide that order.
+        """
+        if self.store is None or len(fields) != 1:
+            return None
+
+        index = self.store.sorted_index(fields[0].lstrip('-'))
+
+        if index is None or not index.orderable:
+            return None
+
+        return IndexOrderScan(index, descending=fields[0].startswith('-'))
@@ -1,23 +1,503 @@
+import asyncio
 import random
 from collections import OrderedDict
-from itertools import chain
-from typing import Tuple, Optional as Maybe, Dict, Any, Iterable
+from functools import partial, wraps
+from itertools import chain, islice
+from operator import attrgetter
+from typing import Tuple, Optional as Maybe, Dict, Any, Iterable, Iterator
+
+import attr
 
 from reobject.exceptions import DoesNotExist, MultipleObjectsReturned
-from reobject.query.parser import Q
-from reobject.utils import cmp, flatmap
+from reobject.models.lock import UNLOCKED
+from reobject.query.aggregates import ALL, Aggregate
+from reobject.query.cache import _query_key
+from reobject.query.parser import Q, _Q
+from reobject.query.planner import Plan, Planner, _chunks
+from reobject.utils import cmp, resolve_attr
 
 from ..types import LookupParams, Fields
 
+# Number of matches after which get() stops looking for more
+MAX_GET_RESULTS = 21
+
+# Number of objects after which asynchronous lookups yield control to the
+# event loop
+ASYNC_CHUNK_SIZE = 1000
+
+_END = object()  # type: Any
+
+
+def _aggregates(*args, **kwargs) -> OrderedDict:
+    """
+    Returns the aggregates passed to aggregate() or annotate(), keyed by
+    their alias.
+    """
+    aggregates = OrderedDict(
+        (aggregate.default_alias, aggregate) for aggregate in args
+    )
+    aggregates.update(kwargs)
+
+    if not aggregates:
+        raise TypeError('At least one aggregate expression is required.')
+
+    for alias, aggregate in aggregates.items():
+        if not isinstance(aggregate, Aggregate):
+            raise TypeError(
+                '{} is not an aggregate expression'.format(alias)
+            )
+
+    return aggregates
+
+
+def _fold(objects: Iterable, aggregates: list, key,
+          groups: Maybe[OrderedDict] = None) -> OrderedDict:
+    """
+    Folds the objects into the states of each aggregate, in a single pass,
+    per group of objects sharing the same key. Folding carries on from the
+    states of groups, if given.
+    """
+    if groups is None:
+        groups = OrderedDict()  # key -> [state, ...]
+
+    steps = [
+        (i, _getter(aggregate.field), aggregate.step)
+        for i, aggregate in enumerate(aggregates)
+    ]
+
+    for obj in objects:
+        group = key(obj)
+        states = groups.get(group)
+
+        if states is None:
+            states = groups[group] = [
+                aggregate.start() for aggregate in aggregates
+            ]
+
+        for i, getter, step in steps:
+            value = getter(obj)
+
+            if value is not None:
+                states[i] = step(states[i], value)
+
+    return groups
+
+
+def _no_key(obj) -> tuple:
+    return ()
+
+
+def _finish(aggregates: list, groups: OrderedDict) -> list:
+    """
+    Returns the result of each aggregate, folded into groups as a whole.
+    """
+    states = groups.get((), [aggregate.start() for aggregate in aggregates])
+
+    return [
+        aggregate.finish(state)
+        for aggregate, state in zip(aggregates, states)
+    ]
+
+
+def _sliced_limits(limits: tuple, start: Maybe[int],
+                   stop: Maybe[int]) -> tuple:
+    """
+    Returns the limits of a slice taken out of a QuerySet already sliced by
+    limits.
+    """
+    offset, end = limits
+    start = offset + (start or 0)
+    stop = None if stop is None else offset + stop
+
+    if end is not None:
+        stop = end if stop is None else min(stop, end)
+
+    if stop is not None:
+        start = min(start, stop)
+
+    return start, stop
+
+
+def _getter(field: str):
+    """
+    Returns a function getting the value of field from a model object, or
+    from a row such as those of values().
+    """
+    if field == ALL:
+        return lambda obj: obj
+    elif '__' in field or field.startswith('-'):
+        return partial(resolve_attr, attr=field)
+
+    get = attrgetter(field)
+
+    def getter(obj):
+        return obj.get(field) if type(obj) is dict else get(obj)
+
+    return getter
+
+
+def _foreign_key_path(model, path: str) -> None:
+    """
+    Raises ValueError unless path follows ForeignKey fields from model.
+    """
+    for name in path.split('__'):
+        field = getattr(attr.fields(model), name, None) \
+            if attr.has(model) else None
+
+        if field is None or not field.metadata.get('related'):
+            raise ValueError(
+                'Invalid field name given in select_related: {!r}. Choices '
+                'are ForeignKey fields.'.format(path)
+            )
+
+        model = field.metadata['related']['target']
+
+
+def _related_descriptor(model, name: str):
+    """
+    Returns the descriptor of the related manager of model named name.
+    """
+    for klass in model.__mro__:
+        descriptor = klass.__dict__.get(name)
+
+        if hasattr(descriptor, 'prefetch'):
+            return descriptor
+
+    raise AttributeError(
+        "Cannot find {!r} on {} object, {!r} is an invalid parameter to "
+        "prefetch_related()".format(name, model.__name__, name)
+    )
+
+
+def _fills(method):
+    """
+    Wraps the list method so that it acts on the results, looked up first.
+    """
+    @wraps(method)
+    def fill_first(self, *args, **kwargs):
+        return method(self._fetch_all(), *args, **kwargs)
+
+    return fill_first
+
+
+def _fills_both(method):
+    """
+    Wraps the list method taking another list so that it acts on the
+    results, and those of the other list if it's a QuerySet, looked up first.
+    """
+    @wraps(method)
+    def fill_both(self, other):
+        if isinstance(other, QuerySet):
+            other._fetch_all()
+
+        return method(self._fetch_all(), other)
+
+    return fill_both
+
 
 class QuerySet(list):
-    def __init__(self, *args, model, **kwargs):
-        super(QuerySet, self).__init__(*args, **kwargs)
+    """
+    Lazy, chainable collection of model objects.
+
+    Methods such as filter(), exclude(), order_by(), reverse() and values()
+    only record the operation on a new QuerySet. Objects are looked up once
+    the QuerySet is iterated over, indexed, or its length or truth value is
+    requested, after which the QuerySet holds the results as a list does,
+    and can be used as one.
+
+    Consecutive filters are fused into a single pass over the objects.
+    Filters following values() or values_list() apply to the rows instead.
+
+    QuerySets drawing their objects from a synchronized store hold its lock
+    for reading while they look them up.
+    """
+    def __init__(self, *args, model, store=None):
         self.model = model
 
+        # Set only while the QuerySet draws its objects from the model store,
+        # which makes the store indexes usable to answer lookups.
+        self._store = store
+        self._source = store if store is not None else list(*args)
+
+        self._where = None  # type: Maybe[_Q]
+        self._ordering = ()  # ('order_by', fields, key) or ('reverse',) ops
+        self._projection = None  # ('values' | 'values_list', fields, flat)
+        self._annotations = None  # type: Maybe[OrderedDict]
+        self._limits = (0, None)  # (start, stop) of a slice of the results
+        # Ordering ops on the rows of an annotated QuerySet
+        self._row_ordering = ()
+        self._related = ()  # paths of ForeignKey fields to select_related()
+        self._prefetch_lookups = ()  # names of related managers to prefetch
+        self._filled = False  # whether the list holds the results
+
+    def _clone(self) -> 'QuerySet':
+        # Copying the QuerySet as a list would look up its results
+        clone = type(self).__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone._filled = False
+        return clone
+
+    def _reading(self):
+        """
+        Returns the context manager guarding reads of the store the objects
+        are drawn from.
+        """
+        return UNLOCKED if self._store is None else self._store.reading()
+
+    def _fetch_all(self) -> 'QuerySet':
+        """
+        Fills the list with the results unless it holds them already, and
+        returns the QuerySet.
+        """
+        if not self._filled:
+            with self._reading():
+                self._fill(self._cached_results())
+
+            if self._prefetch_lookups and self._projection is None:
+                self._prefetch_related_objects()
+
+        return self
+
+    def _fill(self, results: list) -> None:
+        list.__init__(self, results)
+        self._filled = True
+
+    def _cached_results(self) -> list:
+        """
+        Returns the results of the QuerySet, served from the cache set on the
+        store if they're cached there and still current, or looked up and
+        cached otherwise.
+        """
+        cache = None if self._store is None else self._store.cache
+        entry = None if cache is None else _query_key(self)
+
+        if cache is None or entry is None:
+            return list(self._iterator())
+
+        key, models = entry
+        tag = tuple(model.objects.store.version for model in models)
+        results = cache.get(key, tag)
+
+        if results is None:
+            results = list(self._iterator())
+            cache.put(key, tag, results)
+
+        return results
+
+    def _prefetch_related_objects(self) -> None:
+        for name in self._prefetch_lookups:
+            _related_descriptor(self.model, name).prefetch(self)
+
+    def _iterator(self, ordered: bool = True) -> Iterator:
+        """
+        Yields the results of the QuerySet, without caching them.
+        """
+        return self._project(self._objects(ordered))
+
+    def _objects(self, ordered: bool = True) -> Iterator:
+        """
+        Yields the model objects matched by the QuerySet, in order unless
+        ordered is False.
+        """
+        return self._plan(ordered).execute()
+
+    def _plan(self, ordered: bool = True) -> Plan:
+        # Slices of an annotated QuerySet apply to its rows instead
+        limits = self._limits if self._annotations is None else (0, None)
+
+        if limits != (0, None):
+            # Which objects are in the slice depends on the order
+            ordered = True
+
+        return Planner(self._source, self._store, self._related).plan(
+            self._where, self._ordering if ordered else (), limits
+        )
+
+    def _aobjects(self, ordered: bool = True,
+                  chunk_size: int = ASYNC_CHUNK_SIZE):
+        """
+        Asynchronous _objects(), yielding the model objects in lists of up to
+        chunk_size objects.
+        """
+        return self._plan(ordered).aexecute(chunk_size, self._reading())
+
+    async def _achunks(self, ordered: bool = True,
+                       chunk_size: int = ASYNC_CHUNK_SIZE):
+        """
+        Asynchronous _iterator(), yielding the results in lists of up to
+        chunk_size results.
+        """
+        if self._filled:
+            for chunk in _chunks(self, chunk_size):
+                yield chunk
+
+            return
+
+        chunks = self._aobjects(ordered, chunk_size)
+
+        if self._annotations is not None or \
+                self._prefetch_lookups and self._projection is None:
+            # Rows depend on all the objects at once
+            objects = []
+
+            async for chunk in chunks:
+                objects.extend(chunk)
+
+            if self._projection is None:
+                for name in self._prefetch_lookups:
+                    _related_descriptor(self.model, name).prefetch(objects)
+            else:
+                objects = list(self._project(iter(objects)))
+
+            for chunk in _chunks(objects, chunk_size):
+                yield chunk
+
+            return
+
+        projecting = self
+
+        async for chunk in chunks:
+            if self._projection is not None:
+                kind, fields, flat = projecting._projection
+
+                if not fields:
+                    # Fields of the first object, as _project() does
+                    projecting = self._clone()
+                    projecting._projection = (kind, chunk[0]._attrs, flat)
+
+                chunk = list(projecting._project(iter(chunk)))
+
+            yield chunk
+
+    @property
+    def _sliced(self) -> bool:
+        return self._limits != (0, None)
+
+    def _check_unsliced(self, action: str) -> None:
+        if self._sliced:
+            raise TypeError(
+                'Cannot {} a query once a slice has been taken.'.format(action)
+            )
+
+    def _project(self, objects: Iterator) -> Iterator:
+        if self._projection is None:
+            return objects
+
+        kind, fields, flat = self._projection
+
+        if not fields:
+            first = next(objects, _END)
+
+            if first is _END:
+                return iter(())
+
+            fields = first._attrs
+            objects = chain((first,), objects)
+
+        if self._annotations is not None:
+            return self._annotate(objects, kind, fields, self._annotations)
+
+        rows = map(cmp(*fields), objects)
+
+        if kind == 'values':
+            return (dict(zip(fields, row)) for row in rows)
+        elif flat:
+            return chain.from_iterable(rows)
+        else:
+            return rows
+
+    def _sorted_index(self, field_name: str):
+        """
+        Returns the SortedIndex on field_name, if this QuerySet draws its
+        objects from the store and one was declared.
+        """
+        if self._store is None:
+            return None
+
+        return self._store.sorted_index(field_name)
+
+    @property
+    def _spans_store(self) -> bool:
+        """
+        Whether the QuerySet yields every object of the store, in store order.
+        """
+        return self._store is not None and self._where is None \
+            and not self._ordering and not self._sliced
+
     @property
     def _attrs(self):
-        return self[0]._attrs if self.exists() else set()
+        obj = self.first()
+        return obj._attrs if obj is not None else set()
+
+    def __aiter__(self):
+        return self.aiterator()
+
+    def __bool__(self) -> bool:
+        return self.exists()
+
+    # The list is only filled once the results are first needed
+
+    __iter__ = _fills(list.__iter__)
+    __len__ = _fills(list.__len__)
+    __contains__ = _fills(list.__contains__)
+    __reversed__ = _fills(list.__reversed__)
+    __repr__ = _fills(list.__repr__)
+
+    __eq__ = _fills_both(list.__eq__)
+    __ne__ = _fills_both(list.__ne__)
+    __lt__ = _fills_both(list.__lt__)
+    __le__ = _fills_both(list.__le__)
+    __gt__ = _fills_both(list.__gt__)
+    __ge__ = _fills_both(list.__ge__)
+    __add__ = _fills_both(list.__add__)
+
+    __mul__ = _fills(list.__mul__)
+    __rmul__ = _fills(list.__rmul__)
+    __iadd__ = _fills(list.__iadd__)
+    __imul__ = _fills(list.__imul__)
+    __setitem__ = _fills(list.__setitem__)
+    __delitem__ = _fills(list.__delitem__)
+    append = _fills(list.append)
+    extend = _fills(list.extend)
+    insert = _fills(list.insert)
+    pop = _fills(list.pop)
+    remove = _fills(list.remove)
+    clear = _fills(list.clear)
+    sort = _fills(list.sort)
+    index = _fills(list.index)
+    copy = _fills(list.copy)
+
+    def __radd__(self, other):
+        if not isinstance(other, list):
+            return NotImplemented
+
+        return list.__add__(other, self._fetch_all())
+
+    def __getitem__(self, k):
+        if self._filled:
+            return list.__getitem__(self, k)
+
+        if isinstance(k, slice):
+            if (k.start or 0) < 0 or (k.stop or 0) < 0 \
+                    or k.step not in (None, 1):
+                return type(self)(
+                    list.__getitem__(self._fetch_all(), k), model=self.model
+                )
+
+            clone = self._clone()
+            clone._limits = _sliced_limits(self._limits, k.start, k.stop)
+            return clone
+
+        if k < 0:
+            return self._fetch_all()[k]
+
+        with self._reading():
+            result = list(self[k:k + 1]._iterator())
+
+        if not result:
+            raise IndexError('QuerySet index out of range')
+
+        return result[0]
 
     def __or__(self, other: 'QuerySet') -> 'QuerySet':
         return type(self)(
@@ -25,15 +505,200 @@ class QuerySet(list):
             model=self.model
         ).distinct('id')
 
+    def aggregate(self, *args: Tuple[Aggregate, ...],
+                  **kwargs: Aggregate) -> Dict[str, Any]:
+        """
+        Returns a dictionary of the aggregates computed over the objects of
+        the QuerySet, keyed by their alias. Aggregates passed as positional
+        arguments are keyed by their default alias, e.g. price__sum.
+
+        Every aggregate is computed in a single pass over the objects, or
+        from the columns of their fields if possible.
+        """
+        aggregates = _aggregates(*args, **kwargs)
+
+        with self._reading():
+            results = self._aggregate_columns(list(aggregates.values()))
+
+            if results is None:
+                results = self._aggregate_objects(list(aggregates.values()))
+
+        return dict(zip(aggregates, results))
+
+    async def aaggregate(self, *args: Tuple[Aggregate, ...],
+                         **kwargs: Aggregate) -> Dict[str, Any]:
+        """
+        Asynchronous aggregate(), yielding control to the event loop every
+        ASYNC_CHUNK_SIZE objects it goes through.
+        """
+        aggregates = _aggregates(*args, **kwargs)
+        values = list(aggregates.values())
+
+        with self._reading():
+            results = self._aggregate_columns(values)
+
+        if results is None and self._filled and self._projection is None:
+            results = self._aggregate_objects(values)
+
+        if results is None:
+            groups = OrderedDict()  # type: OrderedDict
+
+            async for chunk in self._aobjects(ordered=False):
+                _fold(chunk, values, _no_key, groups)
+                await asyncio.sleep(0)
+
+            results = _finish(values, groups)
+
+        return dict(zip(aggregates, results))
+
+    def _aggregate_columns(self, aggregates: list) -> Maybe[list]:
+        # The columns span every object matched, regardless of a slice
+        if self._filled or self._store is None \
+                or self._store.columns is None or self._sliced:
+            return None
+
+        return self._store.columns.aggregate(self._where, aggregates)
+
+    def _aggregate_objects(self, aggregates: list) -> list:
+        # The rows of values() are aggregated over their objects, whether
+        # they were looked up or not
+        if self._filled and self._projection is None:
+            objects = iter(self)
+        else:
+            objects = self._objects(ordered=False)
+
+        return _finish(aggregates, _fold(objects, aggregates, key=_no_key))
+
+    def _annotate(self, objects: Iterator, kind: str, fields,
+                  annotations: OrderedDict) -> Iterator:
+        """
+        Yields a row per group of objects sharing the same values of fields,
+        along with the annotations computed over the group.
+        """
+        aggregates = list(annotations.values())
+        names = tuple(fields) + tuple(annotations)
+        groups = _fold(objects, aggregates, key=cmp(*fields))
+
+        rows = (
+            dict(zip(names, group + tuple(
+                aggregate.finish(state)
+                for aggregate, state in zip(aggregates, states)
+            )))
+            for group, states in groups.items()
+        )  # type: Iterable[dict]
+
+        for op in self._row_ordering:
+            if op[0] == 'order_by':
+                rows = sorted(rows, key=op[2])
+            else:
+                rows = reversed(list(rows))
+
+        if self._sliced:
+            rows = islice(rows, *self._limits)
+
+        if kind == 'values':
+            yield from rows
+        else:
+            for row in rows:
+                yield tuple(row[name] for name in names)
+
+    def annotate(self, *args: Tuple[Aggregate, ...],
+                 **kwargs: Aggregate) -> 'QuerySet':
+        """
+        Groups the objects by the fields passed to values() or values_list(),
+        and adds the aggregates computed over each group to its row.
+
+        Rows are ordered by the first object of each group, and can then be
+        ordered by their fields or annotations with order_by().
+        """
+        if self._projection is None or not self._projection[1]:
+            raise TypeError(
+                'annotate() must follow values() or values_list() with the '
+                'fields to group the objects by.'
+            )
+
+        if self._projection[2]:
+            raise TypeError('annotate() is not valid on a flat values_list.')
+
+        annotations = _aggregates(*args, **kwargs)
+
+        for alias in annotations:
+            if alias in self._projection[1]:
+                raise ValueError(
+                    'The annotation {} conflicts with a field.'.format(alias)
+                )
+
+        clone = self._clone()
+        clone._annotations = OrderedDict(self._annotations or ())
+        clone._annotations.update(annotations)
+        return clone
+
+    @property
+    def _counted(self) -> bool:
+        """
+        Whether count() is answered without looking up the objects.
+        """
+        return self._filled or self._annotations is None \
+            and self._store is not None and self._where is None \
+            and not self._sliced
+
     def count(self) -> int:  # type: ignore
-        return len(self)
+        if self._filled:
+            return len(self)
+
+        if self._annotations is not None:
+            return len(self._fetch_all())
+
+        if self._counted:
+            return len(self._store)
+
+        with self._reading():
+            return sum(1 for _ in self._objects(ordered=False))
+
+    async def acount(self) -> int:
+        """
+        Asynchronous count(), yielding control to the event loop every
+        ASYNC_CHUNK_SIZE objects it goes through.
+        """
+        if self._counted:
+            return self.count()
+
+        if self._annotations is not None:
+            chunks = self._achunks(ordered=False)
+        else:
+            chunks = self._aobjects(ordered=False)
+
+        count = 0
+
+        async for chunk in chunks:
+            count += len(chunk)
+            await asyncio.sleep(0)
+
+        return count
 
     def delete(self) -> Tuple[int, dict]:
-        _len = self.count()
-        _type = self.model.__name__
+        self._check_unsliced('delete')
+
+        # Imported here, the models module importing this one
+        from reobject.models.model import Model
+
+        objects, overriding = [], []
+
+        with self._reading():
+            for obj in self._objects(ordered=False):
+                if type(obj).delete is Model.delete:
+                    objects.append(obj)
+                else:
+                    # Deleted one by one through the delete() overriding it
+                    overriding.append(obj)
+
+        _len = self.model.objects._delete_many(objects)
 
-        for item in self:
-            item.delete()
+        for obj in overriding:
+            obj.delete()
+
+        _len += len(overriding)
+        _type = self.model.__name__
 
         return _len, {_type: _len}
 
@@ -43,70 +708,123 @@ class QuerySet(list):
 
         meta = [
             (cmp(*fields)(obj), obj)
-            for obj in self.reverse()
+            for obj in reversed(self)
         ]
 
         return type(self)(
-            OrderedDict(meta).values(),
+            reversed(list(OrderedDict(meta).values())),
             model=self.model
-        ).reverse()
+        )
 
     def earliest(self, field_name: str = 'created') -> Maybe['Model']:
-        try:
-            obj = self.filter(
-                **{field_name + '__isnone': False}
-            ).order_by(
-                field_name
-            )[0]
-        except IndexError:
-            return None
-        else:
-            return obj
+        if self._spans_store:
+            index = self._sorted_index(field_name)
 
-    def exclude(self, *args: Tuple[Q, ...], **kwargs: LookupParams) -> 'QuerySet':
-        q = ~(Q.from_Qs(*args) & Q(**kwargs))
+            if index is not None and index.comparable:
+                with self._reading():
+                    return index.first()
 
-        return type(self)(
-            filter(q.comparator, self),
-            model=self.model
-        )
+        return self.filter(
+            **{field_name + '__isnone': False}
+        ).order_by(
+            field_name
+        ).first()
+
+    def exclude(self, *args: Tuple[Q, ...], **kwargs: LookupParams) -> 'QuerySet':
+        return self._filter(~(Q.from_Qs(*args) & Q(**kwargs)))
 
     def exists(self) -> bool:
-        return bool(self)
+        if self._filled:
+            return list.__len__(self) > 0
+
+        with self._reading():
+            return next(self._objects(ordered=False), _END) is not _END
+
+    def explain(self) -> str:
+        """
+        Looks up the objects matched by the QuerySet and returns a description
+        of the plan used to do so, along with the estimated and actual number
+        of rows it scanned.
+        """
+        with self._reading():
+            return self._plan().explain()
 
     def filter(self, *args: Tuple[Q, ...], **kwargs: LookupParams) -> 'QuerySet':
-        q = Q.from_Qs(*args) & Q(**kwargs)
+        return self._filter(Q.from_Qs(*args) & Q(**kwargs))
 
-        return type(self)(
-            filter(q.comparator, self),
-            model=self.model
-        )
+    def _filter(self, q: _Q) -> 'QuerySet':
+        if self._projection is not None:
+            # Rows can't be looked up through the store
+            return type(self)(self, model=self.model)._filter(q)
+
+        self._check_unsliced('filter')
+
+        clone = self._clone()
+        clone._where = q if self._where is None else self._where & q
+        return clone
 
     def first(self) -> Maybe['Model']:  # type: ignore
-        try:
-            obj = self[0]
-        except IndexError:
-            return None
-        else:
-            return obj
+        if self._filled:
+            return self[0] if self else None
+
+        with self._reading():
+            return next(self[:1]._iterator(), None)
 
     def get(self, *args: Tuple[Q, ...], **kwargs: LookupParams):
-        result_set = self.filter(*args, **kwargs)
+        clone = self.filter(*args, **kwargs)
+
+        with self._reading():
+            result_set = list(
+                islice(clone._iterator(ordered=False), MAX_GET_RESULTS)
+            )
+
+        return self._single(result_set)
+
+    async def aget(self, *args: Tuple[Q, ...], **kwargs: LookupParams):
+        """
+        Asynchronous get(), yielding control to the event loop every
+        ASYNC_CHUNK_SIZE objects it goes through.
+        """
+        clone = self.filter(*args, **kwargs)
+        chunks = clone._achunks(ordered=False)
+        result_set = []
+
+        try:
+            async for chunk in chunks:
+                result_set.extend(chunk)
+
+                if len(result_set) >= MAX_GET_RESULTS:
+                    break
+
+                await asyncio.sleep(0)
+        finally:
+            await chunks.aclose()
 
-        if len(result_set) == 0:
+        return self._single(result_set[:MAX_GET_RESULTS])
+
+    def _single(self, result_set: list):
+        """
+        Returns the only result looked up by get(), or raises DoesNotExist or
+        MultipleObjectsReturned.
+        """
+        num = len(result_set)
+
+        if num == 0:
             raise DoesNotExist(
                 '{model} object matching query does not exist.'.format(
                     model=self.model.__name__
                 )
             )
 
-        elif len(result_set) == 1:
+        elif num == 1:
             return result_set[0]
         else:
             raise MultipleObjectsReturned(
                 'get() returned more than one {model} object '
                 '-- it returned {num}!'.format(
-                    model=self.model.__name__, num=len(result_set)
+                    model=self.model.__name__,
+                    num=num if num < MAX_GET_RESULTS
+                    else 'more than {}'.format(MAX_GET_RESULTS - 1)
                 )
             )
 
@@ -124,25 +842,48 @@ class QuerySet(list):
         else:
             return obj, False
 
+    async def aiterator(self, chunk_size: int = ASYNC_CHUNK_SIZE):
+        """
+        Asynchronous iterator over the results, as used by async for, which
+        yields control to the event loop every chunk_size objects it goes
+        through. Results aren't cached.
+
+        Objects are gathered from the store as the iteration starts, and
+        are unaffected by objects added or deleted meanwhile.
+        """
+        async for chunk in self._achunks(chunk_size=chunk_size):
+            for result in chunk:
+                yield result
+
+            await asyncio.sleep(0)
+
     def last(self) -> Maybe['Model']:  # type: ignore
-        try:
-            obj = self[-1]
-        except IndexError:
-            return None
-        else:
-            return obj
+        if not self._filled and self._spans_store \
+                and self._projection is None:
+            with self._reading():
+                return self._store.last()
+
+        if not self._filled and self._ordering and not self._sliced:
+            # The last object of the ordering comes first once reversed,
+            # sparing a full sort of the objects.
+            return self.reverse().first()
+
+        results = self._fetch_all()
+        return results[-1] if results else None
 
     def latest(self, field_name: str = 'created') -> Maybe['Model']:  # type: ignore
-        try:
-            obj = self.filter(
-                **{field_name + '__isnone': False}
-            ).order_by(
-                field_name
-            )[-1]
-        except IndexError:
-            return None
-        else:
-            return obj
+        if self._spans_store:
+            index = self._sorted_index(field_name)
+
+            if index is not None and index.comparable:
+                with self._reading():
+                    return index.last()
+
+        return self.filter(
+            **{field_name + '__isnone': False}
+        ).order_by(
+            field_name
+        ).last()
 
     def map(self, func) -> Iterable:
         if not callable(func):
@@ -155,46 +896,99 @@ class QuerySet(list):
     def none(self) -> 'EmptyQuerySet':
         return EmptyQuerySet(model=self.model)
 
-    def order_by(self, *fields: Fields):
+    def order_by(self, *fields: Fields) -> 'QuerySet':
         if not fields:
             raise AttributeError
 
-        return type(self)(
-            sorted(self, key=cmp(*fields)),
-            model=self.model
-        )
+        self._check_unsliced('reorder')
+
+        clone = self._clone()
+        op = ('order_by', fields, cmp(*fields))
+
+        if self._annotations is not None:
+            clone._row_ordering += (op,)
+        else:
+            clone._ordering += (op,)
+
+        return clone
+
+    def prefetch_related(self, *lookups: str) -> 'QuerySet':
+        """
+        Looks up the objects of the given related managers, e.g. book_set,
+        for all objects of the QuerySet at once when it's evaluated, and
+        caches them in the related manager of each object until the store
+        of the related model changes.
+
+        Passing None clears the lookups to prefetch.
+        """
+        clone = self._clone()
+
+        if lookups == (None,):
+            clone._prefetch_lookups = ()
+        else:
+            clone._prefetch_lookups = self._prefetch_lookups + lookups
+
+        return clone
 
     def random(self) -> Maybe['Model']:  # type: ignore
         try:
-            obj = random.choice(self)
+            obj = random.choice(self._fetch_all())
         except IndexError:
             return None
         else:
             return obj
 
     def reverse(self) -> 'QuerySet':
-        return type(self)(
-            reversed(self),
-            model=self.model
-        )
+        self._check_unsliced('reverse')
 
-    def values(self, *fields: Fields) -> 'QuerySet':
-        if not fields:
-            fields = self._attrs
+        clone = self._clone()
+        name = '_ordering' if self._annotations is None else '_row_ordering'
+        ordering = getattr(self, name)
 
-        return type(self)(
-            (
-                dict(zip(fields, obj))
-                for obj in map(cmp(*fields), self)
-            ),
-            model=self.model
-        )
+        if ordering and ordering[-1][0] == 'reverse':
+            setattr(clone, name, ordering[:-1])
+        else:
+            setattr(clone, name, ordering + (('reverse',),))
 
-    def values_list(self, *fields: Fields, flat: bool=False) -> 'QuerySet':
-        # TODO: Allow order_by on values_list
+        return clone
+
+    def select_related(self, *fields: str) -> 'QuerySet':
+        """
+        Resolves lookups through the given ForeignKey fields, or chains of
+        them such as author__publisher, once per related object rather than
+        once per object. Without fields, every ForeignKey field of the model
+        is selected.
+
+        Passing None clears the selected fields.
+        """
+        if fields == (None,):
+            clone = self._clone()
+            clone._related = ()
+            return clone
 
         if not fields:
-            fields = self._attrs
+            fields = tuple(
+                field.name for field in attr.fields(self.model)
+                if field.metadata.get('related')
+            )
+
+        for path in fields:
+            _foreign_key_path(self.model, path)
+
+        clone = self._clone()
+        clone._related = self._related + fields
+        return clone
+
+    def values(self, *fields: Fields) -> 'QuerySet':
+        # Validate the field names right away
+        cmp(*fields)
+
+        clone = self._clone()
+        clone._projection = ('values', fields, False)
+        return clone
+
+    def values_list(self, *fields: Fields, flat: bool=False) -> 'QuerySet':
+        cmp(*fields)
 
         if len(fields) > 1 and flat:
             raise TypeError(
@@ -202,13 +996,11 @@ class QuerySet(list):
                 'one field.'
             )
 
-        return type(self)(
-            (flatmap if flat else map)(cmp(*fields), self),
-            model=self.model
-        )
+        clone = self._clone()
+        clone._projection = ('values_list', fields, flat)
+        return clone
 
 
 class EmptyQuerySet(QuerySet):
     def __init__(self, model: 'Model', *args, **kwargs) -> None:  # type: ignore
-        super(QuerySet, self).__init__(*args, **kwargs)
-        self.model = model
+        super(EmptyQuerySet, self).__init__(*args, model=model, **kwargs)
@@ -1,26 +1,233 @@
 # -*- coding: utf-8 -*-
 
 from copy import deepcopy
+from operator import attrgetter
 
 from reobject.exceptions import CorruptTransactionException
+from reobject.models.model import _MISSING, Model
 
-__all__ = ['Transaction', 'transactional']
+__all__ = ['Transaction', 'atomic', 'transactional']
+
+# Pseudo-field under which the dirty fields of an object are logged
+_DIRTY = object()
 
 
 class Transaction(object):
-    def __init__(self, obj):
-        self.obj = obj
-        self.__transaction_state = None
+    """
+    Rolls back the attributes assigned to the given objects if the block it
+    guards raises an exception.
+
+    Rather than copying model objects up front, the transaction is told by
+    their model of every attribute assigned, and logs the value each held
+    when first assigned within the transaction, along with the updated stamp
+    and the dirty fields of each object. Rolling back restores these, latest
+    first, and removes the attributes added within the transaction.
+    Assignments are logged whether or not the object is in the store
+    and the store tracks changes, but values mutated in place, such as a
+    list appended to, are not.
+
+    Other objects are deep copied up front, and as each savepoint is taken,
+    and restored from the copy.
+
+    Transactions nest: rolling back an inner one only undoes its own changes.
+    Savepoints taken with savepoint() can be rolled back to explicitly.
+    """
+    def __init__(self, *objs):
+        self.objs = objs
+        models = [obj for obj in objs if isinstance(obj, Model)]
+        self._pks = {id(obj) for obj in models}  # None to log every object
+        self._watched = [type(obj).objects.store for obj in models]
+        self._others = [obj for obj in objs if not isinstance(obj, Model)]
+        self._stores = []
+        self._log = []  # (obj, attribute, old value) entries
+        self._marks = []  # positions in the log of each savepoint
+        self._mementos = []  # restoring the other objects, per savepoint
+        self._seen = set()  # (pk, field) pairs logged since the last mark
+        self._active = False
 
-    def __enter__(self):
-        self.__transaction_state = _memento(self.obj)
+    def __enter__(self) -> 'Transaction':
+        for store in self._watched:
+            if store not in self._stores:
+                store.undo_logs.append(self._record)
+                self._stores.append(store)
+
+        self._mementos = [self._memento()]
+        self._active = True
+        return self
 
     def __exit__(self, *args):
+        if not self._active:
+            if any(args):
+                raise CorruptTransactionException
+
+            return
+
+        self._release()
+
         if any(args):
-            if self.__transaction_state:
-                self.__transaction_state()
+            self._undo(0)
+
+    def _release(self) -> None:
+        for store in self._stores:
+            store.undo_logs.remove(self._record)
+
+        self._stores = []
+        self._active = False
+
+    def _memento(self):
+        states = [deepcopy(obj.__dict__) for obj in self._others]
+
+        def restore():
+            for obj, state in zip(self._others, states):
+                obj.__dict__.clear()
+                obj.__dict__.update(deepcopy(state))
+
+        return restore
+
+    def _record(self, obj, field, old) -> None:
+        pk = id(obj)
+
+        if (pk, field) in self._seen \
+                or self._pks is not None and pk not in self._pks:
+            return
+
+        updated = getattr(obj, 'updated', _MISSING)
+
+        if updated is _MISSING:
+            # Being initialized, there's nothing to restore
+            return
+
+        if (pk, None) not in self._seen:
+            # First change to the object since the last mark
+            self._seen.add((pk, None))
+            store = type(obj).objects.store
+            self._log.append((obj, 'updated', updated))
+            self._log.append((obj, _DIRTY, set(store.dirty.get(pk, ()))))
+
+        self._seen.add((pk, field))
+        self._log.append((obj, field, old))
+
+    def savepoint(self) -> int:
+        """
+        Marks the current state of the objects, and returns the savepoint to
+        pass to rollback() to restore it.
+        """
+        self._marks.append(len(self._log))
+        self._mementos.append(self._memento())
+        self._seen = set()
+        return len(self._marks)
+
+    def rollback(self, savepoint: int = 0) -> None:
+        """
+        Restores the objects to their state as of savepoint, or as of the
+        start of the transaction by default.
+        """
+        if savepoint > len(self._marks):
+            raise ValueError('Unknown savepoint {}'.format(savepoint))
+
+        self._undo(savepoint)
+
+    def _undo(self, savepoint: int) -> None:
+        mark = self._marks[savepoint - 1] if savepoint else 0
+        entries = self._log[mark:]
+
+        del self._log[mark:]
+        del self._marks[savepoint:]
+        self._mementos[savepoint]()
+        del self._mementos[savepoint + 1:]
+
+        # Restoring the attributes is logged too, skip it
+        self._seen = {(id(obj), field) for obj, field, _ in entries} | \
+            {(id(obj), None) for obj, _, _ in entries}
+
+        for obj, field, old in reversed(entries):
+            if field is _DIRTY:
+                store = type(obj).objects.store
+
+                if old:
+                    store.dirty[id(obj)] = old
+                else:
+                    store.dirty.pop(id(obj), None)
+
+            elif old is _MISSING:
+                delattr(obj, field)
             else:
-                raise CorruptTransactionException
+                setattr(obj, field, old)
+
+        self._seen = set()
+
+
+class atomic(object):
+    """
+    Sets aside the objects of the given models created or deleted within the
+    block it guards, and applies them to the stores at once when it exits, or
+    drops them if it raises an exception. Each index is then updated in a
+    single batch, and queries never see the block half applied.
+
+    Attributes assigned within the block are rolled back as well, as they
+    are by Transaction.
+
+    Stores are taken in the order of the names of their models, so that
+    blocks over the same thread-safe models don't deadlock, and each is
+    released when the block exits even if applying another one raises. The
+    stores left to apply are then dropped, and the exception re-raised.
+    """
+    def __init__(self, *models):
+        self.stores = []
+
+        for model in sorted(models, key=attrgetter('__name__')):
+            store = model.objects.store
+
+            if store not in self.stores:
+                self.stores.append(store)
+
+        self._transaction = Transaction()
+        self._transaction._pks = None
+        self._transaction._watched = self.stores
+
+    def __enter__(self) -> 'atomic':
+        begun = []
+
+        try:
+            for store in self.stores:
+                store.begin()
+                begun.append(store)
+
+            self._transaction.__enter__()
+        except BaseException:
+            for store in reversed(begun):
+                store.discard()
+
+            raise
+
+        return self
+
+    def __exit__(self, *args):
+        try:
+            self._transaction.__exit__(*args)
+        finally:
+            self._release(any(args))
+
+    def _release(self, failed: bool) -> None:
+        """
+        Commits the batch of each store, or discards them all if failed. Once
+        a commit raises, the batches left are discarded, and the first
+        exception is re-raised.
+        """
+        error = None
+
+        for store in self.stores:
+            try:
+                if failed or error is not None:
+                    store.discard()
+                else:
+                    store.commit()
+            except BaseException as e:
+                if error is None:
+                    error = e
+
+        if error is not None:
+            raise error
 
 
 class transactional(object):
@@ -29,21 +236,7 @@ class transactional(object):
 
     def __get__(self, obj, T):
         def transaction(*args, **kwargs):
-            state = _memento(obj)
-            try:
+            with Transaction(obj):
                 return self.method(obj, *args, **kwargs)
-            except Exception as e:
-                state()
-                raise e
 
         return transaction
-
-
-def _memento(obj):
-    state = deepcopy(obj.__dict__)
-
-    def f():
-        obj.__dict__.clear()
-        obj.__dict__.update(state)
-
-    return f
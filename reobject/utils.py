@@ -9,14 +9,51 @@ def cmp(*items):
     if any(not isinstance(item, str) for item in items):
         raise TypeError('attribute name must be a string')
 
-    def g(obj):
-        return tuple(
-            resolve_attr(obj, attr) for attr in items
-        )
+    getters = [attr_getter(attr) for attr in items]
+
+    if len(getters) == 1:
+        (getter,) = getters
+
+        def g(obj):
+            return (getter(obj),)
+    else:
+        def g(obj):
+            return tuple([getter(obj) for getter in getters])
 
     return g
 
 
+def attr_getter(attr):
+    """
+    Returns a function resolving attr on an object, as resolve_attr() does,
+    with the attribute path parsed once.
+    """
+    reverse = attr.startswith('-')
+    names = attr.lstrip('-').split('__')
+
+    if len(names) == 1:
+        (name,) = names
+
+        def getter(obj):
+            if isinstance(obj, dict):
+                obj = obj.get(name)
+            else:
+                obj = getattr(obj, name)
+
+            return obj if not reverse else -obj
+    else:
+        def getter(obj):
+            for name in names:
+                if isinstance(obj, dict):
+                    obj = obj.get(name)
+                else:
+                    obj = getattr(obj, name)
+
+            return obj if not reverse else -obj
+
+    return getter
+
+
 def resolve_attr(obj, attr):
     reverse = attr.startswith('-')
     attr = attr.lstrip('-')
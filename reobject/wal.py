@@ -0,0 +1,506 @@
+"""
+Write-ahead log of the changes to the objects of every model, replayed onto
+the last snapshot written by reobject.persist, so that changes made since
+survive a crash.
+
+Once set as the journal of the stores, the log records every object added,
+every object removed, and every field assigned, tracked or not, along with
+the state of added objects and the values assigned. Other attributes are
+only recorded as part of the state of objects added, and values mutated in
+place, such as a list appended to, are not recorded. Values are held by
+reference until written though, so that a value mutated in place before its
+group is written is recorded as mutated.
+
+Objects are identified in the log by their model, and a serial numbering them
+in the order they were added to their store: those in the store as the log
+starts come first, in store order, which is how they're loaded back from the
+snapshot.
+
+Records are grouped into frames, each prefixed with its length and CRC32, so
+that a frame torn by a crash is told apart and dropped. The file starts with
+a header frame holding the tag of the snapshot the log applies to, and logs
+not applying to the snapshot loaded are discarded.
+
+Logging a change only captures it in memory. Frames are written and synced
+to disk as a single group, when the change is made, every few milliseconds
+by a background thread, or without ever being synced, see WriteAheadLog.
+Should a group fail to be written, e.g. holding a value that can't be
+pickled, its changes are kept in memory, and further changes are refused with
+LogError from then on, before they're made. With fsync='always', the change
+whose write failed has been made already though, and stands in memory even
+though LogError is raised.
+"""
+import atexit
+import io
+import os
+import pickle
+import struct
+import threading
+import zlib
+from collections import deque
+from contextlib import ExitStack
+from functools import lru_cache
+from itertools import count
+from operator import itemgetter
+from typing import Any, Deque, Dict, Optional as Maybe
+
+import attr
+
+from reobject import persist
+from reobject.models.index import TIMESTAMP_FIELDS
+from reobject.models.store import ModelStoreMapping, Store
+
+__all__ = ['LogError', 'WriteAheadLog']
+
+MAGIC = b'REOBJWAL'
+VERSION = 1
+
+# Milliseconds between group commits by default, and when syncs are off
+FLUSH_INTERVAL = 100
+
+_FRAME = struct.Struct('<II')  # length and CRC32 of the payload
+
+
+class LogError(Exception):
+    """
+    Raised once changes couldn't be written to the log, which stops logging
+    them.
+    """
+
+
+@lru_cache(maxsize=None)
+def _logged_fields(model) -> frozenset:
+    """
+    Returns the names of the attributes of model whose assignments are
+    logged.
+    """
+    return frozenset(
+        field.name for field in attr.fields(model)
+    ).union(TIMESTAMP_FIELDS)
+
+
+def _stores() -> list:
+    return [
+        (name, store) for name, store in ModelStoreMapping.items()
+        if store.model is not None
+    ]
+
+
+class _Pickler(persist._Pickler):
+    """
+    Pickles references to the objects added by the records of the frame
+    being pickled or earlier, and pickles along the others, e.g. added by
+    another thread since.
+    """
+    def __init__(self, file, positions: dict, lsn: int):
+        super(_Pickler, self).__init__(file, positions)
+        self.lsn = lsn  # of the last record of the frame
+
+    def reference(self, obj) -> tuple:
+        entry = self.positions.get(id(obj))
+
+        if entry is not None and entry[2] <= self.lsn:
+            return entry[:2]
+
+        return self._detach(obj)
+
+
+class _Unpickler(persist._Unpickler):
+    """
+    Creates the objects referenced ahead of the record adding them, within
+    the same frame, which the record then fills in.
+    """
+    def resolve(self, name: str, position: int):
+        objs = self.objects.setdefault(name, [])
+
+        while position >= len(objs):
+            objs.append(object.__new__(ModelStoreMapping[name].model))
+
+        return super(_Unpickler, self).resolve(name, position)
+
+
+def _frame(payload: bytes) -> bytes:
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _frames(file):
+    """
+    Yields the payload of each frame of a log, along with the offset it ends
+    at, up to the first one torn or corrupt.
+    """
+    offset = file.tell()
+
+    while True:
+        prefix = file.read(_FRAME.size)
+
+        if len(prefix) < _FRAME.size:
+            return
+
+        length, crc = _FRAME.unpack(prefix)
+        payload = file.read(length)
+
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+
+        offset += _FRAME.size + length
+        yield payload, offset
+
+
+class WriteAheadLog(object):
+    """
+    Log at path of the changes made to the objects of every model since
+    snapshot was written, if given.
+
+    recover() loads the snapshot and replays the log onto it, then sets the
+    log as the journal of the stores. It's meant to be called as the process
+    starts, once the models are declared and before any object is created.
+    checkpoint() writes a new snapshot, and starts the log over.
+
+    fsync sets when changes are synced to disk:
+
+    - 'always', as each change is made, which is durable but slow
+    - every fsync milliseconds, grouping the changes made meanwhile into a
+      single write and sync, so that a crash loses at most the last interval
+    - 'never', leaving it to the OS, though changes are still written every
+      FLUSH_INTERVAL milliseconds
+    """
+    def __init__(self, path: str, snapshot: Maybe[str] = None,
+                 fsync=FLUSH_INTERVAL):
+        if fsync not in ('always', 'never') and not (
+            isinstance(fsync, (int, float)) and fsync > 0
+        ):
+            raise ValueError(
+                "fsync must be 'always', 'never' or a number of milliseconds"
+            )
+
+        self.path = path
+        self.snapshot = snapshot
+        self.fsync = fsync
+
+        self._file = None  # type: Any
+        self._flushing = threading.Lock()  # serializes writes to the file
+        # Records logged since the last group commit
+        self._records = deque()  # type: Deque[tuple]
+        # pk -> (model name, serial, lsn added by)
+        self._positions = {}  # type: Dict[int, tuple]
+        # model name -> number of serials given out
+        self._counts = {}  # type: Dict[str, int]
+        # (lsn, [(obj, position entry), ...]) of the objects removed, kept
+        # until flushed so that their pk isn't reused meanwhile
+        self._retired = deque()  # type: Deque[tuple]
+        # Raised by the last group commit, if it failed
+        self._error = None  # type: Maybe[Exception]
+        self._sequence = count(1)  # numbers the records
+        self._stopped = threading.Event()
+        self._thread = None  # type: Maybe[threading.Thread]
+
+    def __enter__(self) -> 'WriteAheadLog':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return '<{}: {}>'.format(type(self).__name__, self.path)
+
+    def _number(self, objects: dict) -> None:
+        """
+        Numbers the objects of every model, given as lists in serial order,
+        leaving out those no longer in their store, e.g. removed by the
+        records replayed, whose pk may be reused once they're freed.
+        """
+        self._positions = {
+            id(obj): (name, serial, 0)
+            for name, objs in objects.items()
+            for serial, obj in enumerate(objs)
+            if ModelStoreMapping[name].get(id(obj)) is obj
+        }
+        self._counts = {name: len(objs) for name, objs in objects.items()}
+        self._retired = deque()
+
+    def recover(self) -> None:
+        """
+        Loads the snapshot if there's one, replays the changes logged since
+        onto it, and starts logging.
+        """
+        if Store.journal is not None:
+            raise RuntimeError('Another journal is set')
+
+        tag = None
+
+        if self.snapshot is not None and os.path.exists(self.snapshot):
+            tag = persist.load(self.snapshot)
+
+        objects = {name: list(store) for name, store in _stores()}
+        end = None
+
+        if os.path.exists(self.path):
+            end = self._replay(tag, objects)
+
+        if end is None:
+            self._start(tag)
+        else:
+            self._number(objects)
+            self._file = open(self.path, 'r+b')
+            self._file.truncate(end)
+            self._file.seek(end)
+
+        self._attach()
+
+    def _replay(self, tag, objects: dict):
+        """
+        Applies the changes logged onto the stores, if the log applies to the
+        snapshot loaded, and returns the offset its last valid frame ends
+        at, or None if it doesn't apply.
+        """
+        with open(self.path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                return None
+
+            frames = _frames(file)
+
+            for payload, end in frames:
+                header = pickle.loads(payload)
+
+                if header['version'] != VERSION or header['tag'] != tag:
+                    return None
+
+                break
+            else:
+                return None
+
+            # Number of objects of each model added so far
+            counts = {name: len(objs) for name, objs in objects.items()}
+
+            with persist._gc_paused():
+                for payload, end in frames:
+                    unpickler = _Unpickler(io.BytesIO(payload), objects)
+                    records = unpickler.load()
+                    unpickler.load_detached()
+
+                    for record in records:
+                        self._apply(record, objects, counts)
+
+        return end
+
+    @staticmethod
+    def _apply(record: tuple, objects: dict, counts: dict) -> None:
+        _, event, name, *args = record
+        store = ModelStoreMapping[name]
+        objs = objects.setdefault(name, [])
+
+        if event == 'add':
+            start = counts.get(name, 0)
+            counts[name] = start + len(args[0])
+
+            while len(objs) < counts[name]:
+                objs.append(object.__new__(store.model))
+
+            for obj, state in zip(objs[start:], args[0]):
+                persist._set_state(obj, state)
+
+            store.extend(objs[start:counts[name]])
+
+        elif event == 'remove':
+            store.remove_many(objs[serial] for serial in args[0])
+
+        elif event == 'set':
+            serial, field, value = args
+            object.__setattr__(objs[serial], field, value)
+            store.reindex(objs[serial], field)
+
+    def _start(self, tag) -> None:
+        """
+        Starts the log over, numbering the objects of the stores.
+        """
+        self._number({name: list(store) for name, store in _stores()})
+        temporary = '{}.{}.tmp'.format(self.path, os.getpid())
+
+        with open(temporary, 'wb') as file:
+            file.write(MAGIC)
+            file.write(_frame(pickle.dumps({'version': VERSION, 'tag': tag})))
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary, self.path)
+
+        if self._file is not None:
+            self._file.close()
+
+        self._file = open(self.path, 'ab')
+
+    def _attach(self) -> None:
+        Store.journal = self
+        atexit.register(self.close)
+
+        if self.fsync != 'always':
+            interval = FLUSH_INTERVAL if self.fsync == 'never' else self.fsync
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(interval / 1000,),
+                name='reobject-wal', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            try:
+                self.flush()
+            except LogError:
+                # Recorded, and raised by the next change logged
+                return
+
+    def check(self) -> None:
+        """
+        Raises LogError if changes can no longer be logged. Called by the
+        stores before they make a change, so that it isn't made.
+        """
+        if self._error is not None:
+            raise LogError(
+                'Changes are no longer logged to {}: {!r}'.format(
+                    self.path, self._error
+                )
+            ) from self._error
+
+    # The hooks below are called by the stores once a change is made, holding
+    # their lock if they're synchronized, so that the changes to a store are
+    # logged in order. The records are appended to a deque and numbered by a
+    # counter, both atomic, rather than holding a lock of the log.
+
+    def added(self, store, objs) -> None:
+        self.check()
+        lsn = next(self._sequence)
+        name = store.model.__name__
+        serial = self._counts.get(name, 0)
+        self._counts[name] = serial + len(objs)
+        positions = self._positions
+        states = []
+
+        for obj in objs:
+            positions[id(obj)] = (name, serial, lsn)
+            serial += 1
+            state = getattr(obj, '__dict__', None)
+            states.append(
+                persist._state(obj) if state is None else state.copy()
+            )
+
+        self._records.append((lsn, 'add', name, states))
+
+        if self.fsync == 'always':
+            self.flush()
+
+    def removed(self, store, objs) -> None:
+        self.check()
+        lsn = next(self._sequence)
+        positions = self._positions
+        entries = [(obj, positions[id(obj)]) for obj in objs]
+        self._retired.append((lsn, entries))
+        self._records.append((
+            lsn, 'remove', store.model.__name__,
+            [entry[1] for _, entry in entries]
+        ))
+
+        if self.fsync == 'always':
+            self.flush()
+
+    def assigned(self, store, obj, field: str) -> None:
+        if field not in _logged_fields(store.model):
+            return
+
+        self.check()
+        name, serial, _ = self._positions[id(obj)]
+        # The value is pickled as the group is written, not copied meanwhile
+        self._records.append((
+            next(self._sequence), 'set', name, serial, field,
+            getattr(obj, field)
+        ))
+
+        if self.fsync == 'always':
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes the changes logged since the last call as a single frame, and
+        syncs them to disk unless fsync is 'never'.
+
+        Raises LogError if they couldn't be, in which case they're kept, and
+        so are the changes logged from then on, but none is written anymore.
+        """
+        with self._flushing:
+            self.check()
+            queued = self._records
+            records = [queued.popleft() for _ in range(len(queued))]
+
+            if not records or self._file is None:
+                return
+
+            lsn = max(map(itemgetter(0), records))
+
+            try:
+                buffer = io.BytesIO()
+                pickler = _Pickler(buffer, self._positions, lsn)
+                pickler.dump(records)
+                pickler.dump_detached()
+
+                self._file.write(_frame(buffer.getvalue()))
+                self._file.flush()
+
+                if self.fsync != 'never':
+                    os.fsync(self._file.fileno())
+            except Exception as exc:
+                queued.extendleft(reversed(records))
+                self._error = exc
+                self.check()
+
+            self._release(lsn)
+
+    def _release(self, lsn: int) -> None:
+        """
+        Forgets the objects removed by the records up to lsn, now written.
+        """
+        retired, positions = self._retired, self._positions
+
+        while retired and retired[0][0] <= lsn:
+            for obj, entry in retired.popleft()[1]:
+                if positions.get(id(obj)) is entry:
+                    del positions[id(obj)]
+
+    def checkpoint(self) -> None:
+        """
+        Writes a snapshot of every store, and starts the log over.
+        """
+        if self.snapshot is None:
+            raise ValueError('No snapshot to write')
+
+        with ExitStack() as stack:
+            # No change slips in between the snapshot and the new log
+            for _, store in _stores():
+                stack.enter_context(store.writing())
+
+            self.flush()
+            tag = os.urandom(8).hex()
+            persist.save(self.snapshot, tag=tag)
+
+            with self._flushing:
+                self._start(tag)
+
+    def close(self) -> None:
+        """
+        Writes the changes logged so far, and stops logging.
+        """
+        if Store.journal is self:
+            Store.journal = None
+
+        atexit.unregister(self.close)
+
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+        try:
+            self.flush()
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -14,14 +14,20 @@ setup(
         'Topic :: Software Development :: Libraries',
         'License :: OSI Approved :: Apache Software License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
     ],
+    python_requires='>=3.8',
     keywords=['orm', 'python', 'object-oriented-programming', 'django'],
     install_requires=[
        'attrs>=17.2.0',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     packages=find_packages(exclude=['tests', 'tests.*']),
 )
@@ -2,6 +2,7 @@ import unittest
 
 from reobject.models import Model, Field
 from reobject.query import Q
+from reobject.query.compiler import _factory
 
 
 class StringSecret(object):
@@ -202,4 +203,85 @@ class TestQ(unittest.TestCase):
         obj_ok2 = SecretModel(secret={'gem': 'shiny'})
         self.assertTrue(
             (Qa | Qb).comparator(obj_ok2)
-        )
\ No newline at end of file
+        )
+
+    def test_Q_composition_NOT(self):
+        obj = SecretModel(question='What?')
+
+        self.assertFalse((~Q(question='What?')).comparator(obj))
+        self.assertTrue((~Q(question='When?')).comparator(obj))
+        self.assertFalse((~Q()).comparator(obj))
+        self.assertTrue((Q() | Q(question='When?')).comparator(obj))
+
+
+class TestCompiler(unittest.TestCase):
+    def tearDown(self):
+        SecretModel.objects.all().delete()
+
+    def test_shape_cache(self):
+        _factory.cache_clear()
+
+        Q(question='What?', secret__gem__gt=1).comparator
+        Q(question='When?', secret__gem__gt=2).comparator
+        Q(secret__gem__gt=3).comparator
+
+        info = _factory.cache_info()
+        self.assertEqual(info.hits, 1)
+        self.assertEqual(info.misses, 2)
+
+    def test_matches_interpreter(self):
+        objs = [
+            SecretModel(question='What?', secret=StringSecret()),
+            SecretModel(question='When?', secret=StringSecret('Diamond')),
+            SecretModel(question='', secret=NumericSecret()),
+            SecretModel(question=None, secret={'gem': 'pearl'}),
+        ]
+
+        lookups = [
+            Q(question__iexact='WHAT?'),
+            Q(question__in=['When?', '']),
+            Q(question__isnone=False) & ~Q(secret__gem__iin=['ruby', 'pearl']),
+            Q(secret__gem__icontains='MON') | Q(question__isnone=True),
+            Q(question__startswith='Wh', secret__gem__endswith='nd'),
+        ]
+
+        for q in lookups:
+            for obj in objs:
+                try:
+                    expected = _interpret(q, obj)
+                except (AttributeError, TypeError) as e:
+                    with self.assertRaises(type(e)):
+                        q.comparator(obj)
+                else:
+                    self.assertEqual(bool(q.comparator(obj)), bool(expected))
+
+    def test_non_identifier_attrs(self):
+        obj = SecretModel(secret={'class': 'ruby', 'a-b': 1})
+
+        self.assertTrue(Q(**{'secret__class': 'ruby'}).comparator(obj))
+        self.assertTrue(Q(**{'secret__a-b__lt': 2}).comparator(obj))
+
+    def test_invalid_constant(self):
+        obj = SecretModel(question='What?')
+
+        # The lookup value can't be casefolded, the error surfaces on use
+        q_obj = Q(question__iexact=1)
+
+        with self.assertRaises(AttributeError):
+            q_obj.comparator(obj)
+
+
+def _interpret(q, obj):
+    """
+    Evaluates a Q tree by walking it, as a reference for compiled predicates.
+    """
+    if q.is_leaf:
+        return q._comparator_func(obj)
+    elif q.negated:
+        return not _interpret(q.children[0], obj)
+    elif q.connector == q.AND:
+        return all(_interpret(child, obj) for child in q.children)
+    elif q.connector == q.OR:
+        return any(_interpret(child, obj) for child in q.children)
+
+    return True
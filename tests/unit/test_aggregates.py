@@ -0,0 +1,293 @@
+import random
+import unittest
+from datetime import datetime
+
+from reobject.models import Model, Field
+from reobject.models.fields import ForeignKey
+from reobject.models.columns import numpy
+from reobject.query import Avg, Count, Max, Min, Sum
+
+
+class Book(Model):
+    title = Field()
+    price = Field(default=None)
+    pages = Field(default=None)
+
+
+class Publisher(Model):
+    name = Field()
+
+
+class Item(Model):
+    category = Field()
+    price = Field()
+    publisher = ForeignKey(Publisher)
+
+
+class Sale(Model):
+    amount = Field(column=True)
+    units = Field(column=True)
+    day = Field(column=True)
+
+
+class Reading(Model):
+    ok = Field(column=True)
+    value = Field(column=True)
+    count = Field(column=True)
+
+
+class TestAggregate(unittest.TestCase):
+    def setUp(self):
+        Book(title='a', price=10, pages=100)
+        Book(title='b', price=25, pages=300)
+        Book(title='c', price=15, pages=None)
+        Book(title='d', price=None, pages=300)
+
+    def tearDown(self):
+        Book.objects.all().delete()
+
+    def test_aggregate(self):
+        self.assertEqual(
+            Book.objects.aggregate(
+                total=Sum('price'), avg=Avg('price'), low=Min('price'),
+                high=Max('price'), n=Count('id'),
+            ),
+            {'total': 50, 'avg': 50 / 3, 'low': 10, 'high': 25, 'n': 4}
+        )
+
+    def test_default_alias(self):
+        self.assertEqual(
+            Book.objects.filter(price__isnone=False).aggregate(Sum('pages'), Max('price')),
+            {'pages__sum': 400, 'price__max': 25}
+        )
+
+    def test_count(self):
+        self.assertEqual(
+            Book.objects.aggregate(Count(), Count('pages')),
+            {'*__count': 4, 'pages__count': 3}
+        )
+        self.assertEqual(
+            Book.objects.aggregate(n=Count('pages', distinct=True))['n'], 2
+        )
+
+    def test_empty(self):
+        self.assertEqual(
+            Book.objects.filter(title='z').aggregate(
+                total=Sum('price'), avg=Avg('price'), n=Count()
+            ),
+            {'total': None, 'avg': None, 'n': 0}
+        )
+
+    def test_filtered_and_sliced(self):
+        queryset = Book.objects.filter(price__isnone=False).order_by('-price')
+
+        self.assertEqual(queryset.aggregate(avg=Avg('price'))['avg'], 50 / 3)
+        self.assertEqual(queryset[:2].aggregate(total=Sum('price'))['total'], 40)
+
+    def test_values(self):
+        queryset = Book.objects.filter().values('title', 'price')
+
+        self.assertEqual(queryset.aggregate(Sum('price')), {'price__sum': 50})
+
+        list(queryset)
+        self.assertEqual(queryset.aggregate(Sum('price')), {'price__sum': 50})
+
+        self.assertEqual(
+            queryset.filter(title__in=['b', 'c']).aggregate(Sum('price')),
+            {'price__sum': 40}
+        )
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+            Book.objects.aggregate()
+
+        with self.assertRaises(TypeError):
+            Book.objects.aggregate(total='price')
+
+        with self.assertRaises(TypeError):
+            Sum(42)
+
+
+class TestAnnotate(unittest.TestCase):
+    def setUp(self):
+        self.acme = Publisher(name='acme')
+        self.globex = Publisher(name='globex')
+
+        Item(category='book', price=10, publisher=self.acme)
+        Item(category='music', price=5, publisher=self.globex)
+        Item(category='book', price=30, publisher=self.globex)
+        Item(category='film', price=20, publisher=self.acme)
+        Item(category='book', price=None, publisher=self.acme)
+
+    def tearDown(self):
+        Item.objects.all().delete()
+        Publisher.objects.all().delete()
+
+    def test_values_annotate(self):
+        self.assertEqual(
+            list(Item.objects.all().values('category').annotate(
+                n=Count('id'), revenue=Sum('price')
+            )),
+            [
+                {'category': 'book', 'n': 3, 'revenue': 40},
+                {'category': 'music', 'n': 1, 'revenue': 5},
+                {'category': 'film', 'n': 1, 'revenue': 20},
+            ]
+        )
+
+    def test_values_list_annotate(self):
+        self.assertEqual(
+            list(Item.objects.filter(price__isnone=False).values_list(
+                'category', 'publisher__name'
+            ).annotate(Max('price'))),
+            [
+                ('book', 'acme', 10),
+                ('music', 'globex', 5),
+                ('book', 'globex', 30),
+                ('film', 'acme', 20),
+            ]
+        )
+
+    def test_related_keys(self):
+        queryset = Item.objects.all().values('publisher__name').annotate(
+            avg=Avg('price'), n=Count()
+        )
+
+        self.assertEqual(queryset.count(), 2)
+        self.assertEqual(
+            list(queryset),
+            [
+                {'publisher__name': 'acme', 'avg': 15, 'n': 3},
+                {'publisher__name': 'globex', 'avg': 17.5, 'n': 2},
+            ]
+        )
+
+    def test_order_by_annotation(self):
+        queryset = Item.objects.all().values('category').annotate(n=Count())
+
+        self.assertEqual(
+            [row['category'] for row in queryset.order_by('-n', 'category')],
+            ['book', 'film', 'music']
+        )
+        self.assertEqual(
+            [row['category'] for row in queryset.order_by('n').reverse()],
+            ['book', 'film', 'music']
+        )
+
+    def test_lazy(self):
+        queryset = Item.objects.all().values('category').annotate(n=Count())
+        Item(category='game', price=50, publisher=self.acme)
+
+        self.assertEqual(queryset.count(), 4)
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+            Item.objects.all().annotate(n=Count())
+
+        with self.assertRaises(TypeError):
+            Item.objects.all().values_list('category', flat=True).annotate(n=Count())
+
+        with self.assertRaises(ValueError):
+            Item.objects.all().values('category').annotate(category=Count())
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestAggregateColumns(unittest.TestCase):
+    def setUp(self):
+        for n in range(100):
+            Sale(amount=n * 1.5, units=n % 7, day=datetime(2017, 1, 1 + n % 28))
+
+    def tearDown(self):
+        Sale.objects.all().delete()
+
+    def aggregate(self, queryset, **aggregates):
+        # Computes the aggregates without the columns, for reference
+        return dict(zip(
+            aggregates,
+            queryset._aggregate_objects(list(aggregates.values()))
+        ))
+
+    def test_columns(self):
+        queryset = Sale.objects.filter(units__gte=3)
+        aggregates = dict(
+            total=Sum('units'), avg=Avg('amount'), low=Min('day'),
+            high=Max('amount'), n=Count('pk'), days=Count('day', distinct=True),
+        )
+
+        self.assertIsNotNone(queryset._aggregate_columns(list(aggregates.values())))
+
+        result = queryset.aggregate(**aggregates)
+        expected = self.aggregate(queryset, **aggregates)
+
+        self.assertEqual(result, expected)
+        self.assertIsInstance(result['total'], int)
+        self.assertIsInstance(result['low'], datetime)
+
+    def test_same_as_objects(self):
+        rng = random.Random(0)
+
+        for n in range(1000):
+            Reading(ok=n % 3 == 0, value=rng.uniform(-1e6, 1e6),
+                    count=2 ** 53 + n)
+
+        try:
+            aggregates = dict(
+                oks=Sum('ok'), ok=Avg('ok'), total=Sum('value'),
+                avg=Avg('value'), count=Sum('count'), avg_count=Avg('count'),
+            )
+
+            for queryset in (Reading.objects.all(),
+                             Reading.objects.filter(count=2 ** 53 + 3)):
+                self.assertIsNotNone(
+                    queryset._aggregate_columns(list(aggregates.values()))
+                )
+
+                result = queryset.aggregate(**aggregates)
+                expected = self.aggregate(queryset, **aggregates)
+
+                self.assertEqual(result, expected)
+                self.assertEqual(
+                    list(map(type, result.values())),
+                    list(map(type, expected.values()))
+                )
+
+            # Which NumPy's pairwise summation and mean() wouldn't give
+            values = Reading.objects.all().values_list('value', 'count')
+            values, counts = map(numpy.array, zip(*values))
+            result = Reading.objects.aggregate(Sum('value'), Avg('count'))
+
+            self.assertNotEqual(values.sum(), result['value__sum'])
+            self.assertNotEqual(counts.mean(), result['count__avg'])
+        finally:
+            Reading.objects.all().delete()
+
+    def test_sliced(self):
+        queryset = Sale.objects.order_by('-units', 'amount')[:10]
+
+        self.assertIsNone(queryset._aggregate_columns([Sum('units')]))
+        self.assertEqual(queryset.aggregate(Sum('units')), {'units__sum': 60})
+        self.assertEqual(
+            Sale.objects.order_by('-amount')[:10].aggregate(Sum('amount')),
+            {'amount__sum': sum(n * 1.5 for n in range(90, 100))}
+        )
+
+    def test_fallback(self):
+        Sale(amount='n/a', units=None, day=None)
+        queryset = Sale.objects.all()
+
+        self.assertIsNone(queryset._aggregate_columns([Sum('amount')]))
+        self.assertIsNotNone(queryset._aggregate_columns([Sum('units')]))
+        self.assertEqual(
+            queryset.aggregate(n=Count('units'), total=Sum('units')),
+            self.aggregate(queryset, n=Count('units'), total=Sum('units'))
+        )
+
+        with self.assertRaises(TypeError):
+            queryset.aggregate(Sum('amount'))
+
+        with self.assertRaises(TypeError):
+            queryset.aggregate(Sum('day'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+import asyncio
+import threading
+import unittest
+
+from reobject.exceptions import DoesNotExist, MultipleObjectsReturned
+from reobject.models import Model, Field
+from reobject.query import Count, Sum
+
+
+class Task(Model):
+    name = Field()
+    priority = Field(index='sorted')
+    done = Field(default=False)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def collect(aiterable) -> list:
+    return [item async for item in aiterable]
+
+
+class TestAsyncQuerySet(unittest.TestCase):
+    def setUp(self):
+        self.tasks = [
+            Task(name='task{}'.format(n), priority=n % 7, done=n % 3 == 0)
+            for n in range(100)
+        ]
+
+    def tearDown(self):
+        Task.objects.all().delete()
+
+    def test_async_for(self):
+        querysets = [
+            Task.objects.all(),
+            Task.objects.filter(done=True),
+            Task.objects.filter(priority__gte=3).order_by('-priority', 'name'),
+            Task.objects.exclude(done=True).reverse()[5:20],
+            Task.objects.filter(done=False)[10:],
+            Task.objects.order_by('priority').values('name', 'priority')[:30],
+            Task.objects.filter(priority=2).values_list('name', flat=True),
+            Task.objects.filter(priority=2).values(),
+            Task.objects.all().values('priority').annotate(n=Count()),
+        ]
+
+        for queryset in querysets:
+            self.assertEqual(
+                run(collect(queryset.aiterator(chunk_size=7))), list(queryset)
+            )
+            self.assertEqual(run(collect(queryset)), list(queryset))
+
+    def test_yields_control(self):
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(len(results))
+                await asyncio.sleep(0)
+
+        async def main():
+            task = asyncio.ensure_future(ticker())
+
+            async for obj in Task.objects.filter(done=False).aiterator(10):
+                results.append(obj)
+
+            task.cancel()
+
+        results = []
+        run(main())
+
+        self.assertEqual(len(results), 66)
+        self.assertGreater(len(set(ticks)), 5)
+
+    def test_changes_while_iterating(self):
+        async def main():
+            results = []
+
+            async for obj in Task.objects.all().aiterator(10):
+                results.append(obj)
+
+                if len(results) == 10:
+                    Task(name='new', priority=0)
+                    Task.objects.filter(done=True).delete()
+
+            return results
+
+        self.assertEqual(run(main()), self.tasks)
+
+    def test_acount(self):
+        self.assertEqual(run(Task.objects.acount()), 100)
+        self.assertEqual(run(Task.objects.filter(done=True).acount()), 34)
+        self.assertEqual(run(Task.objects.filter(done=True)[30:].acount()), 4)
+        self.assertEqual(
+            run(Task.objects.all().values('priority').annotate(n=Count()).acount()),
+            7
+        )
+
+    def test_aget(self):
+        self.assertIs(run(Task.objects.aget(name='task5')), self.tasks[5])
+        self.assertEqual(
+            run(Task.objects.filter(priority=1).values('name').aget(name='task15')),
+            {'name': 'task15'}
+        )
+
+        with self.assertRaises(DoesNotExist):
+            run(Task.objects.aget(name='missing'))
+
+        with self.assertRaises(MultipleObjectsReturned) as e:
+            run(Task.objects.filter(done=False).aget())
+
+        self.assertIn('more than 20', str(e.exception))
+
+    def test_aaggregate(self):
+        queryset = Task.objects.filter(done=False)
+
+        self.assertEqual(
+            run(queryset.aaggregate(Sum('priority'), n=Count())),
+            queryset.aggregate(Sum('priority'), n=Count())
+        )
+        self.assertEqual(
+            run(Task.objects.aaggregate(n=Count('name'))), {'n': 100}
+        )
+
+
+class TestChangeStream(unittest.TestCase):
+    def tearDown(self):
+        Task.objects.all().delete()
+
+    def test_changes(self):
+        async def main():
+            async with Task.objects.changes() as stream:
+                task = Task(name='a', priority=1)
+                task.priority = 2
+                Task.objects.bulk_create([('b', 3)])
+                task.delete()
+
+            return [
+                (change.event, change.obj.name, change.field, change.old)
+                async for change in stream
+            ]
+
+        self.assertEqual(run(main()), [
+            ('add', 'a', None, None),
+            ('change', 'a', 'priority', 1),
+            ('add', 'b', None, None),
+            ('remove', 'a', None, None),
+        ])
+
+    def test_events(self):
+        async def main():
+            stream = Task.objects.changes('remove')
+            Task(name='a', priority=1).delete()
+            stream.close()
+            Task(name='b', priority=1).delete()
+
+            return [change.obj.name async for change in stream]
+
+        self.assertEqual(run(main()), ['a'])
+
+        with self.assertRaises(ValueError):
+            Task.objects.changes('added')
+
+    def test_other_threads(self):
+        async def consume(stream):
+            names = []
+
+            async for change in stream:
+                names.append(change.obj.name)
+
+                if len(names) == 3:
+                    stream.close()
+
+            return names
+
+        async def main():
+            stream = Task.objects.changes('add')
+            thread = threading.Thread(
+                target=lambda: [Task(name=name, priority=0) for name in 'xyz']
+            )
+            thread.start()
+            names = await consume(stream)
+            thread.join()
+            return names
+
+        self.assertEqual(run(main()), ['x', 'y', 'z'])
+        self.assertEqual(len(Task.objects.store._listeners), 0)
+
+    def test_opened_before_loop(self):
+        stream = Task.objects.changes('add')
+        Task(name='a', priority=0)
+
+        async def main():
+            thread = threading.Thread(target=Task, args=('b', 0))
+            thread.start()
+            names = []
+
+            async for change in stream:
+                names.append(change.obj.name)
+
+                if len(names) == 2:
+                    break
+
+            thread.join()
+            stream.close()
+            return names
+
+        self.assertEqual(run(asyncio.wait_for(main(), 1)), ['a', 'b'])
+
+    def test_overflow(self):
+        stream = Task.objects.changes('add', maxsize=2)
+
+        async def main():
+            names = []
+
+            with self.assertRaises(OverflowError):
+                async for change in stream:
+                    names.append(change.obj.name)
+
+                    if len(names) == 1:
+                        for name in 'cde':
+                            Task(name=name, priority=0)
+
+            return names
+
+        Task(name='a', priority=0)
+        Task(name='b', priority=0)
+
+        self.assertEqual(run(main()), ['a', 'b', 'c'])
+        self.assertTrue(stream.closed)
+        self.assertEqual(len(Task.objects.store._listeners), 0)
+
+    def test_closed_loop(self):
+        stream = Task.objects.changes('add')
+
+        async def main():
+            Task(name='a', priority=0)
+            return (await stream.__anext__()).obj.name
+
+        self.assertEqual(run(main()), 'a')
+
+        # Changes made once the loop is closed close the stream
+        Task(name='b', priority=0)
+
+        thread = threading.Thread(target=Task, args=('c', 0))
+        thread.start()
+        thread.join()
+
+        self.assertTrue(stream.closed)
+        self.assertEqual(Task.objects.count(), 3)
+        self.assertEqual(len(Task.objects.store._listeners), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
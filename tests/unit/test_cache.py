@@ -0,0 +1,130 @@
+import unittest
+
+from reobject.models import Model, Field
+from reobject.models.fields import ForeignKey
+from reobject.query import Q, QueryCache
+
+
+class Studio(Model):
+    name = Field(index='hash')
+
+
+class Film(Model):
+    title = Field(index='hash')
+    studio = ForeignKey(Studio)
+    year = Field(index='sorted')
+    details = Field(default=dict)
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = QueryCache()
+        Film.objects.set_cache(self.cache)
+
+        self.studios = [Studio(name='s{}'.format(n)) for n in range(2)]
+
+        for n in range(10):
+            Film(title='f{}'.format(n), studio=self.studios[n % 2],
+                 year=2000 + n)
+
+    def tearDown(self):
+        Film.objects.set_cache(None)
+        Film.objects.all().delete()
+        Studio.objects.all().delete()
+
+    @staticmethod
+    def query():
+        return Film.objects.filter(year__gte=2004).order_by('-year')\
+            .values('title')
+
+    def test_hit(self):
+        results = list(self.query())
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+        self.assertEqual(list(self.query()), results)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_normalized_key(self):
+        list(Film.objects.filter(Q(year=2001) | Q(year=2003), title='f1'))
+        films = list(
+            Film.objects.filter(Q(year=2001) | Q(year=2003)).filter(title='f1')
+        )
+
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual([film.title for film in films], ['f1'])
+
+        # Children in another order, which may short-circuit differently
+        list(Film.objects.filter(Q(year=2003) | Q(year=2001), title='f1'))
+        self.assertEqual(self.cache.hits, 1)
+
+        # Distinct ordering, projection, slice or lookup value types
+        list(Film.objects.filter(title='f1'))
+        list(Film.objects.filter(title='f1').order_by('year'))
+        list(Film.objects.filter(title='f1').values_list('year'))
+        list(Film.objects.filter(title='f1')[:1])
+        list(Film.objects.filter(year__in=[2001]))
+        list(Film.objects.filter(year__in=(2001,)))
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(len(self.cache), 8)
+
+    def test_invalidation(self):
+        list(self.query())
+
+        Film(title='new', studio=self.studios[0], year=2020)
+        self.assertEqual(list(self.query())[0], {'title': 'new'})
+
+        Film.objects.get(title='new').year = 1990
+        self.assertNotIn({'title': 'new'}, list(self.query()))
+
+        Film.objects.filter(year__gte=2008).delete()
+        self.assertEqual(len(self.query()), 4)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 4))
+
+    def test_related_lookups(self):
+        query = Film.objects.filter(studio__name='s0').values_list(
+            'title', flat=True
+        )
+        self.assertEqual(len(query), 5)
+
+        # Renaming a studio changes the results, though no film changed
+        self.studios[0].name = 'renamed'
+        self.assertEqual(len(Film.objects.filter(studio__name='s0')), 0)
+
+        # Lookups on the pk of the studio don't depend on its fields
+        pk = self.studios[1].pk
+        list(Film.objects.filter(studio__pk=pk))
+        self.studios[1].name = 'renamed too'
+        list(Film.objects.filter(studio__pk=pk))
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_uncached(self):
+        list(Film.objects.filter(studio=self.studios[0]))
+        list(Film.objects.filter(details={'genre': 'drama'}))
+        list(Film.objects.filter(details__genre='drama'))
+
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+    def test_eviction(self):
+        cache = QueryCache(maxsize=2, maxrows=8)
+        Film.objects.set_cache(cache)
+
+        list(Film.objects.filter(year=2001))
+        list(Film.objects.filter(year=2002))
+        list(Film.objects.filter(year=2001))
+        list(Film.objects.filter(year=2003))
+
+        # The least recently used entry went first
+        list(Film.objects.filter(year=2001))
+        list(Film.objects.filter(year=2002))
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+        # Too many results to be cached, or evicting the others to fit
+        list(Film.objects.all())
+        self.assertEqual((len(cache), cache.rows), (2, 2))
+
+        list(Film.objects.filter(year__gt=2001))
+        self.assertEqual((len(cache), cache.rows), (1, 8))
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.rows, cache.hits), (0, 0, 0))
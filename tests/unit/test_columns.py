@@ -0,0 +1,118 @@
+import unittest
+from datetime import datetime, timedelta
+
+from reobject.models import Model, Field
+from reobject.models.columns import numpy
+from reobject.query import Q
+from reobject.query.planner import ColumnScan
+
+
+class Reading(Model):
+    sensor = Field()
+    value = Field(column=True)
+    count = Field(default=0, column=True)
+    ok = Field(default=True, column=True)
+    taken = Field(default=None, column=True)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestColumns(unittest.TestCase):
+    def setUp(self):
+        start = datetime(2017, 1, 1)
+
+        for n in range(200):
+            Reading(
+                sensor='s{}'.format(n % 7),
+                value=n / 2,
+                count=n % 10,
+                ok=n % 3 != 0,
+                taken=start + timedelta(hours=n),
+            )
+
+    def tearDown(self):
+        Reading.objects.all().delete()
+
+    def assertMatchesScan(self, q):
+        queryset = Reading.objects.filter(q)
+        expected = [obj for obj in Reading.objects.all() if q.comparator(obj)]
+
+        self.assertIsInstance(queryset._plan().scan, ColumnScan)
+        self.assertEqual([id(obj) for obj in queryset], list(map(id, expected)))
+
+    def test_comparisons(self):
+        self.assertMatchesScan(Q(value__lt=50, count__gte=5))
+        self.assertMatchesScan(Q(value__gt=10.5) & Q(value__lte=20))
+        self.assertMatchesScan(Q(count=3))
+        self.assertMatchesScan(Q(count__in=[1, 2.0, 9]))
+        self.assertMatchesScan(Q(ok=False))
+        self.assertMatchesScan(Q(taken__gte=datetime(2017, 1, 5)))
+
+    def test_combinations(self):
+        self.assertMatchesScan(Q(value__lt=5) | ~Q(count__gte=2))
+        self.assertMatchesScan(~(Q(ok=True) & Q(count__lt=5)))
+        self.assertEqual(
+            Reading.objects.exclude(count__lt=9).count(), 20
+        )
+
+    def test_partial_lookups(self):
+        # Lookups on fields without a column are left for the comparator
+        self.assertMatchesScan(Q(value__lt=20, sensor='s3'))
+        self.assertMatchesScan(Q(count=1) & ~Q(sensor__startswith='s1'))
+
+        queryset = Reading.objects.filter(Q(count=1) | Q(sensor='s1'))
+        self.assertNotIsInstance(queryset._plan().scan, ColumnScan)
+
+    def test_values_not_fitting_the_column(self):
+        odd = Reading(sensor='odd', value='high', count=2 ** 70)
+
+        self.assertMatchesScan(Q(count__gte=5))
+        self.assertMatchesScan(Q(count__in=[2, 3]) | Q(value=1))
+
+        # Comparing a str or None with a number raises, as it would in Python
+        with self.assertRaises(TypeError):
+            list(Reading.objects.filter(value__lt=5))
+
+        odd.value = None
+
+        self.assertIs(Reading.objects.get(value=None), odd)
+        self.assertIs(Reading.objects.get(value__isnone=True), odd)
+        self.assertEqual(Reading.objects.filter(value__isnone=False).count(), 200)
+
+        with self.assertRaises(TypeError):
+            list(Reading.objects.filter(value__lt=5))
+
+    def test_precision(self):
+        # Rounded to 2 ** 53 if compared as float64
+        big = Reading(sensor='big', value=float(2 ** 53), count=2 ** 53 + 1)
+
+        self.assertMatchesScan(Q(count=float(2 ** 53)))
+        self.assertMatchesScan(Q(count__gt=float(2 ** 53)))
+        self.assertMatchesScan(Q(count__in=[float(2 ** 53), 3]))
+
+        # Left for the comparator
+        self.assertEqual(Reading.objects.filter(count__lt=2.5).count(), 60)
+        self.assertIs(Reading.objects.get(value__lt=2 ** 53 + 1, count__gt=9), big)
+        self.assertEqual(Reading.objects.filter(value=2 ** 53 + 1).count(), 0)
+
+    def test_assignment_and_delete(self):
+        Reading.objects.filter(count__lt=5).delete()
+
+        reading = Reading.objects.get(value=99.5)
+        reading.count = 100
+
+        self.assertIs(Reading.objects.get(count__gt=10), reading)
+        self.assertMatchesScan(Q(count__gte=7))
+        self.assertEqual(len(Reading.objects.store.columns), len(Reading.objects.store._objects))
+
+    def test_bulk_create(self):
+        Reading.objects.bulk_create(
+            {'sensor': 'bulk', 'value': n / 4, 'count': n % 3} for n in range(100)
+        )
+
+        self.assertMatchesScan(Q(value__lt=10, count=1))
+        self.assertEqual(Reading.objects.filter(sensor='bulk', count=2).count(), 33)
+        self.assertEqual(len(Reading.objects.store.columns), 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,412 @@
+import pickle
+import unittest
+from copy import copy, deepcopy
+from datetime import datetime, timedelta
+
+from reobject.exceptions import DoesNotExist
+from reobject.models import Model, Field
+from reobject.query import Q
+
+
+class Book(Model):
+    isbn = Field(index=True)
+    title = Field(default='')
+    tags = Field(default=None, index='hash')
+
+
+class Product(Model):
+    name = Field()
+    price = Field(index='sorted')
+
+
+class Event(Model):
+    name = Field()
+
+
+class Paper(Model):
+    title = Field(index=True)
+    authors = Field(default=(), index='inverted')
+
+
+class TestHashIndex(unittest.TestCase):
+    def tearDown(self):
+        Book.objects.all().delete()
+
+    @property
+    def index(self):
+        return Book.objects.store.indexes['isbn'][0]
+
+    def test_unknown_index_type(self):
+        with self.assertRaises(ValueError):
+            Field(index='bogus')
+
+    def test_add(self):
+        book = Book(isbn='0131103628')
+
+        self.assertIn(book, self.index)
+        self.assertEqual(
+            list(self.index.lookup('exact', '0131103628').values()), [book]
+        )
+
+    def test_filter_exact(self):
+        Book(isbn='a', title='foo')
+        Book(isbn='b', title='bar')
+        Book(isbn='a', title='baz')
+
+        self.assertEqual(
+            Book.objects.filter(isbn='a').values_list('title', flat=True),
+            ['foo', 'baz']
+        )
+        self.assertEqual(
+            Book.objects.filter(isbn__exact='b').values_list('title', flat=True),
+            ['bar']
+        )
+        self.assertEqual(
+            Book.objects.filter(isbn='a', title='baz').values_list('title', flat=True),
+            ['baz']
+        )
+        self.assertFalse(Book.objects.filter(isbn='c').exists())
+
+    def test_filter_in(self):
+        Book(isbn='a', title='foo')
+        Book(isbn='b', title='bar')
+        Book(isbn='c', title='baz')
+
+        self.assertEqual(
+            Book.objects.filter(isbn__in=['c', 'a']).values_list('title', flat=True),
+            ['foo', 'baz']
+        )
+
+    def test_filter_or_falls_back_to_scan(self):
+        Book(isbn='a', title='foo')
+        Book(isbn='b', title='bar')
+
+        self.assertEqual(
+            Book.objects.filter(Q(isbn='a') | Q(title='bar')).count(), 2
+        )
+
+    def test_get(self):
+        book = Book(isbn='a')
+        Book(isbn='b')
+
+        self.assertIs(Book.objects.get(isbn='a'), book)
+
+        with self.assertRaises(DoesNotExist):
+            Book.objects.get(isbn='c')
+
+    def test_exclude(self):
+        Book(isbn='a', title='foo')
+        Book(isbn='b', title='bar')
+        Book(isbn='a', title='baz')
+
+        self.assertEqual(
+            Book.objects.exclude(isbn='a').values_list('title', flat=True),
+            ['bar']
+        )
+        self.assertEqual(
+            Book.objects.exclude(isbn='a', title='foo').values_list('title', flat=True),
+            ['bar', 'baz']
+        )
+
+    def test_assignment(self):
+        book = Book(isbn='a')
+        book.isbn = 'b'
+
+        self.assertFalse(Book.objects.filter(isbn='a').exists())
+        self.assertIs(Book.objects.get(isbn='b'), book)
+
+    def test_copy(self):
+        book = Book(isbn='a', tags='x')
+        twin = copy(book)
+
+        self.assertEqual(len(Book.objects.filter(isbn='a')), 2)
+        self.assertEqual(len(Book.objects.filter(tags='x')), 2)
+
+        twin.isbn = 'b'
+        self.assertIs(Book.objects.get(isbn='b'), twin)
+
+    def test_delete(self):
+        book = Book(isbn='a')
+        twin = Book(isbn='a')
+
+        book.delete()
+
+        self.assertNotIn(book, self.index)
+        self.assertIs(Book.objects.get(isbn='a'), twin)
+
+        # A deleted object must not be indexed again on assignment
+        book.isbn = 'b'
+        self.assertFalse(Book.objects.filter(isbn='b').exists())
+
+    def test_unhashable_values(self):
+        Book(isbn='a', tags=['c', 'go'])
+        Book(isbn='b', tags=['python'])
+
+        self.assertEqual(
+            Book.objects.filter(tags=['python']).values_list('isbn', flat=True),
+            ['b']
+        )
+        self.assertEqual(
+            Book.objects.filter(tags__in=[['c', 'go']]).values_list('isbn', flat=True),
+            ['a']
+        )
+
+
+class TestSortedIndex(unittest.TestCase):
+    def setUp(self):
+        Product(name='a', price=30)
+        Product(name='b', price=10)
+        Product(name='c', price=20)
+        Product(name='d', price=10)
+
+    def tearDown(self):
+        Product.objects.all().delete()
+
+    @property
+    def index(self):
+        return Product.objects.store.sorted_index('price')
+
+    def names(self, queryset):
+        return list(queryset.values_list('name', flat=True))
+
+    def test_range_lookups(self):
+        self.assertEqual(self.names(Product.objects.filter(price__gt=10)), ['a', 'c'])
+        self.assertEqual(self.names(Product.objects.filter(price__gte=20)), ['a', 'c'])
+        self.assertEqual(self.names(Product.objects.filter(price__lt=20)), ['b', 'd'])
+        self.assertEqual(self.names(Product.objects.filter(price__lte=20)), ['b', 'c', 'd'])
+        self.assertEqual(self.names(Product.objects.filter(price=10)), ['b', 'd'])
+        self.assertEqual(
+            self.names(Product.objects.filter(price__gt=10, price__lt=30)), ['c']
+        )
+        self.assertEqual(
+            list(self.index.lookup('gt', 20).values()),
+            [Product.objects.get(name='a')]
+        )
+
+    def test_order_by(self):
+        self.assertEqual(self.names(Product.objects.all().order_by('price')), ['b', 'd', 'c', 'a'])
+        self.assertEqual(self.names(Product.objects.all().order_by('-price')), ['a', 'c', 'b', 'd'])
+        self.assertEqual(
+            self.names(Product.objects.all().order_by('-price')),
+            self.names(Product.objects.filter().order_by('-price'))
+        )
+
+    def test_earliest_latest(self):
+        self.assertEqual(Product.objects.earliest('price').name, 'b')
+        self.assertEqual(Product.objects.latest('price').name, 'a')
+
+    def test_assignment(self):
+        product = Product.objects.get(name='b')
+        product.price = 40
+
+        self.assertEqual(self.names(Product.objects.all().order_by('price')), ['d', 'c', 'a', 'b'])
+        self.assertEqual(self.names(Product.objects.filter(price__gt=30)), ['b'])
+
+        # Objects holding equal values keep their relative order
+        product.price = 10
+        self.assertEqual(self.names(Product.objects.all().order_by('price')), ['b', 'd', 'c', 'a'])
+
+    def test_none_values(self):
+        Product(name='e', price=None)
+
+        self.assertFalse(self.index.orderable)
+        self.assertEqual(
+            [p.name for p in self.index.lookup('lt', 20).values()], ['e', 'b', 'd']
+        )
+        self.assertEqual(Product.objects.earliest('price').name, 'b')
+
+        # Range lookups raise on None whichever plan is used
+        for n in range(7):
+            Product(name='f{}'.format(n), price=n)
+
+        with self.assertRaises(TypeError):
+            list(Product.objects.filter(price__gt=25))
+
+        with self.assertRaises(TypeError):
+            list(Product.objects.filter(price__gt=1))
+
+        self.assertEqual(self.names(Product.objects.filter(price=30)), ['a'])
+
+        with self.assertRaises(TypeError):
+            list(Product.objects.all().order_by('price'))
+
+    def test_delete(self):
+        Product.objects.get(name='c').delete()
+
+        self.assertEqual(self.names(Product.objects.filter(price__gt=10)), ['a'])
+        self.assertEqual(len(self.index), 3)
+
+    def test_bulk_create(self):
+        Product.objects.bulk_create([
+            {'name': 'e', 'price': 15}, ('f', 10), {'name': 'g', 'price': None}
+        ])
+
+        self.assertEqual(
+            [p.name for p in self.index.ascending()], ['b', 'd', 'f', 'e', 'c', 'a']
+        )
+        self.assertEqual(self.names(Product.objects.filter(price__isnone=True)), ['g'])
+
+        # Values which can't be compared are left for the comparator
+        Product.objects.bulk_create([('h', 'n/a'), ('i', 5)])
+
+        self.assertEqual(
+            sorted(p.name for p in self.index.lookup('lt', 10).values()),
+            ['g', 'h', 'i']
+        )
+        self.assertEqual(len(self.index), 9)
+
+    def test_copies(self):
+        product = Product.objects.get(name='a')
+        copies = [copy(product), deepcopy(product), pickle.loads(pickle.dumps(product))]
+
+        self.assertEqual(
+            self.names(Product.objects.order_by('-price')[:4]), ['a'] * 4
+        )
+        self.assertEqual(Product.objects.filter(price__gt=20).count(), 4)
+
+        for obj in copies:
+            self.assertIsNot(obj, product)
+            obj.price = 5
+
+        self.assertEqual(self.names(Product.objects.filter(price__lt=10)), ['a'] * 3)
+        self.assertEqual(len(self.index), 7)
+
+
+class TestInvertedIndex(unittest.TestCase):
+    def setUp(self):
+        Paper(title='c', authors=['Kernighan', 'Ritchie'])
+        Paper(title='go', authors=('Donovan', 'Kernighan'))
+        Paper(title='awk', authors={'Aho', 'Weinberger', 'Kernighan'})
+        Paper(title='unix', authors='Thompson and Ritchie')
+
+    def tearDown(self):
+        Paper.objects.all().delete()
+
+    @property
+    def index(self):
+        return Paper.objects.store.indexes['authors'][0]
+
+    def titles(self, *args, **kwargs):
+        return list(
+            Paper.objects.filter(*args, **kwargs).values_list('title', flat=True)
+        )
+
+    def test_contains(self):
+        self.assertEqual(self.titles(authors__contains='Kernighan'), ['c', 'go', 'awk'])
+        self.assertEqual(self.titles(authors__contains='Ritchie'), ['c', 'unix'])
+        self.assertEqual(self.titles(authors__contains='Pike'), [])
+
+    def test_icontains(self):
+        self.assertEqual(self.titles(authors__icontains='kernighan'), ['c', 'go', 'awk'])
+        self.assertEqual(self.titles(authors__icontains='THOMPSON'), ['unix'])
+
+    def test_non_string_elements(self):
+        Paper.objects.get(title='unix').delete()
+        Paper(title='numbers', authors=[1, 2])
+
+        self.assertEqual(self.titles(authors__contains=2), ['numbers'])
+
+        with self.assertRaises(TypeError):
+            self.titles(authors__icontains='kernighan')
+
+    def test_combinations(self):
+        self.assertEqual(
+            self.titles(Q(authors__contains='Kernighan') & Q(authors__contains='Ritchie')),
+            ['c']
+        )
+        self.assertEqual(
+            self.titles(Q(authors__contains='Donovan') | Q(authors__contains='Aho')),
+            ['go', 'awk']
+        )
+        self.assertEqual(
+            self.titles(Q(authors__contains='Kernighan') & ~Q(title='go')),
+            ['c', 'awk']
+        )
+        self.assertEqual(
+            self.titles(Q(title='c') | Q(authors__icontains='aho')),
+            ['c', 'awk']
+        )
+
+    def test_assignment(self):
+        paper = Paper.objects.get(title='go')
+        paper.authors = ['Pike']
+
+        self.assertEqual(self.titles(authors__contains='Kernighan'), ['c', 'awk'])
+        self.assertEqual(self.titles(authors__contains='Pike'), ['go'])
+
+    def test_changed_in_place(self):
+        Paper.objects.get(title='c').authors.append('Pike')
+        Paper.objects.get(title='awk').authors.discard('Aho')
+
+        self.assertEqual(self.titles(authors__contains='Pike'), ['c'])
+        self.assertEqual(self.titles(authors__icontains='aho'), [])
+
+        # Only the tuple is filed, lists and sets are left to the comparator
+        self.assertEqual(self.index.estimate('contains', 'Donovan'), 4)
+        self.assertEqual(self.index.estimate('contains', 'Pike'), 3)
+
+    def test_delete(self):
+        Paper.objects.filter(authors__contains='Ritchie').delete()
+
+        self.assertEqual(self.titles(authors__contains='Kernighan'), ['go', 'awk'])
+        self.assertEqual(len(self.index), 2)
+
+
+class TestTimeIndex(unittest.TestCase):
+    def setUp(self):
+        self.events = [Event(name=str(n)) for n in range(100)]
+
+    def tearDown(self):
+        Event.objects.all().delete()
+
+    @property
+    def index(self):
+        return Event.objects.store.sorted_index('created')
+
+    def test_first_last(self):
+        self.assertIs(Event.objects.first(), self.events[0])
+        self.assertIs(Event.objects.last(), self.events[-1])
+        self.assertIs(Event.objects.all().last(), self.events[-1])
+
+        for event in self.events[:10] + self.events[-10:]:
+            event.delete()
+
+        self.assertIs(Event.objects.first(), self.events[10])
+        self.assertIs(Event.objects.last(), self.events[-11])
+        self.assertIs(Event.objects.all().last(), self.events[-11])
+
+    def test_reassignment(self):
+        self.events[50].created = self.events[0].created - timedelta(days=1)
+        self.events[3].created = datetime.utcnow() + timedelta(days=1)
+
+        self.assertIs(Event.objects.earliest(), self.events[50])
+        self.assertIs(Event.objects.latest(), self.events[3])
+        self.assertEqual(
+            list(Event.objects.all().order_by('-created')[:2]),
+            [self.events[3], self.events[-1]]
+        )
+
+    def test_time_window(self):
+        start, end = self.events[20].created, self.events[29].created
+        queryset = Event.objects.filter(created__gte=start, created__lte=end)
+
+        self.assertEqual(
+            [int(name) for name in queryset.values_list('name', flat=True)],
+            [n for n in range(100) if start <= self.events[n].created <= end]
+        )
+        self.assertEqual(
+            Event.objects.filter(updated__lt=start).count(),
+            sum(1 for event in self.events if event.updated < start)
+        )
+
+    def test_delete_many(self):
+        Event.objects.filter(name__in=[str(n) for n in range(0, 100, 2)]).delete()
+
+        self.assertEqual(len(self.index), 50)
+        self.assertEqual(list(self.index.ascending()), self.events[1::2])
+        self.assertEqual(list(self.index.descending()), self.events[1::2][::-1])
+        self.assertEqual(self.index.distinct, len(set(e.created for e in self.events[1::2])))
+
+
+if __name__ == '__main__':
+    unittest.main()
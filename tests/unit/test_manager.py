@@ -1,9 +1,11 @@
+import gc
 import unittest
 from datetime import datetime
 
 from reobject.models.fields import Field, ForeignKey
 from reobject.models.manager import Manager
 from reobject.models.model import Model
+from reobject.query.planner import IndexScan, RelatedLookup
 
 
 class SomeModel(Model):
@@ -59,13 +61,18 @@ class TestQuery(unittest.TestCase):
 
 
 class Teacher(Model):
-    pass
+    name = Field(default=None)
 
 
 class Student(Model):
     teacher = ForeignKey(Teacher)
 
 
+class Course(Model):
+    title = Field()
+    lecturer = ForeignKey(Teacher)
+
+
 class TestRelatedManager(unittest.TestCase):
     def setUp(self):
         self.teacher_a = Teacher()
@@ -80,6 +87,7 @@ class TestRelatedManager(unittest.TestCase):
     def tearDown(self):
         Teacher.objects.all().delete()
         Student.objects.all().delete()
+        Course.objects.all().delete()
 
     def test_manager_cls(self):
         self.assertIsInstance(Teacher.objects, Manager)
@@ -106,3 +114,140 @@ class TestRelatedManager(unittest.TestCase):
         self.assertEqual(
             self.teacher_b.student_set.count(), 2
         )
+
+    def test_manager_cached(self):
+        manager = self.teacher_a.student_set
+
+        self.assertIs(self.teacher_a.student_set, manager)
+        self.assertIsNot(self.teacher_b.student_set, manager)
+        self.assertIs(manager.instance, self.teacher_a)
+
+    def test_manager_released(self):
+        teacher = Teacher()
+        descriptor = Teacher.__dict__['student_set']
+        pk = teacher.pk
+
+        self.assertEqual(teacher.student_set.count(), 0)
+        self.assertIn(pk, descriptor.managers)
+
+        teacher.delete()
+        del teacher
+        gc.collect()
+
+        self.assertNotIn(pk, descriptor.managers)
+
+    def test_reverse_index(self):
+        teacher = Teacher()
+
+        for _ in range(50):
+            Student(teacher=teacher)
+
+        students = self.teacher_a.student_set.all()
+
+        self.assertIsInstance(students._plan().scan, IndexScan)
+
+        student = students.first()
+        student.teacher = self.teacher_b
+
+        self.assertEqual(self.teacher_a.student_set.count(), 2)
+        self.assertEqual(self.teacher_b.student_set.count(), 3)
+        self.assertIn(student, list(self.teacher_b.student_set.all()))
+
+        student.delete()
+
+        self.assertEqual(self.teacher_b.student_set.count(), 2)
+
+    def test_field_name(self):
+        course = Course(title='Algebra', lecturer=self.teacher_b)
+
+        self.assertEqual(list(self.teacher_b.course_set.all()), [course])
+        self.assertEqual(self.teacher_a.course_set.count(), 0)
+
+    def test_prefetch_related(self):
+        teachers = Teacher.objects.all().prefetch_related('student_set')
+        expected = [
+            list(Student.objects.filter(teacher__pk=teacher.pk))
+            for teacher in teachers
+        ]
+
+        for teacher, students in zip(teachers, expected):
+            queryset = teacher.student_set.all()
+
+            self.assertTrue(queryset._filled)
+            self.assertEqual(list(queryset), students)
+
+        # Changes to the related objects invalidate the prefetched ones
+        student = Student(teacher=self.teacher_b)
+        queryset = self.teacher_b.student_set.all()
+
+        self.assertFalse(queryset._filled)
+        self.assertEqual(queryset.count(), 3)
+        self.assertIn(student, queryset)
+
+    def test_prefetch_related_join(self):
+        # Enough related objects to look them up in a single pass
+        for _ in range(50):
+            Student(teacher=Teacher())
+
+        teachers = list(Teacher.objects.prefetch_related('student_set', 'course_set'))
+
+        for teacher in teachers:
+            self.assertEqual(
+                list(teacher.student_set.all()),
+                list(Student.objects.filter(teacher__pk=teacher.pk))
+            )
+            self.assertEqual(teacher.course_set.count(), 0)
+
+        with self.assertRaises(AttributeError):
+            list(Teacher.objects.prefetch_related('pupil_set'))
+
+    def test_select_related(self):
+        self.teacher_a.name = 'Ada'
+        self.teacher_b.name = 'Grace'
+
+        for n in range(50):
+            Student(teacher=Teacher(name='t{}'.format(n)))
+
+        queryset = Student.objects.select_related('teacher').filter(teacher__name='Ada')
+        scan = queryset._plan().scan
+
+        self.assertIsInstance(scan, IndexScan)
+        self.assertIsInstance(scan.node, RelatedLookup)
+        self.assertEqual(list(queryset), list(self.teacher_a.student_set.all()))
+
+        Student(teacher=None)
+        queryset = Student.objects.select_related().filter(
+            teacher__isnone=False
+        ).filter(teacher__name__startswith='t1')
+        self.assertEqual(queryset.count(), 11)
+
+        with self.assertRaises(AttributeError):
+            # Raises on the student without teacher, as without select_related()
+            list(Student.objects.select_related().filter(teacher__name__isnone=True))
+
+        with self.assertRaises(ValueError):
+            Student.objects.select_related('teacher__name')
+
+    def test_bulk_create(self):
+        students = Student.objects.bulk_create(
+            [{'teacher': self.teacher_b}, (self.teacher_a,)]
+        )
+
+        self.assertEqual(Student.objects.count(), 7)
+        self.assertEqual(students[0].created, students[1].created)
+        self.assertIs(Student.objects.last(), students[1])
+        self.assertEqual(self.teacher_b.student_set.count(), 3)
+        self.assertIn(students[1], list(self.teacher_a.student_set.all()))
+
+        courses = Course.objects.from_records(
+            [('Algebra', self.teacher_a), ('Logic', self.teacher_b)],
+            fields=('title', 'lecturer')
+        )
+
+        self.assertEqual([course.title for course in courses], ['Algebra', 'Logic'])
+        self.assertEqual(list(self.teacher_b.course_set.all()), [courses[1]])
+
+        with self.assertRaises(TypeError):
+            Course.objects.bulk_create([{'title': 'Ethics'}])
+
+        self.assertEqual(Course.objects.count(), 2)
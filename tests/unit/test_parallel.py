@@ -0,0 +1,136 @@
+import unittest
+from datetime import datetime, timedelta
+
+from reobject.models import Model, Field
+from reobject.models.columns import numpy
+from reobject.models.parallel import ParallelExecutor, SharedMemory
+from reobject.query import Avg, Count, Max, Min, Q, Sum
+from reobject.query.planner import ColumnScan
+
+
+class Trade(Model):
+    side = Field()
+    price = Field(column=True)
+    qty = Field(column=True)
+    at = Field(column=True)
+
+
+@unittest.skipIf(numpy is None or SharedMemory is None,
+                 'NumPy or multiprocessing.shared_memory is not available')
+class TestParallelExecutor(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ParallelExecutor(processes=3, min_rows=100)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.close()
+
+    def setUp(self):
+        start = datetime(2017, 1, 1)
+        Trade.objects.bulk_create(
+            ('buy' if n % 3 else 'sell', (n * 7919) % 1000 / 4, n % 13,
+             start + timedelta(minutes=n % 500))
+            for n in range(2000)
+        )
+        Trade.objects.set_executor(self.executor)
+
+    def tearDown(self):
+        Trade.objects.set_executor(None)
+        Trade.objects.all().delete()
+
+    def serial(self, queryset) -> list:
+        Trade.objects.set_executor(None)
+
+        try:
+            return list(queryset._clone())
+        finally:
+            Trade.objects.set_executor(self.executor)
+
+    def assertParallel(self, queryset):
+        self.assertIsInstance(queryset._plan().scan, ColumnScan)
+        self.assertEqual(
+            list(map(id, queryset._clone())), list(map(id, self.serial(queryset)))
+        )
+
+    def test_select(self):
+        self.assertParallel(Trade.objects.filter(price__lt=100, qty__gte=5))
+        self.assertParallel(Trade.objects.filter(Q(qty=3) | Q(price__gt=240)))
+        self.assertParallel(Trade.objects.exclude(at__lt=datetime(2017, 1, 1, 4)))
+        self.assertParallel(Trade.objects.filter(qty__in=[1, 2], side='sell'))
+
+    def test_order(self):
+        self.assertParallel(Trade.objects.filter(qty__lt=4).order_by('price'))
+        self.assertParallel(Trade.objects.filter(qty__lt=4).order_by('-qty'))
+        self.assertParallel(
+            Trade.objects.filter(price__gt=50).order_by('at').reverse()[:100]
+        )
+        self.assertEqual(
+            list(Trade.objects.filter(qty=1).order_by('-price').values_list(
+                'price', flat=True
+            )),
+            sorted(Trade.objects.filter(qty=1).values_list('price', flat=True),
+                   reverse=True)
+        )
+
+    def test_aggregate(self):
+        aggregates = dict(
+            total=Sum('qty'), avg=Avg('price'), low=Min('at'), high=Max('price'),
+            n=Count(), prices=Count('price', distinct=True),
+        )
+        queryset = Trade.objects.filter(qty__gte=2)
+        result = queryset.aggregate(**aggregates)
+        expected = dict(zip(
+            aggregates, queryset._aggregate_objects(list(aggregates.values()))
+        ))
+
+        self.assertEqual(result, expected)
+
+    def test_changes(self):
+        queryset = Trade.objects.filter(qty=12)
+        trade = Trade(side='buy', price=1.0, qty=12, at=datetime(2017, 1, 1))
+        Trade.objects.filter(qty=12, price__gt=200).delete()
+        Trade.objects.filter(qty=11).first().qty = 12
+
+        self.assertParallel(queryset)
+        self.assertIn(trade, queryset._clone())
+        self.assertEqual(
+            queryset.aggregate(n=Count())['n'], len(self.serial(queryset))
+        )
+
+    def test_fallback(self):
+        # Values which don't fit in the columns
+        Trade(side='buy', price=2 ** 60, qty=2 ** 70, at=None)
+
+        self.assertParallel(Trade.objects.filter(price__gt=10).order_by('qty'))
+        self.assertParallel(Trade.objects.filter(qty__gt=10).order_by('-price'))
+        self.assertEqual(
+            Trade.objects.filter(price__lt=10).aggregate(n=Count('qty')),
+            {'n': Trade.objects.filter(price__lt=10).count()}
+        )
+        self.assertEqual(
+            Trade.objects.aggregate(Max('qty')), {'qty__max': 2 ** 70}
+        )
+
+    def test_small_stores(self):
+        Trade.objects.filter(price__gt=1).delete()
+        columns = Trade.objects.store.columns
+
+        self.assertLess(len(columns), self.executor.min_rows)
+        self.assertEqual(
+            len(columns.select(Q(qty=0))[0]),
+            Trade.objects.filter(qty=0).count()
+        )
+        self.assertNotEqual(
+            self.executor._state['exports'][id(columns)][0], columns.version
+        )
+
+    def test_set_executor(self):
+        with self.assertRaises(ValueError):
+            type('Plain', (Model,), {'x': Field()}).objects.set_executor(
+                self.executor
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import enum
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from reobject import persist
+from reobject.models import Model, Field
+from reobject.models.columns import ColumnMirror, numpy
+from reobject.models.fields import ForeignKey
+from reobject.query import Q
+
+
+class Level(enum.IntEnum):
+    LOW = 1
+    HIGH = 2
+
+
+class Shelf(Model):
+    label = Field(index='hash')
+
+
+class Volume(Model):
+    title = Field(index='hash')
+    price = Field(column=True, index='sorted')
+    shelf = ForeignKey(Shelf)
+    pages = Field(default=None, column=True)
+    level = Field(default=Level.LOW)
+    printed = Field(default=None)
+    tags = Field(default=list)
+
+
+class Pin(Model, slots=True):
+    x = Field()
+    y = Field()
+
+
+class TestPersist(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+        self.shelves = [Shelf(label='s{}'.format(n)) for n in range(3)]
+        start = datetime(2017, 1, 1)
+
+        for n in range(50):
+            Volume(
+                title='b{}'.format(n),
+                price=float(n % 7) if n % 5 else n % 7,
+                pages=None if n % 4 == 0 else n * 10,
+                level=Level.HIGH if n % 2 else Level.LOW,
+                printed=start + timedelta(days=n) if n % 3 else
+                datetime(2017, 1, 1, tzinfo=timezone.utc),
+                shelf=self.shelves[n % 3],
+                tags=['t{}'.format(n % 4)],
+            )
+
+        Pin(x=1, y='a')
+        Pin(x=2.5, y=None)
+
+    def tearDown(self):
+        Volume.objects.all().delete()
+        Shelf.objects.all().delete()
+        Pin.objects.all().delete()
+        os.remove(self.path)
+
+    def reload(self) -> None:
+        persist.save(self.path)
+        Volume.objects.all().delete()
+        Shelf.objects.all().delete()
+        Pin.objects.all().delete()
+        persist.load(self.path)
+
+    @staticmethod
+    def state(obj) -> tuple:
+        return tuple(
+            (name, getattr(obj, name), type(getattr(obj, name)))
+            for name in sorted(obj._attrs - {'id', 'shelf'})
+        )
+
+    def test_round_trip(self):
+        books = list(map(self.state, Volume.objects.all()))
+        pins = list(map(self.state, Pin.objects.all()))
+        self.reload()
+
+        self.assertEqual(list(map(self.state, Volume.objects.all())), books)
+        self.assertEqual(list(map(self.state, Pin.objects.all())), pins)
+        self.assertEqual(Volume.objects.count(), 50)
+
+    def test_references(self):
+        self.reload()
+        shelves = list(Shelf.objects.all())
+
+        for n, book in enumerate(Volume.objects.all()):
+            self.assertIs(book.shelf, shelves[n % 3])
+
+        self.assertEqual(len(shelves[1].volume_set.all()), 17)
+        self.assertEqual(
+            Volume.objects.filter(shelf__pk=shelves[2].pk).count(), 16
+        )
+
+    def test_detached_references(self):
+        shelf = self.shelves[0]
+        Volume.objects.filter(shelf__pk=shelf.pk).delete()
+        book = Volume(title='extra', price=1.0, shelf=shelf)
+        book.note = 'kept'
+        shelf.delete()
+        self.reload()
+
+        book = Volume.objects.get(title='extra')
+        self.assertEqual(book.note, 'kept')
+        self.assertEqual(book.shelf.label, 's0')
+        self.assertNotIn(book.shelf, Shelf.objects.store)
+        self.assertEqual(Shelf.objects.count(), 2)
+
+    def test_indexes(self):
+        expected = [book.title for book in Volume.objects.order_by('-price')]
+        latest = Volume.objects.latest('updated').title
+        self.reload()
+
+        self.assertEqual(
+            [book.title for book in Volume.objects.order_by('-price')], expected
+        )
+        self.assertEqual(Volume.objects.latest('updated').title, latest)
+        self.assertEqual(Volume.objects.get(title='b7').pages, 70)
+        self.assertEqual(Volume.objects.filter(price__gte=6).count(), 7)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_columns(self):
+        self.reload()
+        books = list(Volume.objects.all())
+        mirror = Volume.objects.store.columns
+        rebuilt = ColumnMirror(mirror.columns)
+        rebuilt.extend(books)
+
+        # Taken from the snapshot, the columns match columns built afresh
+        for field, column in rebuilt.columns.items():
+            restored = mirror.columns[field]
+            self.assertEqual(restored.kind, column.kind)
+            self.assertEqual(restored.valid.tolist(), column.valid[:50].tolist())
+            self.assertEqual(restored.null.tolist(), column.null[:50].tolist())
+            self.assertEqual(
+                restored.data[restored.valid].tolist(),
+                column.data[:50][column.valid[:50]].tolist()
+            )
+
+        # and still follow changes
+        book = Volume.objects.get(title='b1')
+        book.pages = 5000
+        positions, known = mirror.select(Q(pages__gt=4000))
+        self.assertEqual(
+            [row for row, match in zip(positions, known) if match], [1]
+        )
+
+    def test_changes_after_loading(self):
+        self.reload()
+        book = Volume.objects.get(title='b3')
+        book.price = 100.0
+
+        self.assertEqual(Volume.objects.order_by('price').last(), book)
+        self.assertEqual(book.dirty_fields, {'price'})
+
+        Volume(title='new', price=0.5, shelf=Shelf.objects.first())
+        self.assertEqual(Volume.objects.count(), 51)
+
+    def test_stores_not_empty(self):
+        persist.save(self.path)
+
+        with self.assertRaises(ValueError):
+            persist.load(self.path)
+
+    def test_not_a_snapshot(self):
+        with open(self.path, 'wb') as file:
+            file.write(b'not a snapshot at all')
+
+        with self.assertRaises(ValueError):
+            persist.load(self.path)
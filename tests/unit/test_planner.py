@@ -0,0 +1,119 @@
+import unittest
+
+from reobject.models import Model, Field
+from reobject.query import Q
+from reobject.query.planner import (
+    ComplementScan, FullScan, IndexOrderScan, IndexScan, Intersection, Union
+)
+
+
+class Order(Model):
+    n = Field()
+    status = Field(index=True)
+    total = Field(index='sorted')
+    region = Field(index=True)
+
+
+class TestPlanner(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for n in range(1000):
+            Order(n=n, status=n % 100, total=n, region=n % 4)
+
+    @classmethod
+    def tearDownClass(cls):
+        Order.objects.all().delete()
+
+    def scan(self, queryset):
+        return queryset._plan().scan
+
+    def test_full_scan(self):
+        queryset = Order.objects.filter(n__lt=10)
+
+        self.assertIsInstance(self.scan(queryset), FullScan)
+        self.assertEqual(queryset.count(), 10)
+
+    def test_unselective_index_is_skipped(self):
+        queryset = Order.objects.filter(total__gt=10)
+
+        self.assertIsInstance(self.scan(queryset), FullScan)
+        self.assertEqual(queryset.count(), 989)
+
+    def test_most_selective_index(self):
+        queryset = Order.objects.filter(region=1, status=5)
+        scan = self.scan(queryset)
+
+        self.assertIsInstance(scan, IndexScan)
+        self.assertEqual(repr(scan.node.index), 'HashIndex(status)')
+        self.assertEqual(queryset.values_list('n', flat=True), list(range(5, 1000, 100)))
+
+    def test_intersection(self):
+        queryset = Order.objects.filter(status__in=range(0, 100, 5), total__lt=200)
+        scan = self.scan(queryset)
+
+        self.assertIsInstance(scan, IndexScan)
+        self.assertIsInstance(scan.node, Intersection)
+        self.assertEqual(queryset.values_list('n', flat=True), list(range(0, 200, 5)))
+
+    def test_union(self):
+        queryset = Order.objects.filter(Q(status=1) | Q(total__gte=990))
+        scan = self.scan(queryset)
+
+        self.assertIsInstance(scan, IndexScan)
+        self.assertIsInstance(scan.node, Union)
+        self.assertEqual(queryset.count(), 20)
+
+        queryset = Order.objects.filter(Q(status=1) | Q(n=3))
+        self.assertIsInstance(self.scan(queryset), FullScan)
+
+    def test_complement(self):
+        queryset = Order.objects.exclude(region=1)
+
+        self.assertIsInstance(self.scan(queryset), ComplementScan)
+        self.assertEqual(queryset.count(), 750)
+
+    def test_pk(self):
+        order = Order.objects.get(n=42)
+        queryset = Order.objects.filter(id=order.id)
+
+        self.assertIsInstance(self.scan(queryset), IndexScan)
+        self.assertIs(queryset.get(), order)
+
+    def test_order_by(self):
+        queryset = Order.objects.filter(n__gte=995).order_by('-total')
+
+        self.assertIsInstance(self.scan(queryset), IndexOrderScan)
+        self.assertEqual(
+            queryset.values_list('n', flat=True), [999, 998, 997, 996, 995]
+        )
+
+        # Sorting a few candidates beats streaming the whole index
+        queryset = Order.objects.filter(status=7).order_by('-total')
+
+        self.assertIsInstance(self.scan(queryset), IndexScan)
+        self.assertEqual(
+            queryset.values_list('n', flat=True), list(range(907, 0, -100))
+        )
+
+    def test_explain(self):
+        queryset = Order.objects.filter(status=5, n__gt=500)
+        lines = queryset.explain().splitlines()
+
+        self.assertEqual(lines, [
+            'IndexScan [estimated 10 rows]',
+            '  IndexLookup <Q: status=5> using HashIndex(status) '
+            '(1000 rows, 100 distinct values) [estimated 10 rows]',
+            'Filter: <Q: (status=5 AND n__gt=500)>',
+            'Estimated rows scanned: 10',
+            'Actual rows scanned: 10',
+            'Rows returned: 5',
+        ])
+
+        lines = Order.objects.filter(n=3).order_by('total').explain().splitlines()
+
+        self.assertEqual(lines[0], 'IndexOrderScan using SortedIndex(total) [estimated 1000 rows]')
+        self.assertEqual(lines[-2:], ['Actual rows scanned: 1000', 'Rows returned: 1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
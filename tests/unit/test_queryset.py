@@ -51,6 +51,27 @@ class TestQuerySet(unittest.TestCase):
         self.assertEqual(_len, 1)
         self.assertEqual(_type, {'SomeModel': 1})
 
+    def test_delete_overridden(self):
+        calls = []
+
+        class Logged(Model):
+            x = Field()
+
+            def delete(self):
+                calls.append(self.x)
+                super().delete()
+
+        Logged(x=0)
+        Logged(x=1)
+        Logged(x=2)
+
+        _len, _type = Logged.objects.filter(x__gte=1).delete()
+        self.assertEqual(sorted(calls), [1, 2])
+        self.assertEqual(_len, 2)
+        self.assertEqual(Logged.objects.count(), 1)
+
+        Logged.objects.all().delete()
+
     def test_distinct(self):
         SomeModel(p='foo')
         SomeModel(p='foo')
@@ -378,6 +399,125 @@ class TestQuerySet(unittest.TestCase):
 
         self.assertEqual(set(result), {'FOO', 'BAR'})
 
+    def test_lazy_evaluation(self):
+        queryset = SomeModel.objects.filter(p='foo').order_by('q').values_list('q', flat=True)
+
+        SomeModel(p='foo', q=2)
+        SomeModel(p='bar', q=3)
+        SomeModel(p='foo', q=1)
+
+        self.assertEqual(queryset, [1, 2])
+        self.assertEqual(len(queryset), 2)
+        self.assertEqual(queryset[1], 2)
+        self.assertTrue(queryset)
+
+        # Results are cached once evaluated
+        SomeModel(p='foo', q=0)
+        self.assertEqual(queryset, [1, 2])
+
+    def test_queryset_is_a_list(self):
+        SomeModel(p='foo', q=1)
+        SomeModel(p='bar', q=2)
+
+        queryset = SomeModel.objects.filter().order_by('q')
+
+        self.assertIsInstance(queryset, list)
+        self.assertFalse(queryset._filled)
+        self.assertEqual([0] + queryset.values_list('q', flat=True), [0, 1, 2])
+
+        queryset.append(None)
+        self.assertTrue(queryset._filled)
+        self.assertEqual(len(queryset), 3)
+
+        # Filters following values() apply to the rows
+        self.assertEqual(
+            SomeModel.objects.filter().values('p', 'q').filter(q=2),
+            [{'p': 'bar', 'q': 2}]
+        )
+
+    def test_filter_fusion(self):
+        queryset = SomeModel.objects.filter(p='foo').exclude(q=1).filter(r=None)
+
+        self.assertIsNotNone(queryset._where)
+        self.assertFalse(queryset._filled)
+
+        SomeModel(p='foo', q=1)
+        SomeModel(p='foo', q=2)
+
+        self.assertEqual(queryset.values_list('q', flat=True), [2])
+
+    def test_short_circuit(self):
+        SomeModel(p='foo', q=1)
+        SomeModel(p=None, q=2)
+
+        # Evaluating the lookup against the second object would raise
+        queryset = SomeModel.objects.filter(p__startswith='f')
+
+        self.assertTrue(queryset.exists())
+        self.assertEqual(queryset.first().q, 1)
+
+        with self.assertRaises(AttributeError):
+            len(queryset)
+
+    def test_get_multiple_objects_returned_bound(self):
+        for _ in range(30):
+            SomeModel(p='foo')
+
+        with self.assertRaisesRegex(MultipleObjectsReturned, 'more than 20'):
+            SomeModel.objects.get(p='foo')
+
+    def test_values_list_order_by(self):
+        SomeModel(p='foo', q=2)
+        SomeModel(p='bar', q=1)
+
+        self.assertEqual(
+            SomeModel.objects.all().values_list('p', flat=True).order_by('q'),
+            ['bar', 'foo']
+        )
+
+    def test_lazy_slicing(self):
+        for q in (3, 1, 2):
+            SomeModel(p='foo', q=q)
+
+        queryset = SomeModel.objects.order_by('q')[:2]
+        SomeModel(p='bar', q=0)
+
+        self.assertEqual(queryset.values_list('q', flat=True), [0, 1])
+        self.assertEqual(queryset[1:].values_list('q', flat=True), [1])
+        self.assertEqual(SomeModel.objects.order_by('q')[1:][1:3].values_list('q', flat=True), [2, 3])
+        self.assertEqual(SomeModel.objects.order_by('-q')[2].q, 1)
+        self.assertEqual(SomeModel.objects.order_by('q')[-1].q, 3)
+        self.assertEqual(SomeModel.objects.order_by('q')[::2].values_list('q', flat=True), [0, 2])
+        self.assertEqual(SomeModel.objects.filter(p='foo')[:2].count(), 2)
+
+        with self.assertRaises(IndexError):
+            SomeModel.objects.order_by('q')[4]
+
+        for method in ('filter', 'exclude', 'delete', 'reverse'):
+            with self.assertRaises(TypeError):
+                getattr(queryset, method)()
+
+        with self.assertRaises(TypeError):
+            queryset.order_by('p')
+
+    def test_top_k(self):
+        for q in range(100):
+            SomeModel(p=q % 7, q=q % 10)
+
+        ordered = SomeModel.objects.order_by('-q', 'p')
+        expected = sorted(SomeModel.objects.all(), key=lambda o: (-o.q, o.p))
+
+        self.assertTrue(ordered[:5]._plan().top)
+        self.assertEqual(list(ordered[:5]), expected[:5])
+        self.assertEqual(list(ordered[2:6]), expected[2:6])
+        self.assertEqual(list(ordered.reverse()[:5]), expected[::-1][:5])
+        self.assertIs(ordered.first(), expected[0])
+        self.assertIs(ordered.last(), expected[-1])
+        by_q = sorted(SomeModel.objects.all(), key=lambda o: o.q)
+        self.assertIs(SomeModel.objects.earliest('q'), by_q[0])
+        self.assertIs(SomeModel.objects.latest('q'), by_q[-1])
+        self.assertIn('Top 5', ordered[:5].explain())
+
     def test_manager_map_non_callable(self):
         SomeModel(p='foo', q=1)
         SomeModel(p='bar', q=2)
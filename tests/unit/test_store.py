@@ -0,0 +1,258 @@
+import sys
+import threading
+import unittest
+
+from reobject import atomic
+from reobject.models import Model, Field
+from reobject.models.fields import ForeignKey
+from reobject.models.lock import ReadWriteLock
+from reobject.models.store import Store, SynchronizedStore
+
+
+class Item(Model):
+    n = Field()
+
+
+class Point(Model, slots=True):
+    x = Field(index=True)
+    y = Field(default=0)
+
+
+class Label(Model, slots=True):
+    text = Field()
+    point = ForeignKey(Point)
+
+
+class Measure(Model, threadsafe=True):
+    group = Field(index=True)
+    value = Field(index='sorted')
+
+
+class TestStore(unittest.TestCase):
+    def tearDown(self):
+        Item.objects.all().delete()
+
+    @property
+    def store(self) -> Store:
+        return Item.objects.store
+
+    def test_insertion_order(self):
+        items = [Item(n=n) for n in range(100)]
+
+        for item in items[::3]:
+            item.delete()
+
+        expected = [item for i, item in enumerate(items) if i % 3]
+
+        self.assertEqual(len(self.store), len(expected))
+        self.assertEqual([id(obj) for obj in self.store], list(map(id, expected)))
+        self.assertIs(Item.objects.all().first(), expected[0])
+        self.assertIs(Item.objects.all().last(), expected[-1])
+
+    def test_membership(self):
+        item = Item(n=1)
+        twin = Item(n=1)
+
+        self.assertIn(item, self.store)
+        self.assertIs(self.store.get(item.pk), item)
+
+        item.delete()
+
+        # Model instances compare by value, the twin must stay tracked
+        self.assertNotIn(item, self.store)
+        self.assertIn(twin, self.store)
+        self.assertIsNone(self.store.get(item.pk))
+
+        with self.assertRaises(ValueError):
+            item.delete()
+
+    def test_append_twice(self):
+        item = Item(n=1)
+        self.store.append(item)
+
+        self.assertEqual(len(self.store), 1)
+
+    def test_bulk_delete(self):
+        items = [Item(n=n % 4) for n in range(1000)]
+
+        count, _ = Item.objects.filter(n=0).delete()
+
+        self.assertEqual(count, 250)
+        self.assertEqual(len(self.store), 750)
+        self.assertEqual(
+            [id(obj) for obj in self.store],
+            [id(item) for item in items if item.n]
+        )
+        self.assertEqual(Item.objects.filter(n=0).delete(), (0, {'Item': 0}))
+
+    def test_lookup_by_pk(self):
+        item = Item(n=1)
+        other = Item(n=2)
+
+        self.assertIs(Item.objects.get(pk=item.pk), item)
+        self.assertIs(Item.objects.get(id=other.id), other)
+        self.assertEqual(
+            list(Item.objects.filter(id__in=[other.id, item.id])), [item, other]
+        )
+
+
+class TestSlots(unittest.TestCase):
+    def tearDown(self):
+        Label.objects.all().delete()
+        Point.objects.all().delete()
+
+    def test_no_dict(self):
+        point = Point(x=1)
+
+        self.assertFalse(hasattr(point, '__dict__'))
+        self.assertIsNotNone(point.created)
+        self.assertEqual(point._attrs, {'id', 'x', 'y', 'created', 'updated'})
+
+        with self.assertRaises(AttributeError):
+            point.z = 1
+
+    def test_queries(self):
+        points = [Point(x=n % 3, y=n) for n in range(10)]
+        points[0].x = 5
+
+        self.assertIs(Point.objects.get(x=5), points[0])
+        self.assertEqual(Point.objects.filter(x=1).count(), 3)
+        self.assertEqual(
+            list(Point.objects.filter(y__lt=2).values('x', 'y')),
+            [{'x': 5, 'y': 0}, {'x': 1, 'y': 1}]
+        )
+
+        label = Label(text='origin', point=points[0])
+
+        self.assertEqual(list(points[0].label_set.all()), [label])
+        self.assertIs(Label.objects.get(point__x=5), label)
+
+
+class TestReadWriteLock(unittest.TestCase):
+    def test_reentrant(self):
+        lock = ReadWriteLock()
+
+        with lock.write:
+            with lock.write:
+                with lock.read:
+                    pass
+
+        with lock.read:
+            with lock.read:
+                with self.assertRaises(RuntimeError):
+                    lock.acquire_write()
+
+        with lock.write:
+            pass
+
+    def test_shared_reads(self):
+        lock = ReadWriteLock()
+        both = threading.Barrier(2, timeout=5)
+
+        def read():
+            with lock.read:
+                both.wait()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        read()
+        thread.join()
+
+    def test_writer_waits(self):
+        lock = ReadWriteLock()
+        events = []
+
+        def write():
+            with lock.write:
+                events.append('write')
+
+        with lock.read:
+            thread = threading.Thread(target=write)
+            thread.start()
+            thread.join(0.05)
+            events.append('read')
+
+        thread.join()
+        self.assertEqual(events, ['read', 'write'])
+
+
+class TestSynchronizedStore(unittest.TestCase):
+    GROUP_SIZE = 10
+
+    def setUp(self):
+        self.interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.interval)
+        Measure.objects.all().delete()
+
+    def test_store_class(self):
+        self.assertIsInstance(Measure.objects.store, SynchronizedStore)
+        self.assertNotIsInstance(Item.objects.store, SynchronizedStore)
+
+    def test_concurrent_changes(self):
+        errors = []
+        done = threading.Event()
+
+        def write(writer):
+            try:
+                for n in range(100):
+                    group = (writer, n)
+
+                    with atomic(Measure):
+                        for i in range(self.GROUP_SIZE):
+                            Measure(group=group, value=i)
+
+                    for measure in Measure.objects.filter(group=group):
+                        measure.value += self.GROUP_SIZE
+
+                    if n % 2:
+                        Measure.objects.filter(group=(writer, n - 1)).delete()
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                while not done.is_set():
+                    measures = list(Measure.objects.filter(value__gte=0))
+                    groups = {}
+
+                    for measure in measures:
+                        groups[measure.group] = groups.get(measure.group, 0) + 1
+
+                    # Groups are created and deleted as a whole
+                    if len(set(map(id, measures))) != len(measures) or \
+                            set(groups.values()) - {self.GROUP_SIZE}:
+                        raise AssertionError(groups)
+
+                    for group in list(groups)[:5]:
+                        Measure.objects.filter(group=group).count()
+                        Measure.objects.filter(group=group).order_by('value').first()
+            except Exception as e:
+                errors.append(e)
+
+        writers = [threading.Thread(target=write, args=(i,)) for i in range(2)]
+        readers = [threading.Thread(target=read) for _ in range(4)]
+
+        for thread in writers + readers:
+            thread.start()
+
+        for thread in writers:
+            thread.join()
+
+        done.set()
+
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Measure.objects.count(), 100 * self.GROUP_SIZE)
+        self.assertEqual(
+            len(Measure.objects.filter(value__gte=self.GROUP_SIZE)),
+            100 * self.GROUP_SIZE
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from reobject.models import Model, Field
+
+
+class Account(Model):
+    owner = Field()
+    balance = Field(default=0, index=True)
+
+
+class TestTracking(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        self.store.subscribe(self.listener)
+
+    def tearDown(self):
+        self.store.unsubscribe(self.listener)
+        Account.objects.all().delete()
+
+    @property
+    def store(self):
+        return Account.objects.store
+
+    def listener(self, event, obj, field, old):
+        self.events.append((event, obj.owner, field, old))
+
+    def test_updated(self):
+        account = Account(owner='ann')
+        created = account.created
+        other = Account(owner='bob')
+
+        self.assertEqual(account.updated, created)
+
+        account.balance = 10
+
+        self.assertEqual(account.created, created)
+        self.assertGreater(account.updated, created)
+        self.assertIs(Account.objects.latest('updated'), account)
+        self.assertIs(Account.objects.latest(), other)
+
+    def test_dirty_fields(self):
+        account = Account(owner='ann')
+
+        self.assertEqual(account.dirty_fields, frozenset())
+
+        account.balance = 10
+        account.owner = 'bob'
+
+        self.assertEqual(account.dirty_fields, {'balance', 'owner'})
+
+        account.mark_clean()
+
+        self.assertEqual(account.dirty_fields, frozenset())
+
+        account.balance = 20
+        account.delete()
+
+        self.assertNotIn(account.pk, self.store.dirty)
+
+    def test_events(self):
+        account = Account(owner='ann', balance=5)
+        account.balance = 10
+        account.delete()
+
+        self.assertEqual(self.events, [
+            ('add', 'ann', None, None),
+            ('change', 'ann', 'balance', 5),
+            ('remove', 'ann', None, None),
+        ])
+
+    def test_untracked(self):
+        account = Account(owner='ann')
+        updated = account.updated
+
+        with Account.objects.untracked():
+            account.balance = 10
+            Account.objects.bulk_create([('bob',), ('eve',)])
+
+        self.assertEqual(account.updated, updated)
+        self.assertEqual(account.dirty_fields, frozenset())
+        self.assertEqual(self.events, [('add', 'ann', None, None)])
+        self.assertIs(Account.objects.get(balance=10), account)
+        self.assertEqual(Account.objects.count(), 3)
+        self.assertTrue(self.store.tracking)
+
+    def test_failed_init(self):
+        with self.assertRaises(TypeError):
+            Account(balance=10)
+
+        self.assertEqual(Account.objects.count(), 0)
+        self.assertEqual(self.events, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
+import threading
 import unittest
 
-from reobject import Transaction, transactional
+from reobject import Transaction, atomic, transactional
 from reobject.models import Model, Field
 
 
@@ -13,6 +14,19 @@ class Number(Model):
         self.value += 1  # should rollback
 
 
+class Counter(Model, slots=True):
+    value = Field(index=True)
+
+
+class Tally(Model, threadsafe=True):
+    value = Field()
+
+
+class Ledger(Model):
+    name = Field()
+    entries = Field(default=list)
+
+
 class TestTransaction(unittest.TestCase):
     def setUp(self):
         self.num = Number(value=-1)
@@ -39,6 +53,265 @@ class TestTransaction(unittest.TestCase):
         except TypeError:
             self.assertEqual(self.num.value, -1)
 
+    def test_slotted_model(self):
+        counter = Counter(value=1)
+
+        with self.assertRaises(TypeError):
+            with Transaction(counter):
+                counter.value = 2
+                counter.value += 'a'
+
+        self.assertEqual(counter.value, 1)
+        self.assertIs(Counter.objects.get(value=1), counter)
+        counter.delete()
+
+    def test_untouched_fields(self):
+        ledger = Ledger(name='cash')
+        entries = ledger.entries
+        updated = ledger.updated
+
+        with self.assertRaises(TypeError):
+            with Transaction(ledger):
+                ledger.name = 'bank'
+                ledger.name += 1
+
+        self.assertEqual(ledger.name, 'cash')
+        self.assertIs(ledger.entries, entries)
+        self.assertEqual(ledger.updated, updated)
+        self.assertEqual(ledger.dirty_fields, frozenset())
+        ledger.delete()
+
+    def test_multiple_objects(self):
+        counter = Counter(value=1)
+        other = Number(value=2)
+
+        with self.assertRaises(ValueError):
+            with Transaction(self.num, counter, other):
+                self.num.value = 10
+                counter.value = 20
+                other.value = 30
+                raise ValueError
+
+        self.assertEqual([self.num.value, counter.value, other.value], [-1, 1, 2])
+        self.assertIs(Counter.objects.get(value=1), counter)
+
+        with Transaction(self.num, counter):
+            self.num.value = 10
+            counter.value = 20
+
+        self.assertEqual([self.num.value, counter.value], [10, 20])
+        counter.delete()
+
+    def test_nested(self):
+        with self.assertRaises(KeyError):
+            with Transaction(self.num):
+                self.num.value = 1
+
+                with self.assertRaises(ValueError):
+                    with Transaction(self.num):
+                        self.num.value = 2
+                        raise ValueError
+
+                self.assertEqual(self.num.value, 1)
+
+                with Transaction(self.num):
+                    self.num.value = 3
+
+                raise KeyError
+
+        self.assertEqual(self.num.value, -1)
+
+    def test_savepoints(self):
+        with Transaction(self.num) as transaction:
+            self.num.value = 1
+            first = transaction.savepoint()
+            self.num.value = 2
+            self.num.value = 3
+            second = transaction.savepoint()
+            self.num.value = 4
+
+            transaction.rollback(second)
+            self.assertEqual(self.num.value, 3)
+
+            transaction.rollback(first)
+            self.assertEqual(self.num.value, 1)
+
+            with self.assertRaises(ValueError):
+                transaction.rollback(second)
+
+            self.num.value = 5
+            transaction.rollback()
+            self.assertEqual(self.num.value, -1)
+
+            self.num.value = 6
+
+        self.assertEqual(self.num.value, 6)
+
+    def test_other_attributes(self):
+        self.num.note = 'orig'
+
+        with self.assertRaises(ValueError):
+            with Transaction(self.num):
+                self.num.note = 'changed'
+                self.num.extra = True
+                raise ValueError
+
+        self.assertEqual(self.num.note, 'orig')
+        self.assertFalse(hasattr(self.num, 'extra'))
+
+    def test_untracked(self):
+        with self.assertRaises(ValueError):
+            with Number.objects.untracked(), Transaction(self.num):
+                self.num.value = 99
+                raise ValueError
+
+        self.assertEqual(self.num.value, -1)
+
+    def test_deleted_object(self):
+        self.num.delete()
+
+        with self.assertRaises(ValueError):
+            with Transaction(self.num):
+                self.num.value = 99
+                raise ValueError
+
+        self.assertEqual(self.num.value, -1)
+
+    def test_other_objects(self):
+        class Account(object):
+            def __init__(self):
+                self.balance = 10
+                self.history = []
+
+        account = Account()
+
+        with self.assertRaises(ValueError):
+            with Transaction(account, self.num) as transaction:
+                account.balance = 20
+                account.history.append(20)
+                self.num.value = 1
+                transaction.savepoint()
+                account.balance = 30
+                transaction.rollback(1)
+                self.assertEqual(account.balance, 20)
+                raise ValueError
+
+        self.assertEqual((account.balance, account.history), (10, []))
+        self.assertEqual(self.num.value, -1)
+
+
+class TestAtomic(unittest.TestCase):
+    def setUp(self):
+        self.numbers = [Number(value=n) for n in range(3)]
+
+    def tearDown(self):
+        Number.objects.all().delete()
+        Counter.objects.all().delete()
+        Tally.objects.all().delete()
+
+    def values(self):
+        return sorted(Number.objects.all().values_list('value', flat=True))
+
+    def test_commit(self):
+        events = []
+        Number.objects.store.subscribe(lambda event, *args: events.append(event))
+
+        with atomic(Number, Counter):
+            Number(value=10)
+            counter = Counter(value=5)
+            self.numbers[0].delete()
+            Number.objects.filter(value=2).delete()
+
+            # Nothing is applied before the block exits
+            self.assertEqual(self.values(), [0, 1, 2])
+            self.assertEqual(Counter.objects.count(), 0)
+
+        self.assertEqual(self.values(), [1, 10])
+        self.assertIs(Counter.objects.get(value=5), counter)
+        self.assertEqual(sorted(events), ['add', 'remove', 'remove'])
+
+    def test_rollback(self):
+        with self.assertRaises(KeyError):
+            with atomic(Number):
+                Number(value=10)
+                self.numbers[0].delete()
+                self.numbers[1].value = 11
+                raise KeyError
+
+        self.assertEqual(self.values(), [0, 1, 2])
+        self.assertIs(Number.objects.get(value=1), self.numbers[1])
+
+    def test_pending_objects(self):
+        with atomic(Number):
+            number = Number(value=10)
+            number.value = 20
+            number.delete()
+
+            self.numbers[0].delete()
+            Number.objects.store.append(self.numbers[0])
+
+            with self.assertRaises(ValueError):
+                number.delete()
+
+            Counter(value=1)
+
+        self.assertEqual(self.values(), [0, 1, 2])
+        self.assertEqual(Counter.objects.count(), 1)
+
+    def test_nested(self):
+        with atomic(Number):
+            Number(value=10)
+
+            with self.assertRaises(KeyError):
+                with atomic(Number):
+                    Number(value=20)
+                    self.numbers[0].delete()
+                    raise KeyError
+
+            with atomic(Number):
+                self.numbers[1].delete()
+
+            self.assertEqual(self.values(), [0, 1, 2])
+
+        self.assertEqual(self.values(), [0, 2, 10])
+
+    def test_bulk_create(self):
+        with atomic(Counter):
+            Counter.objects.bulk_create((n,) for n in range(50))
+
+            for n in range(50, 100):
+                Counter(value=n)
+
+        self.assertEqual(Counter.objects.filter(value__gte=90).count(), 10)
+        self.assertEqual(len(Counter.objects.store.indexes['value'][0]), 100)
+
+    def test_failed_commit(self):
+        def listener(event, *args):
+            raise RuntimeError(event)
+
+        store = Number.objects.store
+        store.subscribe(listener)
+
+        try:
+            with self.assertRaises(RuntimeError):
+                # Number is applied first, then Tally is dropped
+                with atomic(Tally, Number):
+                    Number(value=10)
+                    Tally(value=1)
+        finally:
+            store.unsubscribe(listener)
+
+        self.assertEqual(Tally.objects.count(), 0)
+        self.assertEqual(Tally.objects.store._batches, [])
+
+        # The lock of Tally was released
+        thread = threading.Thread(target=Tally, kwargs={'value': 2})
+        thread.start()
+        thread.join(timeout=5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(Tally.objects.count(), 1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,239 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from reobject.models import Model, Field
+from reobject.models.fields import ForeignKey
+from reobject.models.store import Store
+from reobject.transaction import atomic
+from reobject.wal import LogError, WriteAheadLog
+
+
+class Writer(Model):
+    name = Field(index='hash')
+
+
+class Essay(Model):
+    title = Field(index='hash')
+    writer = ForeignKey(Writer)
+    words = Field(default=0, column=True, index='sorted')
+
+
+class TestWriteAheadLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'log')
+        self.snapshot = os.path.join(self.directory, 'snapshot')
+        self.log = self.open()
+
+    def tearDown(self):
+        self.log.close()
+        self.wipe()
+        shutil.rmtree(self.directory)
+
+    def open(self, fsync='always') -> WriteAheadLog:
+        log = WriteAheadLog(self.path, snapshot=self.snapshot, fsync=fsync)
+        log.recover()
+        return log
+
+    @staticmethod
+    def wipe() -> None:
+        Essay.objects.all().delete()
+        Writer.objects.all().delete()
+
+    @staticmethod
+    def state() -> list:
+        return [
+            (essay.title, essay.writer.name, essay.words, essay.updated)
+            for essay in Essay.objects.all()
+        ]
+
+    def restart(self, fsync='always') -> None:
+        """
+        Stops logging, empties the stores and recovers them from the log.
+        """
+        self.log.close()
+        self.wipe()
+        self.log = self.open(fsync)
+
+    def populate(self) -> None:
+        ann, bob = Writer(name='ann'), Writer(name='bob')
+
+        for n in range(20):
+            Essay(title='e{}'.format(n), writer=ann if n % 2 else bob, words=n)
+
+    def test_replay(self):
+        self.populate()
+        Essay.objects.filter(words__lt=5).delete()
+        essay = Essay.objects.get(title='e7')
+        essay.words = 700
+        essay.writer = Writer(name='cid')
+        Essay.objects.bulk_create([
+            ('f{}'.format(n), Writer.objects.get(name='ann'), n)
+            for n in range(3)
+        ])
+        expected = self.state()
+        self.restart()
+
+        self.assertEqual(self.state(), expected)
+        self.assertEqual(Writer.objects.count(), 3)
+        self.assertEqual(Essay.objects.order_by('-words').first().title, 'e7')
+
+        # References are loaded as references to the same objects
+        ann = Writer.objects.get(name='ann')
+        self.assertEqual(len(ann.essay_set.all()), 10)
+
+    def test_logging_resumes_after_replay(self):
+        self.populate()
+        self.restart()
+        Essay.objects.get(title='e3').words = 30
+        Essay(title='g', writer=Writer.objects.first())
+        expected = self.state()
+        self.restart()
+
+        self.assertEqual(self.state(), expected)
+
+    def test_group_commit(self):
+        self.restart(fsync=10000)
+        self.populate()
+        self.log.flush()
+        Essay.objects.get(title='e3').words = 30
+        expected = self.state()
+        self.restart()
+
+        self.assertEqual(self.state(), expected)
+
+    def test_checkpoint(self):
+        self.populate()
+        self.log.checkpoint()
+        size = os.path.getsize(self.path)
+        Essay.objects.get(title='e3').delete()
+        expected = self.state()
+
+        self.assertGreater(os.path.getsize(self.path), size)
+        self.restart()
+        self.assertEqual(self.state(), expected)
+
+    def test_stale_log(self):
+        self.populate()
+        shutil.copy(self.path, self.path + '.old')
+        Essay.objects.get(title='e3').delete()
+        self.log.checkpoint()
+        expected = self.state()
+
+        # A log older than the snapshot doesn't apply to it
+        self.log.close()
+        os.replace(self.path + '.old', self.path)
+        self.restart()
+
+        self.assertEqual(self.state(), expected)
+
+    def test_torn_frame(self):
+        self.populate()
+        expected = self.state()
+        self.log.close()
+
+        with open(self.path, 'ab') as file:
+            file.write(b'\x10\x00\x00\x00torn')
+
+        self.restart()
+        self.assertEqual(self.state(), expected)
+
+        Essay(title='h', writer=Writer.objects.first())
+        self.restart()
+        self.assertEqual(Essay.objects.count(), 21)
+
+    def test_discarded_batch(self):
+        self.populate()
+        expected = self.state()
+
+        with self.assertRaises(ZeroDivisionError):
+            with atomic(Essay):
+                Essay(title='lost', writer=Writer.objects.first())
+                Essay.objects.get(title='e1').words = 100
+                1 / 0
+
+        self.restart()
+        self.assertEqual(self.state(), expected)
+
+    def test_single_journal(self):
+        self.assertIs(Store.journal, self.log)
+
+        with self.assertRaises(RuntimeError):
+            WriteAheadLog(self.path + '2').recover()
+
+        with self.assertRaises(ValueError):
+            WriteAheadLog(self.path, fsync='sometimes')
+
+    def test_attributes_not_logged(self):
+        self.populate()
+        essay = Essay.objects.get(title='e3')
+        essay.handler = lambda: None
+        essay.words = 30
+        expected = self.state()
+        self.restart()
+
+        self.assertEqual(self.state(), expected)
+        self.assertFalse(hasattr(Essay.objects.get(title='e3'), 'handler'))
+
+    def test_failed_flush(self):
+        self.restart(fsync=10000)
+        self.populate()
+        writer = Writer.objects.first()
+        writer.name = lambda: None
+
+        with self.assertRaises(LogError):
+            self.log.flush()
+
+        # The changes are kept, but no more are logged
+        self.assertEqual(len(self.log._records), 24)
+
+        # Further changes are refused before they're made
+        count = Essay.objects.count()
+        essay = Essay.objects.first()
+        words = essay.words
+
+        with self.assertRaises(LogError):
+            Essay(title='lost', writer=writer)
+
+        with self.assertRaises(LogError):
+            essay.words = -1
+
+        with self.assertRaises(LogError):
+            essay.delete()
+
+        self.assertEqual(Essay.objects.count(), count)
+        self.assertEqual(essay.words, words)
+        self.assertFalse(Essay.objects.filter(words=-1).exists())
+
+        with self.assertRaises(LogError):
+            self.log.close()
+
+        self.wipe()
+        self.log = self.open()
+        self.assertEqual(Essay.objects.count(), 0)
+
+    def test_removed_objects_released(self):
+        self.populate()
+        essay = Essay.objects.get(title='e3')
+        essay.delete()
+
+        self.assertNotIn(id(essay), self.log._positions)
+        self.assertFalse(self.log._retired)
+
+    def test_removed_objects_released_after_replay(self):
+        self.populate()
+        Essay.objects.filter(words__lt=5).delete()
+        self.restart()
+
+        # Only the objects left are numbered, serials go on after the others
+        self.assertEqual(len(self.log._positions), 17)
+        self.assertEqual(self.log._counts['Essay'], 20)
+
+        Essay(title='g', writer=Writer.objects.first())
+        Essay.objects.get(title='e9').words = 90
+        expected = self.state()
+        self.restart()
+
+        self.assertEqual(self.state(), expected)